@@ -0,0 +1,231 @@
+import base64
+import hashlib
+import os
+
+# multicodec codes
+CODEC_RAW = 0x55
+CODEC_DAG_PB = 0x70
+CODEC_SHA2_256 = 0x12
+
+# UnixFS data types
+UNIXFS_DIRECTORY = 1
+UNIXFS_FILE = 2
+
+
+def encode_varint(value: int) -> bytes:
+    buf = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            buf.append(byte | 0x80)
+        else:
+            buf.append(byte)
+            return bytes(buf)
+
+
+def encode_field(number: int, value) -> bytes:
+    """
+    protobuf field, int -> varint, bytes -> length-delimited
+    """
+    if isinstance(value, int):
+        return encode_varint(number << 3) + encode_varint(value)
+    return encode_varint(number << 3 | 2) + encode_varint(len(value)) + value
+
+
+class CID:
+    """
+    CID version 1 with a sha2-256 multihash
+    """
+
+    def __init__(self, codec: int, digest: bytes):
+        self.codec = codec
+        self.digest = digest
+
+    @classmethod
+    def hash(cls, codec: int, data: bytes):
+        return cls(codec, hashlib.sha256(data).digest())
+
+    def to_bytes(self) -> bytes:
+        return encode_varint(1) + encode_varint(self.codec) + \
+            encode_varint(CODEC_SHA2_256) + encode_varint(len(self.digest)) + self.digest
+
+    def __str__(self):
+        # multibase base32, lower case without padding
+        return 'b' + base64.b32encode(self.to_bytes()).decode().lower().rstrip('=')
+
+    def __eq__(self, other):
+        return isinstance(other, CID) and self.to_bytes() == other.to_bytes()
+
+    def __hash__(self):
+        return hash(self.to_bytes())
+
+
+class Block:
+
+    def __init__(self, cid: CID, data: bytes, t_size: int, size: int = 0):
+        """
+        :param cid: CID
+        :param data: bytes, encoded block
+        :param t_size: int, the size of the block and all its descendants
+        :param size: int, the size of file content under the block
+        """
+        self.cid = cid
+        self.data = data
+        self.t_size = t_size
+        self.size = size
+
+
+class UnixFS:
+    """
+    Build a UnixFS DAG from a file or a flat directory:
+        - file content is split into raw leaves of `leaf_size` bytes
+        - leaves are linked by dag-pb nodes with at most `max_links` links (balanced layout)
+        - a directory is a dag-pb node linking its files by name
+    Building is deterministic, the same content always has the same root CID.
+    """
+    leaf_size = 1024 * 1024
+    max_links = 174
+
+    def __init__(self, leaf_size: int = None, max_links: int = None):
+        if leaf_size is not None:
+            self.leaf_size = leaf_size
+        if max_links is not None:
+            self.max_links = max_links
+
+    @staticmethod
+    def encode_node(links: list, data: bytes) -> bytes:
+        """
+        dag-pb node, links go before data in the canonical form
+        :param links: list of (name, CID, t_size)
+        :param data: bytes, UnixFS data
+        """
+        encoded = b''
+        for name, cid, t_size in links:
+            link = encode_field(1, cid.to_bytes())
+            if name is not None:
+                link += encode_field(2, name.encode('utf-8'))
+            link += encode_field(3, t_size)
+            encoded += encode_field(2, link)
+        return encoded + encode_field(1, data)
+
+    @staticmethod
+    def encode_data(_type: int, file_size: int = None, block_sizes: list = None) -> bytes:
+        data = encode_field(1, _type)
+        if file_size is not None:
+            data += encode_field(3, file_size)
+        for size in block_sizes or []:
+            data += encode_field(4, size)
+        return data
+
+    def read_leaves(self, file: str):
+        with open(file, 'rb') as f:
+            data = f.read(self.leaf_size)
+            if not data:
+                # an empty file is a single empty leaf
+                yield b''
+            while data:
+                yield data
+                data = f.read(self.leaf_size)
+
+    def file_blocks(self, file: str):
+        """
+        yield blocks of a file in order: leaves first, then every level of parents, the root is the last one
+        """
+        level = []
+        for data in self.read_leaves(file):
+            block = Block(CID.hash(CODEC_RAW, data), data, len(data), len(data))
+            level.append(Block(block.cid, b'', block.t_size, block.size))
+            yield block
+
+        while len(level) > 1:
+            parents = []
+            for i in range(0, len(level), self.max_links):
+                children = level[i:i + self.max_links]
+                size = sum(child.size for child in children)
+                data = self.encode_node([(None, child.cid, child.t_size) for child in children],
+                                        self.encode_data(UNIXFS_FILE, size, [child.size for child in children]))
+                block = Block(CID.hash(CODEC_DAG_PB, data), data,
+                              len(data) + sum(child.t_size for child in children), size)
+                parents.append(Block(block.cid, b'', block.t_size, block.size))
+                yield block
+            level = parents
+
+    def directory_blocks(self, path: str):
+        """
+        yield blocks of the files in a directory, the directory node is the last one
+        """
+        links = []
+        for name in sorted(os.listdir(path)):
+            f_path = os.path.join(path, name)
+            if not os.path.isfile(f_path):
+                continue
+            block = None
+            for block in self.file_blocks(f_path):
+                yield block
+            links.append((name, block.cid, block.t_size))
+        data = self.encode_node(links, self.encode_data(UNIXFS_DIRECTORY))
+        yield Block(CID.hash(CODEC_DAG_PB, data), data, len(data) + sum(link[2] for link in links))
+
+    def blocks(self, path: str):
+        if os.path.isdir(path):
+            return self.directory_blocks(path)
+        return self.file_blocks(path)
+
+    def get_root(self, path: str) -> CID:
+        block = None
+        for block in self.blocks(path):
+            pass
+        return block.cid
+
+
+class CarWriter:
+    """
+    Split the blocks of a DAG into CAR (v1) files whose size is at most `chunk_size`,
+    every CAR has the same root so that nft.storage can join them.
+    """
+
+    def __init__(self, root: CID, chunk_size: int):
+        self.root = root
+        self.chunk_size = chunk_size
+        self.header = self.encode_header(root)
+
+    @staticmethod
+    def encode_header(root: CID) -> bytes:
+        # dag-cbor {'roots': [root], 'version': 1}, a CID is tag 42 with an identity multibase prefix
+        cid = b'\x00' + root.to_bytes()
+        header = b'\xa2' + b'\x65roots' + b'\x81' + b'\xd8\x2a' + b'\x58' + bytes([len(cid)]) + cid + \
+            b'\x67version' + b'\x01'
+        return encode_varint(len(header)) + header
+
+    @staticmethod
+    def encode_block(block: Block) -> bytes:
+        cid = block.cid.to_bytes()
+        return encode_varint(len(cid) + len(block.data)) + cid + block.data
+
+    def write(self, blocks, directory: str) -> list:
+        """
+        :param blocks: iterable of Block
+        :param directory: str, the directory of CAR files
+        :return: list of str, CAR file paths in order
+        """
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        f = None
+        size = 0
+        try:
+            for block in blocks:
+                encoded = self.encode_block(block)
+                if f is None or (size + len(encoded) > self.chunk_size and size > len(self.header)):
+                    if f is not None:
+                        f.close()
+                    files.append(os.path.join(directory, f'{len(files)}.car'))
+                    f = open(files[-1], 'wb')
+                    f.write(self.header)
+                    size = len(self.header)
+                f.write(encoded)
+                size += len(encoded)
+        finally:
+            if f is not None:
+                f.close()
+        return files
@@ -1,8 +1,14 @@
 from ctypes import *
 import os
+import math
+import struct
+import threading
 import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
 
 
 class GoString(Structure):
@@ -19,10 +25,43 @@ class EncryptionHandler:
 
 
 class HomomorphicEncryptionHandler(EncryptionHandler):
+    """
+    Wrapper of the homomorphic encryption library, loaded once per process on first use (not before fork)
+    """
     BASE_DIR = Path(__file__).resolve().parent.parent
+    LIB_FILE = os.path.join(BASE_DIR, 'libs/homomorphic_encryption.so')
+    # function name -> (argtypes, restype)
+    SIGNATURES = {
+        'GenSK': ([GoString], None),
+        'GenPK': ([GoString, GoString], None),
+        'GenDict': ([GoString, GoString], None),
+        'EncryptImage': ([GoString, GoString, GoString], None),
+        'DecryptImage': ([GoString, GoString, GoString], None),
+        'AddBWM': ([GoString, GoString, GoString], None),
+        'AddSign': ([GoString, GoString], None),
+        'VerifySign': ([GoString, GoString], c_bool),
+        'ViewBWM': ([GoString, GoString], None),
+    }
+    workers = int(os.getenv('HE_WORKERS') or os.cpu_count() or 1)
+
+    _lib = None
+    _lock = threading.Lock()
 
     def __init__(self):
-        self.he = cdll.LoadLibrary(os.path.join(self.BASE_DIR, 'libs/homomorphic_encryption.so'))
+        self.he = self.get_library()
+
+    @classmethod
+    def get_library(cls) -> CDLL:
+        if cls._lib is None:
+            with cls._lock:
+                if cls._lib is None:
+                    lib = cdll.LoadLibrary(cls.LIB_FILE)
+                    for name, (argtypes, restype) in cls.SIGNATURES.items():
+                        func = getattr(lib, name)
+                        func.argtypes = argtypes
+                        func.restype = restype
+                    cls._lib = lib
+        return cls._lib
 
     def __check_file(self, path: str):
         # make dir
@@ -59,7 +98,6 @@ class HomomorphicEncryptionHandler(EncryptionHandler):
         print(f'file -> {file}')
         func_gen_sk = self.he.GenSK
         _file = self.to_go_string(file)
-        func_gen_sk.argtypes = [GoString]
         func_gen_sk(_file)
 
     def generate_public_key(self, file: str, sk_file: str):
@@ -73,7 +111,6 @@ class HomomorphicEncryptionHandler(EncryptionHandler):
         func_gen_pk = self.he.GenPK
         _sk_file = self.to_go_string(sk_file)
         _file = self.to_go_string(file)
-        func_gen_pk.argtypes = [GoString, GoString]
         func_gen_pk(_sk_file, _file)
 
     def generate_key_dict(self, file: str, sk_file: str):
@@ -87,7 +124,6 @@ class HomomorphicEncryptionHandler(EncryptionHandler):
         func_gen_dict = self.he.GenDict
         _sk_file = self.to_go_string(sk_file)
         _file = self.to_go_string(file)
-        func_gen_dict.argtypes = [GoString, GoString]
         func_gen_dict(_sk_file, _file)
 
     def encrypt(self, sk_file: str, org_img: str, enc_img: str):
@@ -104,7 +140,6 @@ class HomomorphicEncryptionHandler(EncryptionHandler):
         _org_img = self.to_go_string(org_img)
         _enc_img = self.to_go_string(enc_img)
         func_encrypt_img = self.he.EncryptImage
-        func_encrypt_img.argtypes = [GoString, GoString, GoString]
         func_encrypt_img(_sk_file, _org_img, _enc_img)
 
     def add_sign(self, sk_file: str, org_img: str):
@@ -118,7 +153,6 @@ class HomomorphicEncryptionHandler(EncryptionHandler):
         _sk_file = self.to_go_string(sk_file)
         _org_img = self.to_go_string(org_img)
         func_add_sign = self.he.AddSign
-        func_add_sign.argtypes = [GoString, GoString]
         func_add_sign(_org_img, _sk_file)
 
     def add_bwm(self, org_img: str, enc_img: str):
@@ -133,7 +167,6 @@ class HomomorphicEncryptionHandler(EncryptionHandler):
         _bwm_img = self.to_go_string(self.get_watermark_img())
         _enc_img = self.to_go_string(enc_img)
         func_add_bwm = self.he.AddBWM
-        func_add_bwm.argtypes = [GoString, GoString, GoString]
         func_add_bwm(_org_img, _bwm_img, _enc_img)
 
     def decrypt(self, sk_file: str, enc_img: str, dec_img: str):
@@ -149,7 +182,6 @@ class HomomorphicEncryptionHandler(EncryptionHandler):
         _enc_img = self.to_go_string(enc_img)
         _dec_img = self.to_go_string(dec_img)
         func_decrypt_img = self.he.DecryptImage
-        func_decrypt_img.argtypes = [GoString, GoString, GoString]
         func_decrypt_img(_sk_file, _enc_img, _dec_img)
 
     def verify_sign(self, img_file: str, dict_file: str) -> bool:
@@ -163,8 +195,6 @@ class HomomorphicEncryptionHandler(EncryptionHandler):
         _img_file = self.to_go_string(img_file)
         _dict_file = self.to_go_string(dict_file)
         func_verify_sign = self.he.VerifySign
-        func_verify_sign.argtypes = [GoString, GoString]
-        func_verify_sign.restype = c_bool
         return func_verify_sign(_img_file, _dict_file)
 
     def view_bwm(self, img_file: str, bwm_img: str):
@@ -178,12 +208,57 @@ class HomomorphicEncryptionHandler(EncryptionHandler):
         _img_file = self.to_go_string(img_file)
         _bwm_img = self.to_go_string(bwm_img)
         func_view_bwm = self.he.ViewBWM
-        func_view_bwm.argtypes = [GoString, GoString]
         func_view_bwm(_img_file, _bwm_img)
 
+    def encrypt_image(self, sk_file: str, org_img: str) -> str:
+        """
+        Add blind watermark and signature to an image, then encrypt it
+        :param sk_file: str, private key file
+        :param org_img: str, original image file
+        :return: str, encrypted image file
+        """
+        self.add_bwm(org_img, org_img)
+        self.add_sign(sk_file, org_img)
+        enc_img = f'{org_img}.sse'
+        self.encrypt(sk_file, org_img, enc_img)
+        return enc_img
+
+    def encrypt_images(self, sk_file: str, images: list, workers: int = None) -> list:
+        """
+        Encrypt a batch of images by `encrypt_image` in a thread pool
+        :param sk_file: str, private key file
+        :param images: list, original image files
+        :param workers: int, the number of threads, default HE_WORKERS
+        :return: list, encrypted image files in the order of images
+        """
+        workers = min(workers or self.workers, len(images))
+        if workers <= 1:
+            return [self.encrypt_image(sk_file, img) for img in images]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(lambda img: self.encrypt_image(sk_file, img), images))
+
 
 class AESHandler(EncryptionHandler):
-    chunk_size = 1024
+    """
+    AES-GCM in authenticated frames, the legacy files of 1 KiB EAX chunks are still readable
+    """
+    chunk_size = 1024  # legacy layout
+    frame_size = 1024 * 1024
+    workers = int(os.getenv('AES_WORKERS', 1))
+
+    MAGIC = b'DBKF'
+    VERSION = 1
+    # magic, version, frame size, frame count, plaintext size; a frame is nonce + tag + ciphertext
+    HEADER = struct.Struct('>4sBIQQ')
+    INDEX = struct.Struct('>Q')
+    NONCE_SIZE = 12
+    TAG_SIZE = 16
+
+    def __init__(self, frame_size: int = None, workers: int = None):
+        if frame_size is not None:
+            self.frame_size = frame_size
+        if workers is not None:
+            self.workers = workers
 
     def encrypt(self, key: bytes, text: bytes) -> tuple:
         cipher = AES.new(key, AES.MODE_EAX)
@@ -195,25 +270,149 @@ class AESHandler(EncryptionHandler):
         text = cipher.decrypt_and_verify(ciphertext, tag)
         return text
 
+    def pack_header(self, size: int) -> bytes:
+        n_frames = math.ceil(size / self.frame_size)
+        return self.HEADER.pack(self.MAGIC, self.VERSION, self.frame_size, n_frames, size)
+
+    def read_header(self, f_in) -> [tuple, None]:
+        """
+        :param f_in: file object opened in binary mode, positioned at the beginning
+        :return: tuple, (header bytes, frame size, frame count, plaintext size),
+                 or None if the file uses the legacy layout, then the file is rewound
+        """
+        header = self.parse_header(f_in.read(self.HEADER.size))
+        if header is None:
+            f_in.seek(0)
+        return header
+
+    def parse_header(self, header: bytes) -> [tuple, None]:
+        """
+        :param header: bytes, the first bytes of a file
+        :return: the same as read_header
+        """
+        if len(header) == self.HEADER.size:
+            magic, version, frame_size, n_frames, size = self.HEADER.unpack(header)
+            if magic == self.MAGIC:
+                if version != self.VERSION:
+                    raise ValueError(f'Unsupported container version {version}')
+                return header, frame_size, n_frames, size
+        return None
+
+    def encrypt_frame(self, key: bytes, header: bytes, index: int, text: bytes) -> bytes:
+        cipher = AES.new(key, AES.MODE_GCM, nonce=get_random_bytes(self.NONCE_SIZE))
+        cipher.update(header + self.INDEX.pack(index))
+        ciphertext, tag = cipher.encrypt_and_digest(text)
+        return cipher.nonce + tag + ciphertext
+
+    def decrypt_frame(self, key: bytes, header: bytes, index: int, frame: bytes) -> bytes:
+        nonce = frame[:self.NONCE_SIZE]
+        tag = frame[self.NONCE_SIZE:self.NONCE_SIZE + self.TAG_SIZE]
+        cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+        cipher.update(header + self.INDEX.pack(index))
+        return cipher.decrypt_and_verify(frame[self.NONCE_SIZE + self.TAG_SIZE:], tag)
+
+    def map_frames(self, func, frames):
+        """
+        Apply func to every (index, frame) and yield the results in order.
+        At most 2 * workers frames are held in memory.
+        """
+        if self.workers <= 1:
+            for index, frame in frames:
+                yield func(index, frame)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = deque()
+            for index, frame in frames:
+                futures.append(executor.submit(func, index, frame))
+                if len(futures) >= 2 * self.workers:
+                    yield futures.popleft().result()
+            while futures:
+                yield futures.popleft().result()
+
     def encrypt_file(self, key: bytes, file: str):
         cipher_file = f'{file}.bin'
+        header = self.pack_header(os.path.getsize(file))
+
+        def read_frames(f_in):
+            index = 0
+            text = f_in.read(self.frame_size)
+            while text:
+                yield index, text
+                index += 1
+                text = f_in.read(self.frame_size)
+
         with open(cipher_file, 'wb') as f_out:
             with open(file, 'rb') as f_in:
-                text = f_in.read(self.chunk_size)
-                while text:
-                    for item in self.encrypt(key, text):
-                        f_out.write(item)
-                    text = f_in.read(self.chunk_size)
+                f_out.write(header)
+                for frame in self.map_frames(lambda index, text: self.encrypt_frame(key, header, index, text),
+                                             read_frames(f_in)):
+                    f_out.write(frame)
 
         return cipher_file
 
-    def decrypt_file(self, key: bytes, file: str):
-        decrypted_file = file.rsplit('.', 1)[0]
+    def decrypt_file(self, key: bytes, file: str, decrypted_file: str = None):
+        """
+        :param key: bytes, secret key
+        :param file: str, encrypted file, framed or legacy layout
+        :param decrypted_file: str, output path, default is the encrypted file path without its extension
+        :return: str, the path of decrypted file
+        """
+        if decrypted_file is None:
+            decrypted_file = file.rsplit('.', 1)[0]
         with open(decrypted_file, 'wb') as f_out:
             with open(file, 'rb') as f_in:
-                nonce, tag, ciphertext = [f_in.read(x) for x in (16, 16, self.chunk_size)]
-                while nonce:
-                    text = self.decrypt(key, ciphertext, nonce, tag)
-                    f_out.write(text)
-                    nonce, tag, ciphertext = [f_in.read(x) for x in (16, 16, self.chunk_size)]
+                header = self.read_header(f_in)
+                if header is None:
+                    self._decrypt_legacy_file(key, f_in, f_out)
+                else:
+                    self._decrypt_framed_file(key, f_in, f_out, *header)
         return decrypted_file
+
+    def decrypt_stream(self, key: bytes, f_in, decrypted_file: str):
+        """
+        Decrypt a stream which is not seekable, e.g. a http response, without saving the encrypted file
+        :param key: bytes, secret key
+        :param f_in: readable binary stream, framed or legacy layout
+        :param decrypted_file: str, output path
+        :return: str, the path of decrypted file
+        """
+        prefix = f_in.read(self.HEADER.size)
+        header = self.parse_header(prefix)
+        try:
+            with open(decrypted_file, 'wb') as f_out:
+                if header is None:
+                    self._decrypt_legacy_file(key, f_in, f_out, prefix)
+                else:
+                    self._decrypt_framed_file(key, f_in, f_out, *header)
+        except Exception:
+            os.remove(decrypted_file)
+            raise
+        return decrypted_file
+
+    def _decrypt_framed_file(self, key: bytes, f_in, f_out, header: bytes, frame_size: int, n_frames: int,
+                             size: int):
+        overhead = self.NONCE_SIZE + self.TAG_SIZE
+
+        def read_frames():
+            for index in range(n_frames):
+                yield index, f_in.read(overhead + min(frame_size, size - index * frame_size))
+
+        n_bytes = 0
+        for text in self.map_frames(lambda index, frame: self.decrypt_frame(key, header, index, frame),
+                                    read_frames()):
+            f_out.write(text)
+            n_bytes += len(text)
+        if n_bytes != size or f_in.read(1):
+            raise ValueError('Corrupted file, the size does not match the header')
+
+    def _decrypt_legacy_file(self, key: bytes, f_in, f_out, prefix: bytes = b''):
+        """
+        :param prefix: bytes, the bytes already read from f_in
+        """
+        data = prefix + f_in.read(32 + self.chunk_size - len(prefix))
+        while data:
+            nonce, tag, ciphertext = data[:16], data[16:32], data[32:]
+            text = self.decrypt(key, ciphertext, nonce, tag)
+            f_out.write(text)
+            data = f_in.read(32 + self.chunk_size)
@@ -0,0 +1,33 @@
+import json
+import os
+import redis
+
+
+class TaskEventHandler(object):
+    """
+    Publish the completion of tasks into a redis stream, the server consumes the stream and does not need to poll
+    the results of tasks.
+
+    An event is {task, task_id, status, result}, result is the json of return value or the error.
+    """
+    STREAM = os.getenv('TASK_EVENT_STREAM', 'file-service:task-events')
+    # approximate length of stream, old events are trimmed
+    MAX_LEN = int(os.getenv('TASK_EVENT_MAX_LEN', 10000))
+
+    def __init__(self, conn: redis.Redis = None):
+        self.conn = conn or redis.Redis(host=os.getenv('REDIS_HOST'), port=os.getenv('REDIS_PORT'),
+                                        db=os.getenv('REDIS_DB'))
+
+    def publish(self, task: str, task_id: str, status: str, result) -> str:
+        """
+        :param task: str, task name
+        :param task_id: str, celery task id
+        :param status: str, success or failure
+        :param result: the return value of task, or the error
+        :return: str, event id
+        """
+        if isinstance(result, BaseException):
+            result = f'{type(result).__name__}: {result}'
+        event = {'task': task, 'task_id': task_id, 'status': status, 'result': json.dumps(result)}
+        event_id = self.conn.xadd(self.STREAM, event, maxlen=self.MAX_LEN, approximate=True)
+        return event_id.decode() if isinstance(event_id, bytes) else event_id
@@ -1,101 +1,300 @@
 import os.path
 import os
+import io
+import json
+import shutil
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
 import nft_storage
 from nft_storage.api import nft_storage_api
 import requests
-from requests_toolbelt import MultipartEncoder
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .car_handler import UnixFS, CarWriter
+
+
+class Checkpoint(object):
+    """
+    Indexes of uploaded CAR chunks, saved as json after each chunk is uploaded
+    """
+
+    def __init__(self, path: str, chunk_size: int):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.uploaded = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            # chunks are different if chunk size is changed
+            if data.get('chunk_size') == chunk_size:
+                self.uploaded = set(data.get('uploaded', []))
+
+    def add(self, index: int):
+        with self._lock:
+            self.uploaded.add(index)
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'chunk_size': self.chunk_size, 'uploaded': sorted(self.uploaded)}, f)
+            os.replace(tmp_path, self.path)
+
+
+class ChunkStream(io.RawIOBase):
+    """
+    Readable stream of an iterator of bytes, read(n) returns n bytes unless the end is reached
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buffer = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def _fill(self) -> bool:
+        while not self.buffer:
+            try:
+                self.buffer = memoryview(next(self.chunks))
+            except StopIteration:
+                return False
+        return True
+
+    def readinto(self, b) -> int:
+        if not self._fill():
+            return 0
+        n = min(len(b), len(self.buffer))
+        b[:n] = self.buffer[:n]
+        self.buffer = self.buffer[n:]
+        return n
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            return self.readall()
+        parts = []
+        while size > 0 and self._fill():
+            part = self.buffer[:size]
+            self.buffer = self.buffer[len(part):]
+            parts.append(part)
+            size -= len(part)
+        return b''.join(parts)
+
+    def close(self):
+        if not self.closed and hasattr(self.chunks, 'close'):
+            self.chunks.close()
+        super().close()
 
 
 class NFTStorageHandler(object):
+    """
+    The http session and the api client are shared by all handlers of a process, so connections to
+    nft.storage and its gateway are kept alive. They are rebuilt after fork because a pool must not be
+    shared between celery worker processes.
+    """
     base_api = 'https://api.nft.storage'
 
+    # (connect, read) timeout in seconds
+    timeout = (float(os.getenv('NFT_STORAGE_CONNECT_TIMEOUT', 10)), float(os.getenv('NFT_STORAGE_READ_TIMEOUT', 300)))
+    pool_size = int(os.getenv('NFT_STORAGE_POOL_SIZE', 10))
+    # the limit of upload size is 100MB
+    car_chunk_size = int(os.getenv('NFT_STORAGE_CAR_CHUNK_SIZE', 50 * 1024 * 1024))
+    upload_workers = int(os.getenv('NFT_STORAGE_UPLOAD_WORKERS', 4))
+    range_size = int(os.getenv('NFT_STORAGE_RANGE_SIZE', 4 * 1024 * 1024))
+    download_workers = int(os.getenv('NFT_STORAGE_DOWNLOAD_WORKERS', 4))
+    checkpoint_root = os.path.join(Path(__file__).resolve().parent.parent, 'workspace', 'uploads')
+    # 524 is the timeout of cloudflare in front of nft.storage
+    retry = Retry(total=3, backoff_factor=1, status_forcelist=(500, 502, 503, 504, 524), raise_on_status=False)
+
+    _lock = threading.Lock()
+    _pid = None
+    _session = None
+    _api_client = None
+
     def __init__(self):
         self.access_token = os.getenv('NFT_STORAGE_ACCESS_TOKEN')
         self.configuration = nft_storage.Configuration()
 
+    @classmethod
+    def _check_pid(cls):
+        if cls._pid != os.getpid():
+            cls._pid = os.getpid()
+            cls._session = None
+            cls._api_client = None
+
+    @classmethod
+    def get_session(cls) -> requests.Session:
+        """
+        :return: the pooled http session of current process, only idempotent requests are retried
+        """
+        with cls._lock:
+            cls._check_pid()
+            if cls._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=cls.pool_size, pool_maxsize=cls.pool_size, max_retries=cls.retry)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                cls._session = session
+            return cls._session
+
+    def get_api_client(self):
+        """
+        :return: the api client of current process
+        """
+        cls = self.__class__
+        with cls._lock:
+            cls._check_pid()
+            if cls._api_client is None:
+                self.configuration.access_token = self.access_token
+                self.configuration.retries = self.retry
+                self.configuration.connection_pool_maxsize = self.pool_size
+                cls._api_client = nft_storage.ApiClient(self.configuration)
+            return cls._api_client
+
+    @classmethod
+    def close(cls):
+        with cls._lock:
+            if cls._session is not None:
+                cls._session.close()
+            if cls._api_client is not None:
+                cls._api_client.close()
+            cls._pid = None
+            cls._session = None
+            cls._api_client = None
+
     def store(self, file_path: str):
-        self.configuration.__setattr__('access_token', self.access_token)
-        with nft_storage.ApiClient(self.configuration) as api_client:
-            api = nft_storage_api.NFTStorageAPI(api_client)
+        api = nft_storage_api.NFTStorageAPI(self.get_api_client())
 
-            try:
-                body = open(file_path, 'rb')
+        try:
+            with open(file_path, 'rb') as body:
                 # https://github.com/nftstorage/python-client/issues/1
-                response = api.store(body, _check_return_type=False)
-            except nft_storage.ApiException as e:
-                print(f'Exception when calling NFTStorageAPI->store: {e}')
-                raise
+                response = api.store(body, _check_return_type=False, _request_timeout=self.timeout)
+        except nft_storage.ApiException as e:
+            print(f'Exception when calling NFTStorageAPI->store: {e}')
+            raise
 
-            if not response['ok']:
-                raise RuntimeError('Upload file to nft storage fail')
-            return response['value']['cid']
+        if not response['ok']:
+            raise RuntimeError('Upload file to nft storage fail')
+        return response['value']['cid']
 
-    def bulk_upload(self, dir_path: str, retry: int = 3) -> str:
+    def upload(self, path: str, retry: int = 3) -> str:
         """
-        :param dir_path: str, file directory
-        :param retry: int, the number of retry to upload FOR TIMEOUT ERROR
-        :return:
+        Upload a file or a flat directory as CAR chunks, so that the upload size is not limited to 100MB.
+        Chunks are uploaded concurrently, uploaded chunks are recorded in a checkpoint file, a failed upload
+        can be resumed by uploading the same content again, e.g. by a retry of celery task.
+        :param path: str, file or directory path
+        :param retry: int, the number of retry to upload each chunk
+        :return: str, the root cid
         """
-        print(f'Running bulk_upload, dir_path: {dir_path}, retry: {3 - retry}')
-        if not os.path.isdir(dir_path):
-            raise ValueError('dir_path must be a directory path')
+        unixfs = UnixFS()
+        root = unixfs.get_root(path)
+        work_dir = os.path.join(self.checkpoint_root, str(root))
+        checkpoint = Checkpoint(os.path.join(work_dir, 'checkpoint.json'), self.car_chunk_size)
+        print(f'Running upload, path: {path}, root: {root}, uploaded chunks: {len(checkpoint.uploaded)}')
 
         try:
-            fields = []
-            for root, dirs, files in os.walk(dir_path):
-                for file_name in sorted(files):
-                    f_path = os.path.join(root, file_name)
-                    fields.append(('file', (file_name, open(f_path, 'rb'), 'application/octet-stream')))
-            # the limit of upload size 100MB
-            me = MultipartEncoder(fields=fields)
-            headers = {
-                'Content-Type': me.content_type,
-                'authorization': f"Bearer {self.access_token}"
-            }
-            print(f'Ready to upload, request body size: {me.len/1024/1024}Mb')
-            res = requests.post(f'{self.base_api}/upload', data=me, headers=headers)
+            car_files = CarWriter(root, self.car_chunk_size).write(unixfs.blocks(path), work_dir)
+            pending = [(i, f) for i, f in enumerate(car_files) if i not in checkpoint.uploaded]
+            if pending:
+                with ThreadPoolExecutor(max_workers=min(self.upload_workers, len(pending))) as executor:
+                    futures = {executor.submit(self.upload_car, f, str(root), retry): i for i, f in pending}
+                    errors = []
+                    for future in as_completed(futures):
+                        try:
+                            future.result()
+                        except Exception as e:
+                            errors.append(e)
+                        else:
+                            checkpoint.add(futures[future])
+                if errors:
+                    raise errors[0]
         except Exception as e:
-            print(f'Exception when calling NFTStorageAPI->bulk_upload: {e}')
+            print(f'Exception when calling NFTStorageAPI->upload: {e}')
+            # remove car files but keep the checkpoint for resuming
+            for f_name in os.listdir(work_dir) if os.path.isdir(work_dir) else []:
+                if f_name.endswith('.car'):
+                    os.remove(os.path.join(work_dir, f_name))
             raise
 
-        data = res.json()
-        if not data['ok']:
-            print(f"Error Response when calling NFTStorageAPI->bulk_upload -> {data['error']}")
-            # if 524 time out, then retry
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return str(root)
+
+    def upload_car(self, car_file: str, root: str, retry: int = 3) -> str:
+        """
+        :param car_file: str, CAR file path
+        :param root: str, the root cid of CAR
+        :param retry: int, the number of retry FOR TIMEOUT ERROR
+        :return:
+        """
+        headers = {
+            'Content-Type': 'application/car',
+            'authorization': f"Bearer {self.access_token}"
+        }
+        for i in range(retry + 1):
+            if i > 0:
+                time.sleep(self.retry.backoff_factor * (2 ** (i - 1)))
+            try:
+                with open(car_file, 'rb') as body:
+                    res = self.get_session().post(f'{self.base_api}/upload', data=body, headers=headers,
+                                                  timeout=self.timeout)
+            except requests.RequestException as e:
+                print(f'Exception when calling NFTStorageAPI->upload_car: {e}, retry: {i}')
+                error = e
+                continue
+
+            try:
+                data = res.json()
+            except ValueError:
+                data = {'ok': False, 'error': {'message': f'status {res.status_code}'}}
+            if data['ok']:
+                if data['value']['cid'] != root:
+                    raise RuntimeError(f"Unexpected cid {data['value']['cid']}, expect {root}")
+                return data['value']['cid']
+
+            print(f"Error Response when calling NFTStorageAPI->upload_car -> {data['error']}")
+            error = RuntimeError(data['error'].get('message', ''))
+            # if 5xx or 524 time out, then retry
             # code is Error means response status is 500
-            if data['error'].get('code') == 'Error' and data['error'].get('message', '').find('524') != -1:
-                if retry > 0:
-                    self.bulk_upload(dir_path, retry - 1)
-            raise RuntimeError(data['error'].get('message', ''))
-        return data['value']['cid']
+            if res.status_code not in self.retry.status_forcelist and data['error'].get('code') != 'Error':
+                break
+        raise error
+
+    def bulk_upload(self, dir_path: str, retry: int = 3) -> str:
+        """
+        :param dir_path: str, file directory
+        :param retry: int, the number of retry to upload FOR TIMEOUT ERROR
+        :return:
+        """
+        if not os.path.isdir(dir_path):
+            raise ValueError('dir_path must be a directory path')
+        return self.upload(dir_path, retry)
 
     def check(self, cid: str):
-        with nft_storage.ApiClient(self.configuration) as api_client:
-            api = nft_storage_api.NFTStorageAPI(api_client)
+        api = nft_storage_api.NFTStorageAPI(self.get_api_client())
 
-            try:
-                response = api.check(cid)
-            except nft_storage.ApiException as e:
-                print(f'Exception when calling NFTStorageAPI->check: {e}')
-                raise
+        try:
+            response = api.check(cid, _request_timeout=self.timeout)
+        except nft_storage.ApiException as e:
+            print(f'Exception when calling NFTStorageAPI->check: {e}')
+            raise
 
-            if not response['ok']:
-                raise RuntimeError('Check file from nft storage fail')
-            return response['value']
+        if not response['ok']:
+            raise RuntimeError('Check file from nft storage fail')
+        return response['value']
 
     def delete(self, cid: str):
-        self.configuration.__setattr__('access_token', self.access_token)
-        with nft_storage.ApiClient(self.configuration) as api_client:
-            api = nft_storage_api.NFTStorageAPI(api_client)
+        api = nft_storage_api.NFTStorageAPI(self.get_api_client())
 
-            try:
-                response = api.delete(cid)
-            except nft_storage.ApiException as e:
-                print(f'Exception when calling NFTStorageAPI->delete: {e}')
-                raise
+        try:
+            response = api.delete(cid, _request_timeout=self.timeout)
+        except nft_storage.ApiException as e:
+            print(f'Exception when calling NFTStorageAPI->delete: {e}')
+            raise
 
-            if not response['ok']:
-                raise RuntimeError('Delete file from nft storage fail')
+        if not response['ok']:
+            raise RuntimeError('Delete file from nft storage fail')
 
     @staticmethod
     def get_nft_url(cid: str):
@@ -123,7 +322,7 @@ class NFTStorageHandler(object):
         }
 
         try:
-            response = requests.get(f'{self.base_api}/{cid}', headers=headers)
+            response = self.get_session().get(f'{self.base_api}/{cid}', headers=headers, timeout=self.timeout)
         except Exception as e:
             print(f'Exception when calling NFTStorageAPI->retrieve: {e}')
             raise
@@ -132,3 +331,62 @@ class NFTStorageHandler(object):
         if not data['ok']:
             raise RuntimeError(data['error']['message'])
         return data['value']
+
+    def get_range(self, url: str, start: int, end: int) -> bytes:
+        """
+        :param url: str
+        :param start: int, the first byte
+        :param end: int, the last byte, inclusive
+        :return: bytes
+        """
+        headers = {'Range': f'bytes={start}-{end}', 'Accept-Encoding': 'identity'}
+        response = self.get_session().get(url, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+        if response.status_code != 206 or len(response.content) != end - start + 1:
+            raise RuntimeError(f'Unexpected response of range {start}-{end}, status: {response.status_code}, '
+                               f'size: {len(response.content)}')
+        return response.content
+
+    def iter_content(self, url: str):
+        """
+        Yield the content of url in order. Ranges of `range_size` are fetched by `download_workers` threads,
+        at most 2 * download_workers ranges are held in memory.
+        The content is streamed by a single request if the server does not support range requests.
+        """
+        headers = {'Range': f'bytes=0-{self.range_size - 1}', 'Accept-Encoding': 'identity'}
+        response = self.get_session().get(url, headers=headers, stream=True, timeout=self.timeout)
+        response.raise_for_status()
+        # Content-Range: bytes 0-4194303/10485760
+        content_range = response.headers.get('Content-Range', '')
+        total = content_range.rsplit('/', 1)[-1]
+        if response.status_code != 206 or not total.isdigit():
+            print(f'Range requests are not supported, url: {url}')
+            yield from response.iter_content(chunk_size=self.range_size)
+            return
+
+        total = int(total)
+        yield response.content
+        ranges = [(start, min(start + self.range_size, total) - 1) for start in range(self.range_size, total,
+                                                                                        self.range_size)]
+        if not ranges:
+            return
+        with ThreadPoolExecutor(max_workers=self.download_workers) as executor:
+            futures = deque()
+            try:
+                for start, end in ranges:
+                    futures.append(executor.submit(self.get_range, url, start, end))
+                    if len(futures) >= 2 * self.download_workers:
+                        yield futures.popleft().result()
+                while futures:
+                    yield futures.popleft().result()
+            finally:
+                # stop fetching if the consumer stops reading
+                for future in futures:
+                    future.cancel()
+
+    def open_url(self, url: str) -> ChunkStream:
+        """
+        :param url: str
+        :return: readable stream of the content of url
+        """
+        return ChunkStream(self.iter_content(url))
@@ -1,5 +1,9 @@
 import fitz
+import hashlib
 import os
+import sys
+import json
+import subprocess
 import shutil
 from io import BytesIO
 from .nft_storage_handler import NFTStorageHandler
@@ -8,7 +12,6 @@ import zipfile
 from pathlib import Path
 import uuid
 import math
-import requests
 from Crypto.Random import get_random_bytes
 
 
@@ -68,44 +71,104 @@ class FileHandler(object):
             if os.path.exists(path):
                 os.remove(path)
 
+    @classmethod
+    def hash_file(cls, path: str) -> str:
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
     def upload(self, path: str) -> dict:
         aes_handler = AESHandler()
-        key = get_random_bytes(32)
-        # encrypt file
-        encrypted_file = aes_handler.encrypt_file(key, path)
+        encrypted_file = f'{path}.bin'
+        key_file = f'{path}.key'
+        if os.path.exists(encrypted_file) and os.path.exists(key_file):
+            # resume a failed upload, the same encrypted file has the same cid, so uploaded chunks are skipped
+            with open(key_file, 'rb') as f:
+                encrypted_key = f.read().decode('latin')
+        else:
+            key = get_random_bytes(32)
+            # encrypt file
+            encrypted_file = aes_handler.encrypt_file(key, path)
+            # encrypt key
+            encrypted_key = self.encrypt_key(key)
+            with open(key_file, 'wb') as f:
+                f.write(encrypted_key.encode('latin'))
         # upload file
-        cid = NFTStorageHandler().store(encrypted_file)
-        # encrypt key
-        nonce, tag, ciphertext = aes_handler.encrypt(self.KEY, key)
-        encrypted_key = nonce + tag + ciphertext
-        return {'cid': cid, 'key': encrypted_key.decode('latin')}
+        cid = NFTStorageHandler().upload(encrypted_file)
+        self.remove(key_file)
+        return {'cid': cid, 'key': encrypted_key}
 
-    def download(self, path: str, cid: str, key: str) -> str:
-        aes_handler = AESHandler()
-        # decrypt key
+    def encrypt_key(self, key: bytes) -> str:
+        nonce, tag, ciphertext = AESHandler().encrypt(self.KEY, key)
+        return (nonce + tag + ciphertext).decode('latin')
+
+    def decrypt_key(self, key: str) -> bytes:
         encrypted_key = key.encode('latin')
         nonce = encrypted_key[:16]
         tag = encrypted_key[16:32]
         ciphertext = encrypted_key[32:]
-        decrypted_key = aes_handler.decrypt(self.KEY, ciphertext, nonce, tag)
+        return AESHandler().decrypt(self.KEY, ciphertext, nonce, tag)
+
+    def download(self, path: str, cid: str, key: str, name: str = None) -> str:
+        """
+        download and decrypt a file, the downloaded bytes are decrypted on the fly, no encrypted file is saved
+        :param path: str, the path of encrypted file, the decrypted file is saved without its extension
+        :param cid: str
+        :param key: str, encrypted secret key
+        :param name: str, the file name in the directory of cid, e.g. a page object of a paged book
+        :return: str, the path of decrypted file
+        """
+        aes_handler = AESHandler()
+        # decrypt key
+        decrypted_key = self.decrypt_key(key)
         # download file
         nft_storage_handler = NFTStorageHandler()
         # data = nft_storage_handler.retrieve(cid)
         # url = nft_storage_handler.get_file_url(cid, data['files'][0]['name'])
-        url = nft_storage_handler.get_nft_url(cid)
-        response = requests.get(url)
-        # save content into a file
-        with open(path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=1024):
-                if chunk:
-                    f.write(chunk)
+        url = nft_storage_handler.get_file_url(cid, name) if name else nft_storage_handler.get_nft_url(cid)
         # decrypt file
-        decrypted_file = aes_handler.decrypt_file(decrypted_key, path)
+        with nft_storage_handler.open_url(url) as f_in:
+            decrypted_file = aes_handler.decrypt_stream(decrypted_key, f_in, path.rsplit('.', 1)[0])
         return decrypted_file
 
 
+def render_pages(pdf, start: int, paths: list, zoom: float, img_format: str, quality: int):
+    """
+    :param pdf: fitz document
+    :param start: int, the index of the first page
+    :param paths: list, image path of each page
+    """
+    matrix = fitz.Matrix(zoom, zoom).prerotate(0)
+    for i, path in enumerate(paths, start):
+        # todo if the page already is an image?
+        pixmap = pdf[i].get_pixmap(matrix=matrix, alpha=False)
+        if img_format == 'png':
+            # native png encoder of mupdf, much faster than pillow with optimize
+            pixmap.save(path)
+        else:
+            pixmap.pil_save(path, format=img_format, quality=quality)
+
+
+def render_main(argv: list):
+    """
+    the entry of a rendering process, python -m handlers.pdf_handler <pdf file> <json list of shards>
+    """
+    pdf = fitz.open(argv[0])
+    for shard in json.loads(argv[1]):
+        render_pages(pdf, *shard)
+        print(f'pages {shard[0] + 1}-{shard[0] + len(shard[1])} rendered')
+
+
 class PDFHandler(FileHandler):
     PAGES_PER_DIR = 50
+    # 图片缩放倍数, 2.0 is 144 dpi
+    IMG_ZOOM = float(os.getenv('PDF_IMG_ZOOM', 2.0))
+    IMG_FORMAT = os.getenv('PDF_IMG_FORMAT', 'png')
+    IMG_QUALITY = int(os.getenv('PDF_IMG_QUALITY', 85))
+    IMG_EXTENSIONS = {'png': 'png', 'jpeg': 'jpg', 'webp': 'webp'}
+    RENDER_WORKERS = int(os.getenv('PDF_RENDER_WORKERS') or os.cpu_count() or 1)
     PRIVATE_KEY_DIR = 'private_keys'
     PUBLIC_KEY_DIR = 'public_keys'
     KEY_DICT_DIR = 'key_dicts'
@@ -154,36 +217,139 @@ class PDFHandler(FileHandler):
             img_dirs.append(img_dir_path)
         return img_dirs
 
-    def to_img(self, img_dirs: list):
+    def to_img(self, img_dirs: list, zoom: float = None, dpi: int = None, img_format: str = None,
+               quality: int = None, workers: int = None):
         """
         1, 获取pdf，将pdf转换为image，image存储的文件夹为pdf文件名，每一张image的命名为页码
+        页码区间分配给多个进程渲染，每个进程打开自己的文档，图片路径由页码决定，与完成顺序无关
+        :param img_dirs: list, image directories, PAGES_PER_DIR pages per directory
+        :param zoom: float, 图片缩放倍数, default IMG_ZOOM
+        :param dpi: int, overrides zoom, 72 dpi is zoom 1
+        :param img_format: str, png, jpeg or webp, default IMG_FORMAT
+        :param quality: int, the quality of jpeg and webp, default IMG_QUALITY
+        :param workers: int, the number of processes, default RENDER_WORKERS
         :return: self
         """
-        # 图片缩放 {x*y} 倍
-        zoom = {'x': 2.0, 'y': 2.0}
+        if dpi is not None:
+            zoom = dpi / 72
+        zoom = zoom or self.IMG_ZOOM
+        img_format = (img_format or self.IMG_FORMAT).lower()
+        if img_format not in self.IMG_EXTENSIONS:
+            raise ValueError(f'Unsupported image format {img_format}')
+        quality = quality or self.IMG_QUALITY
+        workers = workers or self.RENDER_WORKERS
+
+        n_pages = self.get_pages()
+        # 需要使用多位数做页码，不然后期排序会出现问题
+        n_digits = len(str(n_pages))
+        paths = [os.path.join(img_dirs[i // self.PAGES_PER_DIR],
+                              f'page-{str(i + 1).zfill(n_digits)}.{self.IMG_EXTENSIONS[img_format]}')
+                 for i in range(n_pages)]
+        # several small shards per process, so that a process with heavy pages does not hold the others
+        shard_size = max(1, math.ceil(n_pages / (workers * 4)))
+        shards = [(start, paths[start:start + shard_size], zoom, img_format, quality)
+                  for start in range(0, n_pages, shard_size)]
+
         try:
-            matrix = fitz.Matrix(zoom['x'], zoom['y']).prerotate(0)
-            n_digits = len(str(self.get_pages()))
-            for i, page in enumerate(self.pdf):
-                # todo if the page already is an image?
-                pixmap = page.get_pixmap(matrix=matrix, alpha=False)
-                # 需要使用多位数做页码，不然后期排序会出现问题
-                current_page = str(i + 1)
-                p_num = '0' * (n_digits - len(current_page)) + current_page
-                img_path = os.path.join(img_dirs[i // self.PAGES_PER_DIR], f'page-{p_num}.png')
-                pixmap.pil_save(img_path, format='png', optimize=True)
-                # # resize image 1024*1024
-                # img = Image.open(img_path)
-                # img = img.resize((1024, 1024), Image.ANTIALIAS)
-                # img.save(img_path)
-                print(f'dir {img_dirs[i // self.PAGES_PER_DIR]}, page {p_num}, '
-                      f'image size: {pixmap.w}*{pixmap.h}*{pixmap.n}/8')
+            if workers <= 1 or len(shards) <= 1:
+                for shard in shards:
+                    render_pages(self.pdf, *shard)
+            else:
+                self._render_in_processes(shards, min(workers, len(shards)))
         except Exception as e:
             print(f'Exception when calling PDFHandler->to_img: {e}')
             raise
 
         return self
 
+    def _render_in_processes(self, shards: list, workers: int):
+        """
+        Every process opens its own document and renders shards[k::workers].
+        Processes are started by subprocess, because a celery worker process is not allowed to have children
+        of multiprocessing.
+        """
+        source = self.pdf.name
+        tmp_file = None
+        if not source or not os.path.isfile(source):
+            tmp_file = os.path.join(self.TMP_ROOT, f'{uuid.uuid4().hex}.pdf')
+            self.pdf.save(tmp_file)
+            source = tmp_file
+        processes = []
+        try:
+            for k in range(workers):
+                cmd = [sys.executable, '-m', 'handlers.pdf_handler', source, json.dumps(shards[k::workers])]
+                processes.append(subprocess.Popen(cmd, cwd=self.BASE_DIR))
+            for process in processes:
+                if process.wait() != 0:
+                    raise RuntimeError(f'Rendering process exited with code {process.returncode}')
+        finally:
+            for process in processes:
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+            if tmp_file:
+                self.remove(tmp_file)
+
+    @staticmethod
+    def get_object_name(index: int) -> str:
+        """
+        :param index: int, the object of index i has pages i * pages_per_object + 1 ~ (i + 1) * pages_per_object
+        :return: str, the file name of page object in the directory of book
+        """
+        return f'{index:05d}.pdf.bin'
+
+    def split(self, out_dir: str, pages_per_object: int) -> list:
+        """
+        split the pdf into small pdfs of pages_per_object pages
+        :param out_dir: str, output directory
+        :param pages_per_object: int
+        :return: list, the paths of page objects in the order of pages
+        """
+        paths = []
+        n_pages = self.get_pages()
+        for index, start in enumerate(range(0, n_pages, pages_per_object)):
+            path = os.path.join(out_dir, self.get_object_name(index).rsplit('.', 1)[0])
+            doc = fitz.open()
+            try:
+                doc.insert_pdf(self.pdf, from_page=start, to_page=min(start + pages_per_object, n_pages) - 1)
+                # drop the objects not used by these pages
+                doc.save(path, garbage=3, deflate=True)
+            finally:
+                doc.close()
+            paths.append(path)
+        return paths
+
+    def upload_pages(self, path: str, pages_per_object: int) -> dict:
+        """
+        paged storage mode, each group of pages is a separately encrypted pdf, so that a reader only downloads the
+        pages around the bookmark. All objects are encrypted with the same key and uploaded as one directory,
+        the object of index i is {cid}/{get_object_name(i)}.
+        :param path: str, pdf file path
+        :param pages_per_object: int, the number of pages of each object, given by the server
+        :return: dict, {cid, key, n_pages, pages_per_object}
+        """
+        pages_dir = f'{path}.pages'
+        key_file = f'{path}.key'
+        if os.path.isdir(pages_dir) and os.path.exists(key_file):
+            # resume a failed upload, the key file is written after all objects are encrypted
+            with open(key_file, 'rb') as f:
+                encrypted_key = f.read().decode('latin')
+        else:
+            self.remove(pages_dir)
+            os.makedirs(pages_dir)
+            key = get_random_bytes(32)
+            aes_handler = AESHandler()
+            for page_file in self.split(pages_dir, pages_per_object):
+                aes_handler.encrypt_file(key, page_file)
+                self.remove(page_file)
+            encrypted_key = self.encrypt_key(key)
+            with open(key_file, 'wb') as f:
+                f.write(encrypted_key.encode('latin'))
+        cid = NFTStorageHandler().upload(pages_dir)
+        self.remove(key_file)
+        self.remove(pages_dir)
+        return {'cid': cid, 'key': encrypted_key, 'n_pages': self.get_pages(), 'pages_per_object': pages_per_object}
+
     def encrypt_img(self, sk_file: str, img_dirs: list):
         """
         调用加密接口对图片进行加密，加密完后存储到filestorage
@@ -196,16 +362,11 @@ class PDFHandler(FileHandler):
         for img_dir in img_dirs:
             print(f"Image directory -> {img_dir}")
             dir_name = img_dir.rsplit('/', 1)[-1]
-            for f in os.listdir(img_dir):
-                org_img = os.path.join(dir_name, f)
-                # add blind watermark
-                enc_handler.add_bwm(org_img, org_img)
-                # add signature
-                enc_handler.add_sign(sk_file, org_img)
-                # encrypt image
-                enc_img = f"{org_img}.sse"
-                enc_handler.encrypt(sk_file, org_img, enc_img)
-                # remove original image
+            files = sorted(os.listdir(img_dir))
+            # add blind watermark and signature, then encrypt, pages are processed in a pool
+            enc_handler.encrypt_images(sk_file, [os.path.join(dir_name, f) for f in files])
+            # remove original images
+            for f in files:
                 self.remove(os.path.join(img_dir, f))
         return self
 
@@ -311,3 +472,7 @@ class PDFHandler(FileHandler):
         for cid in cids:
             urls.extend(self._get_file_urls(cid))
         return urls
+
+
+if __name__ == '__main__':
+    render_main(sys.argv[1:])
@@ -1,5 +1,10 @@
+import logging
+from celery.signals import task_success, task_failure
 from .celery import app
 from handlers.pdf_handler import PDFHandler, FileHandler
+from handlers.event_handler import TaskEventHandler
+
+logger = logging.getLogger(__name__)
 
 
 @app.task(name='upload_file', autoretry_for=(Exception,), retry_backoff=5, retry_kwargs={'max_retries': 3})
@@ -14,6 +19,17 @@ def upload_file(file_path: str) -> dict:
     return res
 
 
+@app.task(name='upload_pages', autoretry_for=(Exception,), retry_backoff=5, retry_kwargs={'max_retries': 3})
+def upload_pages(file_path: str, pages_per_object: int) -> dict:
+    """
+    upload a pdf book into nft.storage in paged storage mode
+    :param file_path: str, pdf file path
+    :param pages_per_object: int, the number of pages of each encrypted object
+    :return: dict, {cid, key, n_pages, pages_per_object}
+    """
+    return PDFHandler(file_path).upload_pages(file_path, pages_per_object)
+
+
 @app.task(name='get_file_urls')
 def get_file_urls(cids: list) -> list:
     """
@@ -25,14 +41,43 @@ def get_file_urls(cids: list) -> list:
 
 
 @app.task(name='download_file', autoretry_for=(Exception,), retry_backoff=5, retry_kwargs={'max_retries': 3})
-def download_file(file_path: str, cid: str, key: str) -> str:
+def download_file(file_path: str, cid: str, key: str, name: str = None, with_hash: bool = False) -> [str, dict]:
     """
     download file from nft.storage
     :param file_path: the file_path for saving downloaded file
     :param cid: the file id in nft.storage
     :param key: the secret key for decrypt downloaded file
+    :param name: the file name in the directory of cid, e.g. a page object of a paged book
+    :param with_hash: bool, return the sha256 of decrypted file as well, it is hashed here rather than by the server
 
-    :return: str, the path of decrypted file
+    :return: str, the path of decrypted file, or dict, {path, sha256} if with_hash
     """
-    decrypted_file = FileHandler().download(path=file_path, cid=cid, key=key)
+    decrypted_file = FileHandler().download(path=file_path, cid=cid, key=key, name=name)
+    if with_hash:
+        return {'path': decrypted_file, 'sha256': FileHandler.hash_file(decrypted_file)}
     return decrypted_file
+
+
+# the tasks whose completion is pushed to the server
+EVENT_TASKS = {upload_file.name, upload_pages.name}
+
+
+@task_success.connect
+def publish_task_success(sender=None, result=None, **kwargs):
+    if sender.name in EVENT_TASKS:
+        _publish(sender.name, sender.request.id, 'success', result)
+
+
+@task_failure.connect
+def publish_task_failure(sender=None, task_id=None, exception=None, **kwargs):
+    # sent after the retries are exhausted
+    if sender.name in EVENT_TASKS:
+        _publish(sender.name, task_id, 'failure', exception)
+
+
+def _publish(task: str, task_id: str, status: str, result):
+    try:
+        TaskEventHandler().publish(task, task_id, status, result)
+    except Exception as e:
+        # the result is still in the backend, the server will find it by reconciliation
+        logger.error(f'Fail to publish the event of task {task}({task_id}): {e}')
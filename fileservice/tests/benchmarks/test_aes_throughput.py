@@ -0,0 +1,59 @@
+"""
+Throughput of the AES file container against the legacy 1 KiB layout.
+The size of the synthetic book can be changed with BENCHMARK_FILE_SIZE_MB.
+"""
+import os
+import time
+from handlers.encryption_handler import AESHandler
+from Crypto.Random import get_random_bytes
+import pytest
+
+pytestmark = pytest.mark.benchmark
+
+FILE_SIZE = int(os.getenv('BENCHMARK_FILE_SIZE_MB', 8)) * 1024 * 1024
+
+
+def legacy_encrypt_file(key: bytes, file: str, cipher_file: str):
+    aes_handler = AESHandler()
+    with open(cipher_file, 'wb') as f_out:
+        with open(file, 'rb') as f_in:
+            text = f_in.read(aes_handler.chunk_size)
+            while text:
+                for item in aes_handler.encrypt(key, text):
+                    f_out.write(item)
+                text = f_in.read(aes_handler.chunk_size)
+    return cipher_file
+
+
+def make_file(path, size: int = FILE_SIZE) -> str:
+    block = get_random_bytes(1024 * 1024)
+    with open(path, 'wb') as f:
+        for _ in range(size // len(block)):
+            f.write(block)
+        f.write(block[:size % len(block)])
+    return str(path)
+
+
+def timeit(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def test_aes_throughput(tmp_path):
+    file = make_file(tmp_path / 'book.pdf')
+    key = get_random_bytes(32)
+    aes_handler = AESHandler()
+    mb = FILE_SIZE / 1024 / 1024
+
+    t_legacy_enc = timeit(legacy_encrypt_file, key, file, str(tmp_path / 'legacy.pdf.bin'))
+    t_legacy_dec = timeit(aes_handler.decrypt_file, key, str(tmp_path / 'legacy.pdf.bin'),
+                          str(tmp_path / 'legacy.pdf'))
+    t_enc = timeit(aes_handler.encrypt_file, key, file)
+    t_dec = timeit(aes_handler.decrypt_file, key, f'{file}.bin', str(tmp_path / 'framed.pdf'))
+
+    print(f'\nlegacy: encrypt {mb / t_legacy_enc:.1f}MB/s, decrypt {mb / t_legacy_dec:.1f}MB/s')
+    print(f'framed: encrypt {mb / t_enc:.1f}MB/s, decrypt {mb / t_dec:.1f}MB/s')
+
+    assert t_enc < t_legacy_enc
+    assert t_dec < t_legacy_dec
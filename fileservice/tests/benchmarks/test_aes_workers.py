@@ -0,0 +1,43 @@
+"""
+Throughput of the AES file container with 1/2/4/8 workers.
+The size of the synthetic book can be changed with BENCHMARK_FILE_SIZE_MB.
+"""
+import os
+import time
+import pytest
+from handlers.encryption_handler import AESHandler
+from Crypto.Random import get_random_bytes
+
+pytestmark = pytest.mark.benchmark
+
+FILE_SIZE = int(os.getenv('BENCHMARK_FILE_SIZE_MB', 200)) * 1024 * 1024
+
+
+@pytest.fixture(scope='module')
+def book(tmp_path_factory):
+    path = tmp_path_factory.mktemp('books') / 'book.pdf'
+    block = get_random_bytes(1024 * 1024)
+    with open(path, 'wb') as f:
+        for _ in range(FILE_SIZE // len(block)):
+            f.write(block)
+        f.write(block[:FILE_SIZE % len(block)])
+    return str(path)
+
+
+@pytest.mark.parametrize('workers', [1, 2, 4, 8])
+def test_aes_workers_throughput(book, tmp_path, workers):
+    key = get_random_bytes(32)
+    aes_handler = AESHandler(workers=workers)
+    mb = FILE_SIZE / 1024 / 1024
+
+    start = time.perf_counter()
+    encrypted_file = aes_handler.encrypt_file(key, book)
+    t_enc = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decrypted_file = aes_handler.decrypt_file(key, encrypted_file, str(tmp_path / 'book.pdf'))
+    t_dec = time.perf_counter() - start
+
+    print(f'\n{workers} workers ({os.cpu_count()} cpus): encrypt {mb / t_enc:.1f}MB/s, decrypt {mb / t_dec:.1f}MB/s')
+    assert os.path.getsize(decrypted_file) == FILE_SIZE
+    os.remove(encrypted_file)
@@ -0,0 +1,83 @@
+"""
+Time to download and decrypt a book from a local gateway whose bandwidth is limited per connection,
+with concurrent ranged requests and with a single stream.
+The size of the synthetic book can be changed with BENCHMARK_FILE_SIZE_MB,
+the bandwidth of a connection with BENCHMARK_CONNECTION_MBPS.
+"""
+import os
+import time
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from handlers.encryption_handler import AESHandler
+from handlers.nft_storage_handler import NFTStorageHandler
+from Crypto.Random import get_random_bytes
+
+pytestmark = pytest.mark.benchmark
+
+FILE_SIZE = int(os.getenv('BENCHMARK_FILE_SIZE_MB', 32)) * 1024 * 1024
+CONNECTION_MBPS = float(os.getenv('BENCHMARK_CONNECTION_MBPS', 16))
+
+
+class ThrottledHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    content = b''
+    accept_ranges = True
+
+    def do_GET(self):
+        content = self.content
+        if self.accept_ranges and self.headers.get('Range'):
+            start, end = self.headers['Range'][len('bytes='):].split('-')
+            start, end = int(start), min(int(end), len(content) - 1)
+            content = content[start:end + 1]
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(self.content)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        block = 64 * 1024
+        for i in range(0, len(content), block):
+            self.wfile.write(content[i:i + block])
+            time.sleep(block / CONNECTION_MBPS / 1024 / 1024)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def gateway(tmp_path_factory):
+    path = tmp_path_factory.mktemp('books') / 'book.pdf'
+    with open(path, 'wb') as f:
+        f.write(get_random_bytes(FILE_SIZE))
+    key = get_random_bytes(32)
+    encrypted_file = AESHandler().encrypt_file(key, str(path))
+    with open(encrypted_file, 'rb') as f:
+        ThrottledHandler.content = f.read()
+    os.remove(encrypted_file)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ThrottledHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}', key
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize('accept_ranges', [False, True])
+def test_download_throughput(gateway, tmp_path, accept_ranges):
+    url, key = gateway
+    nft_handler = NFTStorageHandler()
+    mb = FILE_SIZE / 1024 / 1024
+
+    with patch.object(ThrottledHandler, 'accept_ranges', accept_ranges):
+        start = time.perf_counter()
+        with nft_handler.open_url(url) as f_in:
+            decrypted_file = AESHandler().decrypt_stream(key, f_in, str(tmp_path / 'book.pdf'))
+        t = time.perf_counter() - start
+
+    mode = f'{nft_handler.download_workers} ranged connections' if accept_ranges else 'a single stream'
+    print(f'\n{mode}, {CONNECTION_MBPS}MB/s per connection: {t:.2f}s, {mb / t:.1f}MB/s')
+    assert os.path.getsize(decrypted_file) == FILE_SIZE
+    NFTStorageHandler.close()
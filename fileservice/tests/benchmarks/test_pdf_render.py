@@ -0,0 +1,47 @@
+"""
+Time to render a book into images with 1/2/4 processes, compared with the former renderer,
+which saved every page by pillow with optimize=True in one loop.
+The number of pages of the synthetic book can be changed with BENCHMARK_PDF_PAGES.
+"""
+import os
+import time
+import fitz
+import pytest
+from handlers.pdf_handler import PDFHandler
+
+pytestmark = pytest.mark.benchmark
+
+N_PAGES = int(os.getenv('BENCHMARK_PDF_PAGES', 100))
+
+
+@pytest.fixture(scope='module')
+def book(tmp_path_factory):
+    path = tmp_path_factory.mktemp('books') / 'book.pdf'
+    pdf = fitz.open()
+    text = 'The quick brown fox jumps over the lazy dog. ' * 12
+    for i in range(N_PAGES):
+        page = pdf.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 550, 800), f'Page {i + 1}\n' + text * 8, fontsize=9)
+        page.draw_rect(fitz.Rect(100, 600, 500, 780), color=(0, 0, 1), fill=(0.9, 0.9, 1))
+    pdf.save(str(path))
+    return str(path)
+
+
+def test_legacy_render(book, tmp_path):
+    pdf = fitz.open(book)
+    matrix = fitz.Matrix(2.0, 2.0)
+    start = time.perf_counter()
+    for i, page in enumerate(pdf):
+        page.get_pixmap(matrix=matrix, alpha=False).pil_save(str(tmp_path / f'page-{i + 1}.png'), format='png',
+                                                               optimize=True)
+    t = time.perf_counter() - start
+    print(f'\nlegacy ({os.cpu_count()} cpus): {N_PAGES} pages in {t:.2f}s')
+
+
+@pytest.mark.parametrize('workers', [1, 2, 4])
+def test_render(book, tmp_path, workers):
+    start = time.perf_counter()
+    PDFHandler(book).to_img([str(tmp_path)] * (N_PAGES // PDFHandler.PAGES_PER_DIR + 1), workers=workers)
+    t = time.perf_counter() - start
+    print(f'\n{workers} processes ({os.cpu_count()} cpus): {N_PAGES} pages in {t:.2f}s')
+    assert len(os.listdir(tmp_path)) == N_PAGES
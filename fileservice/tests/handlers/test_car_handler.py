@@ -0,0 +1,92 @@
+from handlers.car_handler import UnixFS, CarWriter, CID, CODEC_RAW, CODEC_DAG_PB, UNIXFS_DIRECTORY, encode_varint
+import hashlib
+import os
+from pathlib import Path
+
+parent_path = Path(__file__).resolve().parent.parent
+
+
+def read_varint(data: bytes, offset: int):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, offset
+
+
+def read_car(car_file: str):
+    """
+    :return: (header, list of (cid bytes, data))
+    """
+    with open(car_file, 'rb') as f:
+        data = f.read()
+    size, offset = read_varint(data, 0)
+    header = data[offset:offset + size]
+    offset += size
+    blocks = []
+    while offset < len(data):
+        size, offset = read_varint(data, offset)
+        # cid v1 with sha2-256: version, codec, hash code, digest length and 32 bytes digest
+        cid = data[offset:offset + 36]
+        blocks.append((cid, data[offset + 36:offset + size]))
+        offset += size
+    return header, blocks
+
+
+def test_cid():
+    # well known cids of ipfs
+    assert str(CID.hash(CODEC_RAW, b'hello world')) == 'bafkreifzjut3te2nhyekklss27nh3k72ysco7y32koao5eei66wof36n5e'
+    empty_dir = UnixFS.encode_node([], UnixFS.encode_data(UNIXFS_DIRECTORY))
+    assert str(CID.hash(CODEC_DAG_PB, empty_dir)) == 'bafybeiczsscdsbs7ffqz55asqdf3smv6klcw3gofszvwlyarci47bgf354'
+
+    assert encode_varint(1) == b'\x01'
+    assert encode_varint(300) == b'\xac\x02'
+
+
+def test_unixfs(tmp_path):
+    file = os.path.join(parent_path, 'files/test.pdf')
+    unixfs = UnixFS(leaf_size=1024, max_links=4)
+    blocks = list(unixfs.blocks(file))
+
+    # deterministic
+    assert blocks[-1].cid == unixfs.get_root(file)
+    assert blocks[-1].size == os.path.getsize(file)
+    with open(file, 'rb') as f:
+        assert b''.join(b.data for b in blocks if b.cid.codec == CODEC_RAW) == f.read()
+    # not the same dag with another layout
+    assert UnixFS(leaf_size=2048).get_root(file) != blocks[-1].cid
+
+    # a single leaf file is the leaf itself
+    small_file = tmp_path / 'a.txt'
+    small_file.write_bytes(b'hello world')
+    assert str(UnixFS().get_root(str(small_file))) == 'bafkreifzjut3te2nhyekklss27nh3k72ysco7y32koao5eei66wof36n5e'
+
+    # directory
+    (tmp_path / 'b.txt').write_bytes(b'')
+    root = UnixFS().get_root(str(tmp_path))
+    assert root.codec == CODEC_DAG_PB
+    (tmp_path / 'b.txt').write_bytes(b'b')
+    assert UnixFS().get_root(str(tmp_path)) != root
+
+
+def test_car_writer(tmp_path):
+    file = os.path.join(parent_path, 'files/test.pdf')
+    unixfs = UnixFS(leaf_size=1024)
+    root = unixfs.get_root(file)
+    chunk_size = 8 * 1024
+    car_files = CarWriter(root, chunk_size).write(unixfs.blocks(file), str(tmp_path))
+
+    assert len(car_files) > 1
+    n_blocks = 0
+    for car_file in car_files:
+        assert os.path.getsize(car_file) <= chunk_size
+        header, blocks = read_car(car_file)
+        # every chunk has the same root
+        assert root.to_bytes() in header
+        for cid, data in blocks:
+            assert cid[-32:] == hashlib.sha256(data).digest()
+        n_blocks += len(blocks)
+    assert n_blocks == len(list(unixfs.blocks(file)))
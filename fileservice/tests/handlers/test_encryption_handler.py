@@ -1,11 +1,29 @@
 import os
+import pytest
 from pathlib import Path
-from handlers.encryption_handler import AESHandler
+from unittest.mock import patch, Mock
+from handlers.encryption_handler import AESHandler, HomomorphicEncryptionHandler, GoString
+from handlers.nft_storage_handler import ChunkStream
 from Crypto.Random import get_random_bytes
 
 parent_path = Path(__file__).resolve().parent.parent
 
 
+def legacy_encrypt_file(key: bytes, file: str, cipher_file: str):
+    """
+    the layout before the framed container, every 1 KiB chunk is a separate EAX message
+    """
+    aes_handler = AESHandler()
+    with open(cipher_file, 'wb') as f_out:
+        with open(file, 'rb') as f_in:
+            text = f_in.read(aes_handler.chunk_size)
+            while text:
+                for item in aes_handler.encrypt(key, text):
+                    f_out.write(item)
+                text = f_in.read(aes_handler.chunk_size)
+    return cipher_file
+
+
 def test_aes_encrypt():
     text = b'abcdef'
     aes_handler = AESHandler()
@@ -17,15 +35,155 @@ def test_aes_encrypt():
     assert decrypted_text == text
 
 
-def test_aes_encrypt_file():
+def test_aes_encrypt_file(tmp_path):
     file = os.path.join(parent_path, 'files/test.pdf')
     aes_handler = AESHandler()
     key = get_random_bytes(32)
     encrypted_file = aes_handler.encrypt_file(key, file)
     assert os.path.exists(encrypted_file)
 
-    decrypted_file = aes_handler.decrypt_file(key, encrypted_file)
+    decrypted_file = aes_handler.decrypt_file(key, encrypted_file, str(tmp_path / 'test.pdf'))
     assert os.path.exists(decrypted_file)
+    with open(file, 'rb') as f1, open(decrypted_file, 'rb') as f2:
+        assert f1.read() == f2.read()
 
     os.remove(encrypted_file)
-    os.remove(decrypted_file)
+
+
+def test_aes_encrypt_file_frames(tmp_path):
+    file = tmp_path / 'book.pdf'
+    content = get_random_bytes(10 * 1024 + 7)
+    file.write_bytes(content)
+    aes_handler = AESHandler(frame_size=1024)
+    key = get_random_bytes(32)
+
+    encrypted_file = aes_handler.encrypt_file(key, str(file))
+    with open(encrypted_file, 'rb') as f:
+        _, frame_size, n_frames, size = aes_handler.read_header(f)
+    assert frame_size == 1024
+    assert n_frames == 11
+    assert size == len(content)
+    overhead = aes_handler.NONCE_SIZE + aes_handler.TAG_SIZE
+    assert os.path.getsize(encrypted_file) == aes_handler.HEADER.size + n_frames * overhead + len(content)
+
+    # the reader takes the frame size from the header
+    decrypted_file = AESHandler().decrypt_file(key, encrypted_file, str(tmp_path / 'out.pdf'))
+    assert Path(decrypted_file).read_bytes() == content
+
+    # empty file
+    empty = tmp_path / 'empty.pdf'
+    empty.write_bytes(b'')
+    encrypted_file = aes_handler.encrypt_file(key, str(empty))
+    decrypted_file = aes_handler.decrypt_file(key, encrypted_file, str(tmp_path / 'empty-out.pdf'))
+    assert Path(decrypted_file).read_bytes() == b''
+
+
+def test_aes_decrypt_legacy_file(tmp_path):
+    file = tmp_path / 'book.pdf'
+    content = get_random_bytes(5 * 1024 + 3)
+    file.write_bytes(content)
+    key = get_random_bytes(32)
+
+    encrypted_file = legacy_encrypt_file(key, str(file), str(tmp_path / 'book.pdf.bin'))
+    decrypted_file = AESHandler().decrypt_file(key, encrypted_file, str(tmp_path / 'out.pdf'))
+    assert Path(decrypted_file).read_bytes() == content
+
+
+def test_aes_decrypt_stream(tmp_path):
+    file = os.path.join(parent_path, 'files/test.pdf')
+    key = get_random_bytes(32)
+    aes_handler = AESHandler(frame_size=4096)
+    with open(file, 'rb') as f:
+        text = f.read()
+
+    def stream(cipher_file):
+        # a non-seekable stream of irregular chunks
+        with open(cipher_file, 'rb') as f:
+            data = f.read()
+        return ChunkStream(data[i:i + 1000] for i in range(0, len(data), 1000))
+
+    for cipher_file in (aes_handler.encrypt_file(key, file),
+                        legacy_encrypt_file(key, file, str(tmp_path / 'legacy.pdf.bin'))):
+        decrypted_file = aes_handler.decrypt_stream(key, stream(cipher_file), str(tmp_path / 'test.pdf'))
+        with open(decrypted_file, 'rb') as f:
+            assert f.read() == text
+    os.remove(f'{file}.bin')
+
+    # the decrypted file is removed if decryption fails
+    with pytest.raises(ValueError):
+        aes_handler.decrypt_stream(get_random_bytes(32), stream(legacy_encrypt_file(key, file, str(tmp_path / 'a.bin'))),
+                                   str(tmp_path / 'a.pdf'))
+    assert not os.path.exists(tmp_path / 'a.pdf')
+
+
+def test_aes_decrypt_corrupted_file(tmp_path):
+    file = tmp_path / 'book.pdf'
+    file.write_bytes(get_random_bytes(4 * 1024))
+    aes_handler = AESHandler(frame_size=1024)
+    key = get_random_bytes(32)
+    encrypted_file = aes_handler.encrypt_file(key, str(file))
+    data = Path(encrypted_file).read_bytes()
+    frame_length = aes_handler.NONCE_SIZE + aes_handler.TAG_SIZE + 1024
+    header, frames = data[:aes_handler.HEADER.size], data[aes_handler.HEADER.size:]
+
+    # swap two frames
+    swapped = header + frames[frame_length:2 * frame_length] + frames[:frame_length] + frames[2 * frame_length:]
+    Path(encrypted_file).write_bytes(swapped)
+    with pytest.raises(ValueError):
+        aes_handler.decrypt_file(key, encrypted_file, str(tmp_path / 'out.pdf'))
+
+    # drop the last frame
+    Path(encrypted_file).write_bytes(data[:-frame_length])
+    with pytest.raises(ValueError):
+        aes_handler.decrypt_file(key, encrypted_file, str(tmp_path / 'out.pdf'))
+
+
+def test_aes_encrypt_file_workers(tmp_path):
+    file = tmp_path / 'book.pdf'
+    content = get_random_bytes(20 * 1024 + 7)
+    file.write_bytes(content)
+    key = get_random_bytes(32)
+
+    encrypted_file = AESHandler(frame_size=1024, workers=4).encrypt_file(key, str(file))
+    # frames written by a pool are read by a single thread and the other way around
+    decrypted_file = AESHandler(workers=1).decrypt_file(key, encrypted_file, str(tmp_path / 'out-1.pdf'))
+    assert Path(decrypted_file).read_bytes() == content
+
+    encrypted_file = AESHandler(frame_size=1024, workers=1).encrypt_file(key, str(file))
+    decrypted_file = AESHandler(workers=3).decrypt_file(key, encrypted_file, str(tmp_path / 'out-3.pdf'))
+    assert Path(decrypted_file).read_bytes() == content
+
+    # errors of any frame are raised
+    data = Path(encrypted_file).read_bytes()
+    Path(encrypted_file).write_bytes(data[:-1] + bytes([data[-1] ^ 1]))
+    with pytest.raises(ValueError):
+        AESHandler(workers=3).decrypt_file(key, encrypted_file, str(tmp_path / 'out.pdf'))
+
+
+@patch.object(HomomorphicEncryptionHandler, '_lib', None)
+@patch('handlers.encryption_handler.cdll')
+def test_he_library_loaded_once(mock_cdll):
+    lib = HomomorphicEncryptionHandler().he
+    assert HomomorphicEncryptionHandler().he is lib
+    mock_cdll.LoadLibrary.assert_called_once_with(HomomorphicEncryptionHandler.LIB_FILE)
+    assert lib.AddBWM.argtypes == [GoString, GoString, GoString]
+    assert lib.VerifySign.restype is not None
+
+    HomomorphicEncryptionHandler().add_bwm('a.png', 'a.png')
+    lib.AddBWM.assert_called_once()
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+@patch.object(HomomorphicEncryptionHandler, '_lib', Mock())
+def test_he_encrypt_images(workers):
+    handler = HomomorphicEncryptionHandler()
+    handler.add_bwm = Mock()
+    handler.add_sign = Mock()
+    handler.encrypt = Mock()
+    images = [f'test/{i}.png' for i in range(10)]
+
+    assert handler.encrypt_images('a.stk', images, workers=workers) == [f'{img}.sse' for img in images]
+    assert sorted(c.args for c in handler.encrypt.call_args_list) == \
+           sorted(('a.stk', img, f'{img}.sse') for img in images)
+    assert handler.add_bwm.call_count == handler.add_sign.call_count == 10
+    assert handler.encrypt_images('a.stk', []) == []
@@ -0,0 +1,18 @@
+import json
+import fakeredis
+from handlers.event_handler import TaskEventHandler
+
+
+def test_publish():
+    conn = fakeredis.FakeRedis()
+    handler = TaskEventHandler(conn)
+    event_id = handler.publish('upload_file', 'task-1', 'success', {'cid': 'cid-1', 'key': 'key-1'})
+    handler.publish('upload_file', 'task-2', 'failure', ValueError('bad file'))
+
+    events = conn.xrange(handler.STREAM)
+    assert len(events) == 2
+    assert events[0][0].decode() == event_id
+    assert events[0][1][b'task_id'] == b'task-1'
+    assert json.loads(events[0][1][b'result']) == {'cid': 'cid-1', 'key': 'key-1'}
+    assert events[1][1][b'status'] == b'failure'
+    assert json.loads(events[1][1][b'result']) == 'ValueError: bad file'
@@ -1,13 +1,25 @@
 from handlers.nft_storage_handler import NFTStorageHandler
+from handlers.car_handler import UnixFS
+import base64
 from unittest.mock import patch
 # import nft_storage
 import pytest
 import os
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 
 parent_path = Path(__file__).resolve().parent.parent
 
 
+@pytest.fixture(autouse=True)
+def clean_clients():
+    NFTStorageHandler.close()
+    yield
+    NFTStorageHandler.close()
+
+
 @patch('handlers.nft_storage_handler.nft_storage_api')
 @patch('handlers.nft_storage_handler.nft_storage')
 def test_store(mock_ns, mock_nsa):
@@ -30,28 +42,53 @@ def test_store(mock_ns, mock_nsa):
     #     nft_handler.store(file)
 
 
-@patch('handlers.nft_storage_handler.MultipartEncoder')
-@patch('handlers.nft_storage_handler.requests')
-def test_bulk_upload(mock_reqs, mock_me):
+@pytest.fixture
+def checkpoint_root(tmp_path):
+    with patch.object(NFTStorageHandler, 'checkpoint_root', str(tmp_path / 'uploads')):
+        yield tmp_path / 'uploads'
+
+
+@patch.object(NFTStorageHandler.retry, 'backoff_factor', 0)
+@patch.object(NFTStorageHandler, 'get_session')
+def test_bulk_upload(mock_session, checkpoint_root):
     dir = os.path.join(parent_path, 'files')
+    root = str(UnixFS().get_root(dir))
     nft_handler = NFTStorageHandler()
 
     # not directory
     with pytest.raises(ValueError):
         nft_handler.bulk_upload('abc.txt')
 
-    mock_reqs.post.return_value.json.return_value = {'ok': True, 'value': {'cid': 'abc'}}
+    mock_post = mock_session.return_value.post
+    mock_post.return_value.json.return_value = {'ok': True, 'value': {'cid': root}}
 
     res = nft_handler.bulk_upload(dir)
-    assert res == 'abc'
+    assert res == root
+    assert mock_post.call_args.kwargs['headers']['Content-Type'] == 'application/car'
+    assert not os.path.exists(checkpoint_root / root)
 
-    # not ok
-    mock_reqs.post.return_value.json.return_value = {'ok': False, 'error': {'message': 'errno 524xxxx'}}
+    # unexpected cid
+    mock_post.return_value.json.return_value = {'ok': True, 'value': {'cid': 'abc'}}
+    with pytest.raises(RuntimeError):
+        nft_handler.bulk_upload(dir)
+
+    # not ok, retry and return the result of retry
+    mock_post.reset_mock()
+    mock_post.return_value.json.side_effect = [{'ok': False, 'error': {'code': 'Error', 'message': 'errno 524xxxx'}},
+                                               {'ok': True, 'value': {'cid': root}}]
+    assert nft_handler.bulk_upload(dir, 2) == root
+    assert mock_post.call_count == 2
+
+    # give up after retry
+    mock_post.reset_mock()
+    mock_post.return_value.json.side_effect = None
+    mock_post.return_value.json.return_value = {'ok': False, 'error': {'code': 'Error', 'message': 'errno 524xxxx'}}
     with pytest.raises(RuntimeError):
         nft_handler.bulk_upload(dir, 2)
+    assert mock_post.call_count == 3
 
     # raise exception when post
-    mock_reqs.post.side_effect = ValueError('aaa')
+    mock_post.side_effect = ValueError('aaa')
     with pytest.raises(Exception):
         nft_handler.bulk_upload(dir)
 
@@ -103,16 +140,242 @@ def test_retrieve(mock_reqs):
     cid = 'abc'
     nft_handler = NFTStorageHandler()
 
-    mock_reqs.get.return_value.json.return_value = {'ok': True, 'value': 'xxx'}
+    mock_reqs.Session.return_value.get.return_value.json.return_value = {'ok': True, 'value': 'xxx'}
     res = nft_handler.retrieve(cid)
     assert res == 'xxx'
 
     # not ok
-    mock_reqs.get.return_value.json.return_value = {'ok': False, 'error': {'message': 'error'}}
+    mock_reqs.Session.return_value.get.return_value.json.return_value = {'ok': False, 'error': {'message': 'error'}}
     with pytest.raises(RuntimeError):
         nft_handler.retrieve(cid)
 
     # raise exception
-    mock_reqs.get.side_effect = Exception()
+    mock_reqs.Session.return_value.get.side_effect = Exception()
     with pytest.raises(Exception):
         nft_handler.retrieve(cid)
+
+
+@patch('handlers.nft_storage_handler.nft_storage_api')
+@patch('handlers.nft_storage_handler.nft_storage')
+def test_shared_clients(mock_ns, mock_nsa):
+    session = NFTStorageHandler.get_session()
+    assert NFTStorageHandler.get_session() is session
+    assert NFTStorageHandler().get_api_client() is NFTStorageHandler().get_api_client()
+    assert mock_ns.ApiClient.call_count == 1
+
+    NFTStorageHandler().check('abc')
+    NFTStorageHandler().check('abc')
+    assert mock_ns.ApiClient.call_count == 1
+
+    # a forked process builds its own clients
+    with patch('handlers.nft_storage_handler.os.getpid', return_value=-1):
+        assert NFTStorageHandler.get_session() is not session
+        NFTStorageHandler().get_api_client()
+    assert mock_ns.ApiClient.call_count == 2
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    statuses = []
+    clients = set()
+
+    def do_GET(self):
+        self.clients.add(self.client_address)
+        status = self.statuses.pop(0) if self.statuses else 200
+        body = json.dumps({'ok': status == 200, 'value': self.path.lstrip('/'),
+                           'error': {'message': f'status {status}'}}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    StubHandler.statuses = []
+    StubHandler.clients = set()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def test_retrieve_with_stub_server(stub_server):
+    nft_handler = NFTStorageHandler()
+    nft_handler.base_api = stub_server
+
+    # keep alive
+    for cid in ('a', 'b', 'c'):
+        assert nft_handler.retrieve(cid) == cid
+    assert len(StubHandler.clients) == 1
+
+    # retry on 5xx/524
+    StubHandler.statuses = [524, 502]
+    with patch.object(NFTStorageHandler.retry, 'backoff_factor', 0):
+        assert nft_handler.retrieve('d') == 'd'
+    assert StubHandler.statuses == []
+
+    # give up after 3 retries
+    StubHandler.statuses = [524] * 4
+    with patch.object(NFTStorageHandler.retry, 'backoff_factor', 0):
+        with pytest.raises(RuntimeError):
+            nft_handler.retrieve('e')
+
+
+class StubUploadHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    statuses = []
+    chunks = []
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        with self.lock:
+            status = self.statuses.pop(0) if self.statuses else 200
+            if status == 200:
+                self.chunks.append(body)
+        # the root of car header: tag 42, bytes, identity multibase prefix
+        start = body.index(b'\xd8\x2a\x58') + 3
+        cid = body[start + 2:start + 1 + body[start]]
+        root = 'b' + base64.b32encode(cid).decode().lower().rstrip('=')
+        body = json.dumps({'ok': status == 200, 'value': {'cid': root},
+                           'error': {'message': f'status {status}'}}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_upload_server():
+    StubUploadHandler.statuses = []
+    StubUploadHandler.chunks = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubUploadHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+@patch.object(NFTStorageHandler.retry, 'backoff_factor', 0)
+@patch.object(NFTStorageHandler, 'car_chunk_size', 32 * 1024)
+@patch.object(UnixFS, 'leaf_size', 4 * 1024)
+def test_upload_resume(stub_upload_server, checkpoint_root):
+    file = os.path.join(parent_path, 'files/test.pdf')
+    root = str(UnixFS().get_root(file))
+    nft_handler = NFTStorageHandler()
+    nft_handler.base_api = stub_upload_server
+
+    # a chunk fails with a client error, the others are uploaded and recorded
+    StubUploadHandler.statuses = [400]
+    with pytest.raises(RuntimeError):
+        nft_handler.upload(file, retry=0)
+    n_uploaded = len(StubUploadHandler.chunks)
+    assert n_uploaded > 1
+    with open(checkpoint_root / root / 'checkpoint.json') as f:
+        assert len(json.load(f)['uploaded']) == n_uploaded
+
+    # resume, only the failed chunk is uploaded again
+    assert nft_handler.upload(file) == root
+    assert len(StubUploadHandler.chunks) == n_uploaded + 1
+    assert not os.path.exists(checkpoint_root / root)
+    assert all(len(chunk) <= 32 * 1024 for chunk in StubUploadHandler.chunks)
+
+    # a new upload uploads all chunks
+    assert nft_handler.upload(file) == root
+    assert len(StubUploadHandler.chunks) == 2 * (n_uploaded + 1)
+
+
+class StubRangeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    content = b''
+    accept_ranges = True
+    requests = []
+    lock = threading.Lock()
+
+    def do_GET(self):
+        content = self.content
+        status = 200
+        headers = {}
+        if self.accept_ranges and self.headers.get('Range'):
+            start, end = self.headers['Range'][len('bytes='):].split('-')
+            start, end = int(start), min(int(end), len(content) - 1)
+            headers['Content-Range'] = f'bytes {start}-{end}/{len(content)}'
+            content = content[start:end + 1]
+            status = 206
+        with self.lock:
+            self.requests.append(self.headers.get('Range'))
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_range_server():
+    with open(os.path.join(parent_path, 'files/test.pdf'), 'rb') as f:
+        StubRangeHandler.content = f.read()
+    StubRangeHandler.accept_ranges = True
+    StubRangeHandler.requests = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubRangeHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+@patch.object(NFTStorageHandler, 'range_size', 16 * 1024)
+def test_open_url(stub_range_server):
+    nft_handler = NFTStorageHandler()
+    content = StubRangeHandler.content
+    n_ranges = -(-len(content) // (16 * 1024))
+
+    # concurrent ranges in order
+    with nft_handler.open_url(stub_range_server) as f:
+        assert f.read(10) == content[:10]
+        assert f.read() == content[10:]
+    assert len(StubRangeHandler.requests) == n_ranges
+
+    # a single range
+    with patch.object(NFTStorageHandler, 'range_size', len(content) * 2):
+        with nft_handler.open_url(stub_range_server) as f:
+            assert f.read() == content
+
+    # stop reading
+    StubRangeHandler.requests = []
+    with patch.object(NFTStorageHandler, 'download_workers', 1):
+        with nft_handler.open_url(stub_range_server) as f:
+            f.read(1)
+            f.read(16 * 1024)
+    assert len(StubRangeHandler.requests) < n_ranges
+
+    # fall back to a single stream
+    StubRangeHandler.accept_ranges = False
+    StubRangeHandler.requests = []
+    with nft_handler.open_url(stub_range_server) as f:
+        assert f.read() == content
+    assert len(StubRangeHandler.requests) == 1
+
+    # unexpected range
+    with patch.object(NFTStorageHandler, 'get_range', side_effect=RuntimeError):
+        StubRangeHandler.accept_ranges = True
+        with pytest.raises(RuntimeError):
+            with nft_handler.open_url(stub_range_server) as f:
+                f.read()
@@ -1,6 +1,11 @@
-from handlers.pdf_handler import PDFHandler
+from handlers.pdf_handler import PDFHandler, FileHandler
+from handlers.encryption_handler import AESHandler
+from handlers.nft_storage_handler import ChunkStream
+import hashlib
 import os
 import pytest
+from io import BytesIO
+from PIL import Image
 from pathlib import Path
 from unittest.mock import patch, Mock
 
@@ -36,6 +41,47 @@ def test_to_img():
             assert f'page-{i + 1}.png' == f
 
 
+def test_to_img_workers(tmp_path):
+    handler = PDFHandler(os.path.join(parent_path, 'files/test.pdf'))
+    img_dirs = []
+    for workers in (1, 2):
+        img_dir = tmp_path / str(workers)
+        img_dir.mkdir()
+        handler.to_img([str(img_dir)], workers=workers)
+        img_dirs.append(img_dir)
+
+    # a document opened from memory
+    with open(os.path.join(parent_path, 'files/test.pdf'), 'rb') as f:
+        handler = PDFHandler(BytesIO(f.read()))
+    img_dir = tmp_path / 'memory'
+    img_dir.mkdir()
+    handler.to_img([str(img_dir)], workers=2)
+    img_dirs.append(img_dir)
+
+    # the same images whatever the number of processes
+    files = sorted(os.listdir(img_dirs[0]))
+    assert files == [f'page-{i}.png' for i in range(1, 5)]
+    for img_dir in img_dirs[1:]:
+        assert files == sorted(os.listdir(img_dir))
+        for f in files:
+            assert (img_dirs[0] / f).read_bytes() == (img_dir / f).read_bytes()
+
+
+@pytest.mark.parametrize('img_format, extension', [('jpeg', 'jpg'), ('webp', 'webp')])
+def test_to_img_format(tmp_path, img_format, extension):
+    handler = PDFHandler(os.path.join(parent_path, 'files/test.pdf'))
+    handler.to_img([str(tmp_path)], dpi=72, img_format=img_format, quality=50, workers=2)
+
+    files = sorted(os.listdir(tmp_path))
+    assert files == [f'page-{i}.{extension}' for i in range(1, 5)]
+    pixmap = handler.pdf[0].get_pixmap(alpha=False)
+    with Image.open(tmp_path / files[0]) as img:
+        assert img.size == (pixmap.width, pixmap.height)
+
+    with pytest.raises(ValueError):
+        handler.to_img([str(tmp_path)], img_format='gif')
+
+
 @patch('handlers.pdf_handler.EncryptionHandler')
 def test_generate_keys(mock_eh):
     sk_file, pk_file, key_dict = pdf_handler.generate_keys()
@@ -100,3 +146,69 @@ def test_get_file_urls(mock_nsh):
     assert urls[0] == 'a-0.xxx.com'
     assert urls[1] == 'a-0.xxx.com'
     assert urls[2] == 'a-0.xxx.com'
+
+
+@patch('handlers.pdf_handler.NFTStorageHandler')
+def test_download(mock_nsh, tmp_path):
+    file = os.path.join(parent_path, 'files/test.pdf')
+    aes_handler = AESHandler()
+    key = b'k' * 32
+    encrypted_file = aes_handler.encrypt_file(key, file)
+    with open(encrypted_file, 'rb') as f:
+        mock_nsh.return_value.open_url.return_value = ChunkStream(iter([f.read()]))
+    os.remove(encrypted_file)
+    nonce, tag, ciphertext = aes_handler.encrypt(FileHandler.KEY, key)
+
+    path = str(tmp_path / 'book.pdf.bin')
+    res = FileHandler().download(path, 'cid', (nonce + tag + ciphertext).decode('latin'))
+
+    assert res == str(tmp_path / 'book.pdf')
+    # no encrypted file on disk
+    assert not os.path.exists(path)
+    with open(res, 'rb') as f1, open(file, 'rb') as f2:
+        content = f1.read()
+        assert content == f2.read()
+    assert FileHandler.hash_file(res) == hashlib.sha256(content).hexdigest()
+
+
+@patch('handlers.pdf_handler.NFTStorageHandler')
+def test_upload_pages(mock_nsh, tmp_path):
+    path = str(tmp_path / 'book.pdf')
+    with open(os.path.join(parent_path, 'files/test.pdf'), 'rb') as f_in, open(path, 'wb') as f_out:
+        f_out.write(f_in.read())
+    objects = {}
+
+    def upload(pages_dir):
+        for name in os.listdir(pages_dir):
+            with open(os.path.join(pages_dir, name), 'rb') as f:
+                objects[name] = f.read()
+        return 'cid'
+
+    mock_nsh.return_value.upload.side_effect = upload
+    res = PDFHandler(path).upload_pages(path, pages_per_object=3)
+
+    assert res['cid'] == 'cid'
+    assert res['n_pages'] == 4
+    assert res['pages_per_object'] == 3
+    assert sorted(objects) == [PDFHandler.get_object_name(0), PDFHandler.get_object_name(1)]
+    # every object is a separately encrypted pdf of its pages
+    key = FileHandler().decrypt_key(res['key'])
+    for name, n_pages in zip(sorted(objects), [3, 1]):
+        encrypted_file = str(tmp_path / name)
+        with open(encrypted_file, 'wb') as f:
+            f.write(objects[name])
+        assert PDFHandler(AESHandler().decrypt_file(key, encrypted_file)).get_pages() == n_pages
+    assert not os.path.exists(f'{path}.pages')
+    assert not os.path.exists(f'{path}.key')
+
+    # resume with the encrypted objects and key of the failed upload
+    objects.clear()
+    mock_nsh.return_value.upload.side_effect = Exception()
+    with pytest.raises(Exception):
+        PDFHandler(path).upload_pages(path, pages_per_object=3)
+    with open(f'{path}.key', 'rb') as f:
+        key = f.read().decode('latin')
+    failed_objects = sorted(os.listdir(f'{path}.pages'))
+    mock_nsh.return_value.upload.side_effect = upload
+    assert PDFHandler(path).upload_pages(path, pages_per_object=3)['key'] == key
+    assert sorted(objects) == failed_objects
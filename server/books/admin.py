@@ -1,10 +1,17 @@
 from django.contrib import admin
 from . import models
+from .ingest import BookIngest
 
 
 class BookAdmin(admin.ModelAdmin):
-    list_display = ['id', 'title', 'desc', 'author', 'task_id', 'status']
+    list_display = ['id', 'title', 'desc', 'author', 'task_id', 'status', 'ingest_attempts', 'ingest_error']
     search_fields = ['title', 'desc', 'author__address', 'author__name', 'author__username', 'task_id', 'status']
+    actions = ['retry_ingest']
+
+    @admin.action(description='Retry the failed stage of ingest')
+    def retry_ingest(self, request, queryset):
+        for book in queryset:
+            BookIngest.retry(book)
 
 
 class IssueAdmin(admin.ModelAdmin):
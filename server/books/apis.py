@@ -4,21 +4,22 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError
 from utils.views import BaseViewSet
-from utils.enums import IssueStatus
+from utils.enums import IssueStatus, StorageMode
 from . import models, serializers, filters
 from stores.models import Trade
 # from stores.models import Trade
 # from .pdf_handler import PDFHandler
 # from django.db.transaction import atomic
-from .file_service_connector import FileServiceConnector
 # from books.file_service_config import FileServiceConfig
 # from utils.enums import IssueStatus
 # from django.conf import settings
 from authorities.permissions import ObjectPermissionsOrReadOnly
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated
-from utils.redis_accessor import RedisLock, RedisAccessor
+from .read_job import ReadJob
 from django.conf import settings
-from django.db.models import Sum
+from django.db.models import Exists, OuterRef, Sum
+from django_filters.rest_framework import DjangoFilterBackend
+from .search import IssueSearchFilter
 
 
 class DraftViewSet(BaseViewSet):
@@ -35,9 +36,10 @@ class BookViewSet(BaseViewSet):
     filterset_class = filters.BookFilter
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        issued_books = [issue.book.id for issue in models.Issue.objects.filter(book__in=queryset)]
-        return queryset.exclude(id__in=issued_books)
+        # the books which are not issued, NOT EXISTS
+        issued = Exists(models.Issue.objects.filter(book=OuterRef('pk')))
+        return super().get_queryset().select_related('author', 'preview_book').annotate(issued=issued).filter(
+            issued=False)
 
     def list(self, request, *args, **kwargs):
         kwargs['serializer_class'] = serializers.BookListingSerializer
@@ -49,7 +51,14 @@ class IssueViewSet(BaseViewSet):
     queryset = models.Issue.objects.all()
     serializer_class = serializers.IssueSerializer
     filterset_class = filters.IssueFilter
+    # ranked by the full-text index, the fields are used by the terms which are too short for the index
+    filter_backends = [DjangoFilterBackend, IssueSearchFilter]
     search_fields = ['book__title', 'book__desc', 'book__author__name']
+    # ?cursor= for the keyset pagination
+    cursor_ordering = ('-updated_at', '-id')
+
+    def get_queryset(self):
+        return serializers.IssueSerializer.setup_queryset(super().get_queryset(), self.request.user)
 
     @action(methods=['get'], detail=False, url_path='current', permission_classes=[IsAuthenticated])
     def list_current(self, request, *args, **kwargs):
@@ -90,6 +99,8 @@ class AssetViewSet(BaseViewSet):
     serializer_class = serializers.AssetSerializer
     filterset_class = filters.AssetFilter
     http_method_names = ['get']
+    # the max number of pages before/after the page of the pages api
+    max_read_pages = 50
 
     @action(methods=['get'], detail=False, url_path='current', permission_classes=[IsAuthenticated])
     def list_current(self, request, *args, **kwargs):
@@ -101,16 +112,7 @@ class AssetViewSet(BaseViewSet):
         request.GET['user'] = request.user
         return super().list(request, *args, **kwargs)
 
-    @action(methods=['get'], detail=True, url_path='read', permission_classes=[IsAuthenticated])
-    def read(self, request, *args, **kwargs):
-        """
-        0, check if the user has this book or not?
-        1, fetch files from file coin
-        2, decrypt files
-        3, merge files into pdf
-        """
-        obj = self.get_object()
-
+    def _check_remained(self, request, obj):
         n_trades = Trade.objects.filter(user=request.user, issue=obj.issue).aggregate(q=Sum('quantity'))['q']
         if n_trades is None:
             n_trades = 0
@@ -118,30 +120,102 @@ class AssetViewSet(BaseViewSet):
         if obj.quantity - n_trades == 0:
             raise ValidationError({'detail': 'Sorry you have no books remained.'})
 
-        cache_key = f'asset-{obj.issue.id}'
-        # expire_time = 7 * 24 * 3600  # 1 week
-        cache = RedisAccessor()
-        path = cache.get_value(cache_key)
-        if path is None:
-            with RedisLock(f'{cache_key}-lock'):
-                path = cache.get_value(cache_key)
-                if path is None:
-                    try:
-                        encryption_key = models.EncryptionKey.objects.get(user=obj.issue.book.author,
-                                                                          book=obj.issue.book)
-                    except models.EncryptionKey.DoesNotExist:
-                        print(f'encryption key not found for book {obj.issue.book.id}')
-                        return Response(status=status.HTTP_404_NOT_FOUND)
-                    path = FileServiceConnector().download_file(obj.issue.book.cid, encryption_key.key,
-                                                                obj.issue.book.type)
-                    cache.set_value(cache_key, path)
+    @staticmethod
+    def _get_file_url(request, path: str) -> str:
         file_url = os.path.join('/', path.lstrip(str(settings.BASE_DIR.absolute())))
-        url = request.build_absolute_uri(file_url)
+        return request.build_absolute_uri(file_url)
+
+    @action(methods=['get'], detail=True, url_path='read', permission_classes=[IsAuthenticated])
+    def read(self, request, *args, **kwargs):
+        """
+        0, check if the user has this book or not?
+        1, return the file if the book is cached
+        2, otherwise prepare the book in the background and return the job at once,
+           poll this api or wait for the notification of websocket until the job is ready
+        """
+        obj = self.get_object()
+        self._check_remained(request, obj)
+
+        try:
+            state = ReadJob(obj.issue.book).start(obj)
+        except models.EncryptionKey.DoesNotExist:
+            print(f'encryption key not found for book {obj.issue.book.id}')
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        if state['status'] == ReadJob.PENDING:
+            return Response(state, status=status.HTTP_202_ACCEPTED)
+        if state['status'] == ReadJob.FAILURE:
+            state['detail'] = 'Fail to prepare the book, please try again.'
+            return Response(state, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        url = self._get_file_url(request, state['path'])
 
         # bookmark
         obj_bookmark = models.Bookmark.objects.get(user=request.user, issue=obj.issue)
         serializer = serializers.BookmarkSerializer(obj_bookmark, many=False)
-        return Response({'file_url': url, 'bookmark': serializer.data})
+        return Response({'status': state['status'], 'file_url': url, 'bookmark': serializer.data})
+
+    @action(methods=['get'], detail=True, url_path='pages', permission_classes=[IsAuthenticated])
+    def pages(self, request, *args, **kwargs):
+        """
+        Read a book in paged storage mode, only the objects of pages around the page are prepared.
+        query params:
+            page, default the current page of bookmark
+            before/after, the number of pages before/after the page, default READ_PAGES_BEFORE/READ_PAGES_AFTER
+        Every object is a pdf of pages from_page ~ to_page, its status is the same as the read api, the status code
+        is decided by the object of the page.
+        """
+        obj = self.get_object()
+        self._check_remained(request, obj)
+        book = obj.issue.book
+        if book.storage_mode != StorageMode.PAGED.value or book.pages_per_object <= 0:
+            raise ValidationError({'detail': 'The book is not stored by pages, please read the whole file.'})
+
+        obj_bookmark = models.Bookmark.objects.get(user=request.user, issue=obj.issue)
+        try:
+            page = int(request.GET.get('page', obj_bookmark.current_page))
+            before = min(int(request.GET.get('before', settings.READ_PAGES_BEFORE)), self.max_read_pages)
+            after = min(int(request.GET.get('after', settings.READ_PAGES_AFTER)), self.max_read_pages)
+        except ValueError:
+            raise ValidationError({'detail': 'page, before and after must be integers.'})
+        n_pages = book.n_pages or page + after
+        page = min(max(page, 1), n_pages)
+        first = (max(page - max(before, 0), 1) - 1) // book.pages_per_object
+        last = (min(page + max(after, 0), n_pages) - 1) // book.pages_per_object
+
+        objects = []
+        try:
+            for index in range(first, last + 1):
+                state = ReadJob(book, index).start(obj)
+                item = {
+                    'index': index,
+                    'from_page': index * book.pages_per_object + 1,
+                    'to_page': min((index + 1) * book.pages_per_object, n_pages),
+                    'status': state['status']
+                }
+                if state['status'] == ReadJob.READY:
+                    item['file_url'] = self._get_file_url(request, state['path'])
+                else:
+                    item['job'] = state['job']
+                objects.append(item)
+        except models.EncryptionKey.DoesNotExist:
+            print(f'encryption key not found for book {book.id}')
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        current = objects[(page - 1) // book.pages_per_object - first]
+        data = {
+            'status': current['status'],
+            'page': page,
+            'n_pages': book.n_pages,
+            'pages_per_object': book.pages_per_object,
+            'objects': objects,
+            'bookmark': serializers.BookmarkSerializer(obj_bookmark, many=False).data
+        }
+        if current['status'] == ReadJob.PENDING:
+            return Response(data, status=status.HTTP_202_ACCEPTED)
+        if current['status'] == ReadJob.FAILURE:
+            data['detail'] = 'Fail to prepare the pages, please try again.'
+            return Response(data, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response(data)
 
 
 class WishlistViewSet(BaseViewSet):
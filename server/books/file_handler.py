@@ -6,9 +6,9 @@ import zipfile
 from django.conf import settings
 from pathlib import Path
 import uuid
-from ebooklib import epub
 from weasyprint import HTML
 from epubconverter import epub_to_pdf
+from epubconverter.reader import EpubReader
 import logging
 
 logger = logging.getLogger(__name__)
@@ -121,23 +121,23 @@ class EPUBHandler(FileHandler):
         :param file: str, the absolute path of file
         """
         self.filename = file
-        # ERROR Relative URI reference without a base URI: <link href="css/idGeneratedStyles.css">
-        self.book = epub.read_epub(file, options={'ignore_ncx': True})
 
     def get_pages(self):
         return 0
 
     def get_file_name(self) -> str:
         try:
-            _title = self.book.get_metadata('DC', 'title')[0][0]
-            return _title.replace(' ', '-')
+            # only the package document is read
+            with EpubReader(self.filename) as reader:
+                _title = reader.get_title()
+            return _title.replace(' ', '-') if _title else uuid.uuid4().hex
         except Exception as e:
             logger.error(f'Exception when get file name->{e}')
             return uuid.uuid4().hex
     
     def get_preview_doc(self, from_page: int = 0, to_page: int = 4):
         """
-        get a piece of original file
+        get a piece of original file, only the documents of the first to_page + 1 pages are rendered
         :param from_page: int
         :param to_page: int
         :return: str, file path
@@ -145,14 +145,7 @@ class EPUBHandler(FileHandler):
         file_name = f'{self.get_file_name()}.pdf'
         file_path = os.path.join(settings.TEMPORARY_ROOT, file_name)
 
-        # contents = ''
-        # for doc in self.book.get_items_of_type(ebooklib.ITEM_DOCUMENT):
-        #     contents += doc.content.decode()
-
-        # contents = self.beautify()
-        # logger.error(f'-----------=-=-=============={contents}')
-        # HTML(string=contents).write_pdf(file_path)
-        epub_to_pdf(self.filename, file_path)
+        epub_to_pdf(self.filename, file_path, max_pages=to_page + 1)
 
         try:
             pdf_handler = PDFHandler(file_path)
@@ -164,12 +157,14 @@ class EPUBHandler(FileHandler):
 
 
 class TextHandler(FileHandler):
+    # the size of text read first for a preview, it is doubled until the pages are enough
+    chunk_size = 64 * 1024
 
     def __init__(self, file: str):
         """
         :param file: str, the absolute path of file
         """
-        self.file = open(file, 'rb')
+        self.file = open(file, 'r', encoding='utf-8')
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         if self.file:
@@ -184,6 +179,8 @@ class TextHandler(FileHandler):
     def get_preview_doc(self, from_page: int = 0, to_page: int = 4):
         """
         get a piece of original file
+        the text is read by chunks of doubled size and rendered again until there is a page after to_page,
+        so that the pages of preview are complete, the cost is proportional to the preview instead of the book
         :param from_page: int
         :param to_page: int
         :return: str, file path
@@ -191,14 +188,19 @@ class TextHandler(FileHandler):
         file_name = f'{self.get_file_name()}.pdf'
         file_path = os.path.join(settings.TEMPORARY_ROOT, file_name)
 
-        content = b''
-        chunk_size = 512
-        chunk = self.file.readline(chunk_size)
-        while chunk:
-            content += chunk
-            chunk = self.file.readline(chunk_size)
-
-        HTML(string=content.decode()).write_pdf(file_path)
+        parts = []
+        size = self.chunk_size
+        document = None
+        while True:
+            chunk = self.file.read(size)
+            if chunk or document is None:
+                parts.append(chunk)
+                document = HTML(string=''.join(parts)).render()
+            if not chunk or len(document.pages) > to_page + 1:
+                break
+            size *= 2
+
+        document.copy(document.pages[:to_page + 1]).write_pdf(file_path)
 
         try:
             pdf_handler = PDFHandler(file_path)
@@ -1,5 +1,6 @@
 class FileServiceConfig:
     APP = 'file-service'
     TASK_UPLOAD_FILE = 'upload_file'
+    TASK_UPLOAD_PAGES = 'upload_pages'
     TASK_GET_FILE_URLS = 'get_file_urls'
     TASK_DOWNLOAD_FILE = 'download_file'
@@ -16,17 +16,26 @@ class FileServiceConnector(CeleryConnector):
         result = self.send_async_task(FileServiceConfig.TASK_UPLOAD_FILE, (file_path,))
         return result
 
+    def upload_pages(self, file_path: str, pages_per_object: int):
+        result = self.send_async_task(FileServiceConfig.TASK_UPLOAD_PAGES, (file_path, pages_per_object))
+        return result
+
     def get_file_urls(self, cids: list):
         urls = self.send_task(FileServiceConfig.TASK_GET_FILE_URLS, (cids,))
         return urls
 
-    def download_file(self, cid: str, key: str, file_type: str):
+    @staticmethod
+    def get_download_path(file_type: str):
         filename = f'{uuid.uuid4().hex}.{file_type}.bin'
         if not os.path.exists(settings.BOOK_ROOT):
             os.mkdir(settings.BOOK_ROOT)
-        file_path = os.path.join(settings.BOOK_ROOT, filename)
-        res = self.send_task(FileServiceConfig.TASK_DOWNLOAD_FILE, (file_path, cid, key))
-        # remove encrypted file
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        return res
+        return os.path.join(settings.BOOK_ROOT, filename)
+
+    def download_file_async(self, cid: str, key: str, file_type: str, name: str = None):
+        """
+        :param name: str, the file name in the directory of cid, e.g. a page object of a paged book
+        :return: str, task id or None, the result of task is {path, sha256} of decrypted file
+        """
+        file_path = self.get_download_path(file_type)
+        result = self.send_async_task(FileServiceConfig.TASK_DOWNLOAD_FILE, (file_path, cid, key, name, True))
+        return None if result is None else result.id
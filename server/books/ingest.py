@@ -0,0 +1,280 @@
+import logging
+import os
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core.files import File
+from django.db.models import F
+from django.db.transaction import atomic
+from django.utils import timezone
+from ebooklib import epub
+from weasyprint import HTML
+from utils.enums import BookStatus, CeleryTaskStatus, StorageMode
+from .file_handler import FileHandlerFactory
+from .file_service_connector import FileServiceConnector
+from .models import Book, Preview, EncryptionKey
+
+logger = logging.getLogger(__name__)
+
+
+def upload_pdf(obj_book: Book) -> dict:
+    """
+    send the upload task of a book
+    :return: dict, the fields of book to be updated
+    """
+    file_service_connector = FileServiceConnector()
+    # revoke old task
+    if obj_book.task_id:
+        file_service_connector.revoke_task(obj_book.task_id)
+    # start a new task
+    logger.info(f'pdf path -> {obj_book.file.path}')
+    storage_mode = obj_book.storage_mode
+    if storage_mode == StorageMode.PAGED.value and obj_book.type != 'pdf':
+        # only pdf can be split into pages
+        storage_mode = StorageMode.FILE.value
+    if storage_mode == StorageMode.PAGED.value:
+        pages_per_object = settings.BOOK_PAGES_PER_OBJECT
+        result = file_service_connector.upload_pages(obj_book.file.path, pages_per_object)
+    else:
+        pages_per_object = 0
+        result = file_service_connector.upload_file(obj_book.file.path)
+    if not result:
+        raise RuntimeError('Fail to send the upload task')
+    return {'task_id': result.task_id, 'storage_mode': storage_mode, 'pages_per_object': pages_per_object}
+
+
+def html_to_epub(obj_book: Book):
+    if obj_book.draft:
+        if not os.path.exists(settings.TEMPORARY_ROOT):
+            os.makedirs(settings.TEMPORARY_ROOT)
+
+        filename = f'{uuid.uuid4().hex}.epub'
+        filepath = os.path.join(settings.TEMPORARY_ROOT, filename)
+
+        book = epub.EpubBook()
+        book.set_title(obj_book.draft.title)
+        book.add_author(obj_book.author.name)
+        book.set_cover('cover.jpg', obj_book.cover.open('rb').read())
+
+        # cover = epub.EpubHtml(title='Cover', file_name='cover-page.xhtml')
+        # cover.set_content('<p><img src="cover.jpg" alt="cover image"/></p>')
+
+        # title = epub.EpubHtml(title='Title', file_name='title-page.xhtml')
+        # title.set_content(f'<h1>{obj_book.draft.title}</h1>')
+
+        content = epub.EpubHtml(title='Content', file_name='content-page.xhtml')
+        content.set_content(obj_book.draft.content)
+
+        # book.add_item(cover)
+        # book.add_item(title)
+        book.add_item(content)
+
+        book.toc = (epub.Link('content-page.xhtml', 'Content', 'content'),)
+        book.add_item(epub.EpubNcx())
+        book.add_item(epub.EpubNav())
+
+        # define CSS style
+        style = '''
+            body, p {
+                word-break: break-word;
+                width: 100%;
+                overflow-wrap: break-word;
+                word-wrap: break-word;
+                -ms-word-break: break-all;
+                -ms-hyphens: auto;
+                -moz-hyphens: auto;
+                -webkit-hyphens: auto;
+                hyphens: auto;
+            }
+        '''
+        nav_css = epub.EpubItem(uid="style_base", file_name="style/base.css", media_type="text/css", content=style)
+
+        # add CSS file
+        book.add_item(nav_css)
+
+        book.spine = ['cover', 'nav', content]
+        epub.write_epub(filepath, book)
+
+        try:
+            with open(filepath, 'rb') as f:
+                obj_book.file.save(f'{obj_book.draft.title}.epub', File(f), save=False)
+        finally:
+            os.remove(filepath)
+
+
+def html_to_pdf(obj_book: Book):
+    if obj_book.draft:
+        filename = f'{uuid.uuid4().hex}.pdf'
+        filepath = os.path.join(settings.TEMPORARY_ROOT, filename)
+        HTML(string=obj_book.draft.content).write_pdf(filepath)
+        try:
+            with open(filepath, 'rb') as f:
+                obj_book.file.save(f'{obj_book.draft.title}.pdf', File(f), save=False)
+        finally:
+            os.remove(filepath)
+
+
+class BookIngest:
+    """
+    Ingest a book in the background, the api only saves the file or draft and returns.
+    A book goes through the stages by Book.status:
+        stored -> converted, a draft is converted to epub
+        converted -> previewed, the preview is rendered and the pages are counted
+        previewed -> uploading, the upload task is sent to the file service
+        uploading -> uploaded, the file service pushes the result of upload task, see books.task_events
+    Stages are run by the scheduler. A failed stage is retried on its own with backoff until max_attempts, its
+    error is kept in Book.ingest_error. A new file bumps Book.ingest_revision and restarts the pipeline, the result
+    of a stage is only saved if the revision is not changed while it is running.
+    """
+    max_attempts = 3
+    # seconds, doubled per attempt
+    backoff = 30
+    # the number of books per run
+    batch_size = 10
+    # seconds, an uploading book is reconciled with the result backend if no event is received in time
+    reconcile_after = 60
+    # the number of uploading books per reconciliation
+    reconcile_batch_size = 50
+
+    def __init__(self, book: Book):
+        self.book = book
+        # stage -> (handler, next stage)
+        self.stages = {
+            BookStatus.STORED.value: (self.convert, BookStatus.CONVERTED.value),
+            BookStatus.CONVERTED.value: (self.preview, BookStatus.PREVIEWED.value),
+            BookStatus.PREVIEWED.value: (self.upload, BookStatus.UPLOADING.value)
+        }
+
+    @classmethod
+    def reset(cls, book: Book):
+        """
+        restart the pipeline for a new file or draft
+        """
+        Book.objects.filter(id=book.id).update(status=BookStatus.STORED.value,
+                                               ingest_revision=F('ingest_revision') + 1, ingest_attempts=0,
+                                               ingest_error='', updated_at=timezone.now())
+        book.refresh_from_db(fields=['status', 'ingest_revision', 'ingest_attempts', 'ingest_error', 'updated_at'])
+
+    @classmethod
+    def retry(cls, book: Book):
+        """
+        retry the current stage of a book which is failed max_attempts times
+        """
+        Book.objects.filter(id=book.id).update(ingest_attempts=0, ingest_error='', updated_at=timezone.now())
+
+    def _update(self, **fields) -> bool:
+        fields['updated_at'] = timezone.now()
+        return Book.objects.filter(id=self.book.id, ingest_revision=self.book.ingest_revision).update(**fields) > 0
+
+    def convert(self) -> dict:
+        if not self.book.draft:
+            return {}
+        html_to_epub(self.book)
+        return {'file': self.book.file.name, 'type': 'epub'}
+
+    def preview(self) -> dict:
+        f_handler = FileHandlerFactory(self.book.type, self.book.file.path)
+        obj_preview, created = Preview.objects.get_or_create(book=self.book)
+        if not created and obj_preview.file:
+            obj_preview.file.delete()
+        pre_file = f_handler.get_preview_doc(from_page=obj_preview.start_page - 1,
+                                             to_page=obj_preview.start_page + obj_preview.n_pages - 2)
+        obj_preview.file = pre_file
+        obj_preview.save()
+        return {'n_pages': f_handler.get_pages()}
+
+    def upload(self) -> dict:
+        return upload_pdf(self.book)
+
+    def run(self) -> bool:
+        """
+        run the current stage of book
+        :return: bool, True if the book goes to the next stage
+        """
+        stage = self.book.status
+        handler, next_stage = self.stages[stage]
+        try:
+            fields = handler()
+        except Exception as e:
+            logger.error(f'Ingest stage {stage} of book {self.book.id} failed: {e}')
+            self._update(ingest_attempts=F('ingest_attempts') + 1, ingest_error=f'{stage}: {e}'[:255])
+            return False
+        if self._update(status=next_stage, ingest_attempts=0, ingest_error='', **fields):
+            return True
+        # a new file is ingested in the meantime
+        logger.info(f'Drop the result of stage {stage} of book {self.book.id}, the file is changed')
+        if 'file' in fields:
+            self.book.file.storage.delete(fields['file'])
+        if 'task_id' in fields:
+            FileServiceConnector().revoke_task(fields['task_id'])
+        return False
+
+    def is_due(self) -> bool:
+        if self.book.ingest_attempts == 0:
+            return True
+        delay = timedelta(seconds=self.backoff * 2 ** (self.book.ingest_attempts - 1))
+        return self.book.updated_at + delay <= timezone.now()
+
+    @classmethod
+    def watch(cls):
+        """
+        run the stages of books, a book goes through as many stages as possible
+        """
+        books = Book.objects.filter(status__in=[BookStatus.STORED.value, BookStatus.CONVERTED.value,
+                                                BookStatus.PREVIEWED.value],
+                                    ingest_attempts__lt=cls.max_attempts).order_by('updated_at')
+        for book in books[:cls.batch_size]:
+            ingest = cls(book)
+            while ingest.book.status in ingest.stages and ingest.is_due() and ingest.run():
+                ingest.book.refresh_from_db()
+
+    @classmethod
+    def finish_upload(cls, task_id: str, data: dict) -> bool:
+        """
+        save the result of a successful upload task, the original file is removed
+        :param data: dict, {cid, key, ...}
+        :return: bool, False if the task is not the upload task of any uploading book, e.g. it is handled already
+        """
+        with atomic():
+            book = Book.objects.select_for_update().filter(status=BookStatus.UPLOADING.value, task_id=task_id).first()
+            if book is None:
+                return False
+            book.status = BookStatus.UPLOADED.value
+            book.cid = data['cid']
+            if book.file:
+                book.file.delete(save=False)
+            book.save()
+            EncryptionKey.objects.update_or_create(defaults={'key': data['key']}, book=book, user=book.author)
+        logger.info(f'Book {book.id} is uploaded, cid -> {book.cid}')
+        return True
+
+    @classmethod
+    def fail_upload(cls, task_id: str, error: str) -> bool:
+        """
+        the upload task is failed after its retries, upload again by the ingest pipeline
+        """
+        return Book.objects.filter(status=BookStatus.UPLOADING.value, task_id=task_id).update(
+            status=BookStatus.PREVIEWED.value, ingest_attempts=F('ingest_attempts') + 1,
+            ingest_error=f'{BookStatus.UPLOADING.value}: {error}'[:255], updated_at=timezone.now()
+        ) > 0
+
+    @classmethod
+    def reconcile(cls):
+        """
+        check the upload tasks in the result backend for the books whose events are missed, e.g. the server is down
+        when the task is finished. Only the oldest reconcile_batch_size books are checked per run, a book whose task
+        is not finished goes to the end of the line.
+        """
+        deadline = timezone.now() - timedelta(seconds=cls.reconcile_after)
+        books = Book.objects.filter(status=BookStatus.UPLOADING.value, updated_at__lte=deadline).exclude(
+            task_id='').order_by('updated_at').only('id', 'task_id')
+        file_service_connector = FileServiceConnector()
+        for book in books[:cls.reconcile_batch_size]:
+            res = file_service_connector.get_async_result(book.task_id)
+            current_status = res.status.lower() if res is not None else ''
+            if current_status == CeleryTaskStatus.SUCCESS.value:
+                cls.finish_upload(book.task_id, res.get())
+            elif current_status == CeleryTaskStatus.FAILURE.value:
+                cls.fail_upload(book.task_id, res.result)
+            else:
+                Book.objects.filter(id=book.id, status=BookStatus.UPLOADING.value).update(updated_at=timezone.now())
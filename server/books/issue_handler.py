@@ -1,5 +1,7 @@
+from django.db import transaction
 from stores.models import Trade
 from utils.redis_handler import IssueQueue
+from utils.enums import IssueStatus
 import pytz
 from datetime import timedelta
 
@@ -9,13 +11,32 @@ class IssueHandler:
     def __init__(self, obj):
         self.obj = obj
 
+    def get_due_time(self):
+        """
+        return the time when the sale starts or ends, None if the issue is not waiting for it
+        """
+        if self.obj.status == IssueStatus.PRE_SALE.value:
+            return self.obj.published_at
+        if self.obj.status == IssueStatus.ON_SALE.value:
+            return self.obj.published_at + timedelta(minutes=self.obj.duration)
+        return None
+
+    def check_in(self):
+        """
+        queue the issue when the transaction is committed, it must not be claimed before the row is visible
+        """
+        key = str(self.obj.id)
+        score = self.get_due_time().astimezone(pytz.UTC).timestamp()
+        transaction.on_commit(lambda: IssueQueue().check_in(key, score))
+
+    def check_out(self):
+        key = str(self.obj.id)
+        transaction.on_commit(lambda: IssueQueue().check_out(key))
+
     def pre_sale(self):
         # send the issue to a queue
         print(f'pre sale, published at {self.obj.published_at}')
-        utc_time = self.obj.published_at.astimezone(pytz.UTC)
-        print(f'utc time {utc_time}')
-        que = IssueQueue()
-        que.check_in(str(self.obj.id), utc_time.timestamp())
+        self.check_in()
 
     def on_sale(self):
         Trade.objects.update_or_create(user=self.obj.book.author, issue=self.obj, defaults={
@@ -24,9 +45,7 @@ class IssueHandler:
             'price': self.obj.price
         })
         # set timer for ending the sale
-        end_time = self.obj.published_at + timedelta(minutes=self.obj.duration)
-        utc_time = end_time.astimezone(pytz.UTC)
-        IssueQueue().check_in(str(self.obj.id), utc_time.timestamp())
+        self.check_in()
 
     def off_sale(self):
         # # destroy unsold books by calling smart contract
@@ -38,11 +57,11 @@ class IssueHandler:
         # self.obj.save()
         # delete trade
         Trade.objects.filter(user=self.obj.book.author, issue=self.obj, first_release=True).delete()
-        IssueQueue().check_out()
+        self.check_out()
 
     def unsold(self):
         Trade.objects.filter(user=self.obj.book.author, issue=self.obj, first_release=True).delete()
-        IssueQueue().check_out()
+        self.check_out()
 
     def handle(self):
         _status = self.obj.status
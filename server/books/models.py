@@ -1,7 +1,7 @@
 from django.db import models
 from utils.models import BaseModel
 from stores.models import Trade
-from utils.enums import IssueStatus, BlockChainType, CeleryTaskStatus
+from utils.enums import IssueStatus, BlockChainType, BookStatus, StorageMode
 from django.conf import settings
 from django.core.files.storage import FileSystemStorage
 from django.core.validators import MinValueValidator, MaxValueValidator
@@ -39,15 +39,26 @@ class Book(BaseModel):
     n_pages = models.IntegerField(blank=True, default=0, verbose_name='书籍总页数')
     # NFTStorage id
     cid = models.CharField(max_length=150, blank=True, default='', verbose_name='NFT asset id')
-
-    status = models.CharField(max_length=50, choices=CeleryTaskStatus.choices(),
-                              default=CeleryTaskStatus.PENDING.value, verbose_name='File upload status')
-    # celery task status
-    task_id = models.CharField(max_length=50, blank=True, default='', verbose_name='Celery task id')
+    # file: the book is one encrypted file; paged: every pages_per_object pages are an encrypted pdf in the directory cid
+    storage_mode = models.CharField(max_length=15, choices=StorageMode.choices(), default=StorageMode.FILE.value,
+                                    verbose_name='存储模式')
+    pages_per_object = models.IntegerField(blank=True, default=0, verbose_name='每个对象的页数')
+
+    # the stage of ingest pipeline, see books.ingest.BookIngest
+    status = models.CharField(max_length=50, choices=BookStatus.choices(),
+                              default=BookStatus.STORED.value, verbose_name='File upload status')
+    # upload task
+    task_id = models.CharField(max_length=50, blank=True, default='', db_index=True, verbose_name='Celery task id')
+    # increased when a new file is ingested, the results of stages for an old file are dropped
+    ingest_revision = models.IntegerField(blank=True, default=0, verbose_name='Ingest revision')
+    # the number of failures of current stage
+    ingest_attempts = models.IntegerField(blank=True, default=0, verbose_name='Ingest attempts')
+    ingest_error = models.CharField(max_length=255, blank=True, default='', verbose_name='Ingest error')
 
     class Meta:
         # UnorderedObjectListWarning
         ordering = ['-updated_at']
+        indexes = [models.Index(fields=['author', 'updated_at'], name='book_author_updated_idx')]
         verbose_name = '书籍'
         verbose_name_plural = verbose_name
 
@@ -110,6 +121,8 @@ class Issue(BaseModel):
 
     class Meta:
         ordering = ['-updated_at']
+        # the key of the cursor pagination
+        indexes = [models.Index(fields=['updated_at', 'id'], name='issue_updated_id_idx')]
         verbose_name = '书籍出版'
         verbose_name_plural = verbose_name
 
@@ -118,8 +131,9 @@ class Issue(BaseModel):
 
     @property
     def token(self):
+        # cached by select_related('token_issue')
         try:
-            return Token.objects.get(issue=self)
+            return self.token_issue
         except Token.DoesNotExist:
             return None
 
@@ -133,6 +147,7 @@ class Bookmark(BaseModel):
 
     class Meta:
         ordering = ['id', 'user', 'issue']
+        constraints = [models.UniqueConstraint(fields=['user', 'issue'], name='unique_bookmark_user_issue')]
         verbose_name = '书签'
         verbose_name_plural = verbose_name
 
@@ -174,6 +189,8 @@ class Asset(BaseModel):
 
     class Meta:
         ordering = ['-updated_at']
+        constraints = [models.UniqueConstraint(fields=['user', 'issue'], name='unique_asset_user_issue')]
+        indexes = [models.Index(fields=['user', 'updated_at'], name='asset_user_updated_idx')]
         verbose_name = '个人资产'
         verbose_name_plural = verbose_name
 
@@ -224,6 +241,8 @@ class Wishlist(BaseModel):
 
     class Meta:
         ordering = ['-updated_at']
+        constraints = [models.UniqueConstraint(fields=['user', 'issue'], name='unique_wishlist_user_issue')]
+        indexes = [models.Index(fields=['user', 'updated_at'], name='wishlist_user_updated_idx')]
         verbose_name = '心愿单'
         verbose_name_plural = verbose_name
 
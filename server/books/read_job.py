@@ -0,0 +1,174 @@
+import logging
+import channels.layers
+from asgiref.sync import async_to_sync
+from utils.blob_cache import BlobCache
+from utils.redis_accessor import RedisAccessor
+from .file_service_connector import FileServiceConnector
+from . import models
+
+
+class ReadJob:
+    """
+    Prepare a book for reading in the background.
+    A job downloads and decrypts a book by the file service and puts it into the blob cache, it is keyed by the
+    book cid, so readers of the same book share one job. A book in paged storage mode is read by objects of
+    pages, the job of an object is keyed by {cid}-{index}. The state of a job is kept in redis:
+        - read-job:{job}, hash, task_id, file_type and status
+        - read-job:{job}:readers, set, 'user_id:asset_id' to be notified when the job is done
+        - read-jobs, set, pending jobs
+    A job is done by whoever checks it first after its task is finished, the reader polling or the scheduler,
+    then readers are notified over the notification websocket.
+    """
+    PENDING = 'pending'
+    READY = 'ready'
+    FAILURE = 'failure'
+
+    prefix = 'read-job'
+    pending_key = 'read-jobs'
+    # a job is given up if it is not done in time
+    expire_time = 3600
+    # the failure is kept for a while so that the reader can see it
+    failure_expire_time = 60
+
+    def __init__(self, book: models.Book, index: int = None):
+        """
+        :param book: Book
+        :param index: int, the index of page object if the book is in paged storage mode
+        """
+        self.book = book
+        self.index = index
+        self.job = book.cid if index is None else f'{book.cid}-{index}'
+        self.conn = RedisAccessor().conn
+        self.cache = BlobCache()
+        self.key = f'{self.prefix}:{self.job}'
+        self.readers_key = f'{self.key}:readers'
+        self.logger = logging.getLogger(__name__)
+
+    def get_file_type(self) -> str:
+        return self.book.type if self.index is None else 'pdf'
+
+    def get_object_name(self) -> [str, None]:
+        """
+        :return: str, the file name of page object in the directory of cid, the same as the file service
+        """
+        return None if self.index is None else f'{self.index:05d}.pdf.bin'
+
+    def get_state(self) -> dict:
+        return {k.decode(): v.decode() for k, v in self.conn.hgetall(self.key).items()}
+
+    def start(self, asset: models.Asset) -> dict:
+        """
+        start a job if the book is not cached, it returns immediately
+        :param asset: the asset of reader
+        :return: dict, {'status', 'path'} if ready else {'status', 'job'}
+        """
+        path = self.cache.get(self.job)
+        if path is not None:
+            return {'status': self.READY, 'path': path}
+
+        state = self.check()
+        if state['status'] != self.PENDING:
+            return state
+
+        pipe = self.conn.pipeline()
+        pipe.sadd(self.readers_key, f'{asset.user.id}:{asset.id}')
+        pipe.expire(self.readers_key, self.expire_time)
+        pipe.execute()
+        # only the first reader sends the task
+        if self.conn.hsetnx(self.key, 'status', self.PENDING):
+            self.conn.expire(self.key, self.expire_time)
+            try:
+                encryption_key = models.EncryptionKey.objects.get(user=self.book.author, book=self.book)
+                task_id = FileServiceConnector().download_file_async(self.book.cid, encryption_key.key,
+                                                                     self.get_file_type(), self.get_object_name())
+                if task_id is None:
+                    raise RuntimeError('Fail to send the download task')
+            except Exception as e:
+                self.logger.error(f'Exception when calling ReadJob->start: {e}')
+                self.conn.delete(self.key)
+                raise
+            pipe = self.conn.pipeline()
+            pipe.hset(self.key, mapping={'task_id': task_id, 'file_type': self.get_file_type()})
+            pipe.sadd(self.pending_key, self.job)
+            pipe.execute()
+        return {'status': self.PENDING, 'job': self.job}
+
+    def check(self) -> dict:
+        """
+        :return: dict, the state of job, the job is done if its task is finished
+        """
+        state = self.get_state()
+        if not state:
+            self.conn.srem(self.pending_key, self.job)
+            return {'status': self.PENDING, 'job': self.job}
+        if state['status'] == self.FAILURE:
+            # the next reader starts a new job
+            self.conn.delete(self.key)
+            return {'status': self.FAILURE, 'job': self.job}
+        if 'task_id' not in state:
+            return {'status': self.PENDING, 'job': self.job}
+
+        result = FileServiceConnector().get_async_result(state['task_id'])
+        if result is None or not result.ready():
+            return {'status': self.PENDING, 'job': self.job}
+        # only one process does the job
+        if not self.conn.hsetnx(self.key, 'done', 1):
+            return {'status': self.PENDING, 'job': self.job}
+
+        try:
+            if not result.successful():
+                raise RuntimeError(result.result)
+            downloaded = result.get()
+            # the path only, from a file service without with_hash
+            if isinstance(downloaded, str):
+                downloaded = {'path': downloaded, 'sha256': None}
+            path = self.cache.put(self.job, downloaded['path'], state['file_type'], downloaded['sha256'])
+            status = self.READY
+            self.conn.delete(self.key)
+        except Exception as e:
+            self.logger.error(f'Read job {self.job} of book {self.book.id} failed: {e}')
+            path = None
+            status = self.FAILURE
+            pipe = self.conn.pipeline()
+            pipe.hset(self.key, 'status', status)
+            pipe.expire(self.key, self.failure_expire_time)
+            pipe.execute()
+        self.conn.srem(self.pending_key, self.job)
+        self.notify(status)
+        return {'status': status, 'path': path} if path else {'status': status, 'job': self.job}
+
+    def notify(self, status: str):
+        readers = self.conn.smembers(self.readers_key)
+        self.conn.delete(self.readers_key)
+        layer = channels.layers.get_channel_layer()
+        for reader in readers:
+            user_id, asset_id = reader.decode().split(':')
+            try:
+                async_to_sync(layer.group_send)(
+                    f'notification_{user_id}',
+                    {
+                        "type": "notify",
+                        "message": {'type': 'read', 'asset': int(asset_id), 'job': self.job, 'status': status}
+                    }
+                )
+            except Exception as e:
+                self.logger.error(f'Fail to notify user {user_id}: {e}')
+
+    @classmethod
+    def watch(cls):
+        """
+        check all pending jobs, readers are notified even if they do not poll
+        """
+        conn = RedisAccessor().conn
+        jobs = [job.decode() for job in conn.smembers(cls.pending_key)]
+        # cid is base32, there is no '-' in it
+        parsed = {job: job.partition('-') for job in jobs}
+        books = {book.cid: book for book in
+                 models.Book.objects.filter(cid__in={cid for cid, _, _ in parsed.values()})}
+        for job, (cid, _, index) in parsed.items():
+            if cid in books:
+                cls(books[cid], int(index) if index else None).check()
+        # the books are removed
+        missing = [job for job, (cid, _, _) in parsed.items() if cid not in books]
+        if missing:
+            conn.srem(cls.pending_key, *missing)
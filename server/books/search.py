@@ -0,0 +1,137 @@
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.models import Case, IntegerField, When
+from rest_framework.filters import SearchFilter
+
+
+class BookSearch:
+    """
+    Full-text index of books over title, desc and the name of author, one row per book.
+    MySQL: an InnoDB table with a FULLTEXT index (ngram parser for CJK).
+    SQLite: a FTS5 table (trigram tokenizer), rowid is the book id.
+    The table is created after migrations and updated by the receivers of books and users.
+    """
+    table = 'books_search'
+    # the length of the shortest token which can be matched by the index
+    min_token_length = {'mysql': 2, 'sqlite': 3}
+
+    CREATE_SQL = {
+        'mysql': f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                book_id BIGINT NOT NULL PRIMARY KEY,
+                title VARCHAR(150) NOT NULL,
+                `desc` TEXT NOT NULL,
+                author_name VARCHAR(150) NOT NULL,
+                FULLTEXT KEY {table}_fulltext (title, `desc`, author_name) WITH PARSER ngram
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+        'sqlite': f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(title, "desc", author_name, tokenize='trigram')
+        """
+    }
+    UPSERT_SQL = {
+        'mysql': f'REPLACE INTO {table} (book_id, title, `desc`, author_name) VALUES (%s, %s, %s, %s)',
+        'sqlite': f'INSERT OR REPLACE INTO {table} (rowid, title, "desc", author_name) VALUES (%s, %s, %s, %s)'
+    }
+    DELETE_SQL = {
+        'mysql': f'DELETE FROM {table} WHERE book_id = %s',
+        'sqlite': f'DELETE FROM {table} WHERE rowid = %s'
+    }
+    RENAME_SQL = {
+        'mysql': f'UPDATE {table} SET author_name = %s WHERE author_name <> %s AND book_id IN '
+                 f'(SELECT id FROM books_book WHERE author_id = %s)',
+        'sqlite': f'UPDATE {table} SET author_name = %s WHERE author_name <> %s AND rowid IN '
+                  f'(SELECT id FROM books_book WHERE author_id = %s)'
+    }
+    SEARCH_SQL = {
+        'mysql': f'SELECT book_id FROM {table} WHERE MATCH(title, `desc`, author_name) AGAINST (%s IN BOOLEAN MODE) '
+                 f'ORDER BY MATCH(title, `desc`, author_name) AGAINST (%s IN BOOLEAN MODE) DESC LIMIT %s',
+        'sqlite': f'SELECT rowid FROM {table} WHERE {table} MATCH %s ORDER BY rank LIMIT %s'
+    }
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.connection = connections[using]
+        self.vendor = self.connection.vendor
+
+    @property
+    def supported(self) -> bool:
+        return self.vendor in self.CREATE_SQL
+
+    def _execute(self, sql: dict, params, many=False):
+        if not self.supported:
+            return
+        with self.connection.cursor() as cursor:
+            if many:
+                cursor.executemany(sql[self.vendor], params)
+            else:
+                cursor.execute(sql[self.vendor], params)
+
+    def setup(self):
+        self._execute(self.CREATE_SQL, [])
+
+    @staticmethod
+    def get_document(book) -> list:
+        return [book.id, book.title, book.desc, book.author.name]
+
+    def index(self, book):
+        self._execute(self.UPSERT_SQL, self.get_document(book))
+
+    def index_many(self, books):
+        """
+        :param books: iterable of books with select_related('author')
+        """
+        self._execute(self.UPSERT_SQL, [self.get_document(book) for book in books], many=True)
+
+    def remove(self, book_id):
+        self._execute(self.DELETE_SQL, [book_id])
+
+    def rename_author(self, user):
+        # a no-op if the name is not changed
+        self._execute(self.RENAME_SQL, [user.name, user.name, user.id])
+
+    def get_query(self, terms: list):
+        """
+        every term is required, return None if any of them is too short for the index
+        """
+        if not terms or any(len(term) < self.min_token_length[self.vendor] for term in terms):
+            return None
+        if self.vendor == 'mysql':
+            return ' '.join(f'+"{term}"' for term in terms)
+        return ' AND '.join(f'"{term}"' for term in terms)
+
+    def search(self, terms: list, limit: int = None):
+        """
+        :return: the ids of matched books ordered by relevance, None if the terms cannot be searched by the index
+        """
+        if not self.supported:
+            return None
+        terms = [term.replace('"', '') for term in terms]
+        terms = [term for term in terms if term]
+        query = self.get_query(terms)
+        if query is None:
+            return None
+        limit = limit or settings.SEARCH_MAX_RESULTS
+        params = [query, query, limit] if self.vendor == 'mysql' else [query, limit]
+        with self.connection.cursor() as cursor:
+            cursor.execute(self.SEARCH_SQL[self.vendor], params)
+            return [row[0] for row in cursor.fetchall()]
+
+
+class IssueSearchFilter(SearchFilter):
+    """
+    Search issues by the full-text index of their books, ordered by relevance.
+    The terms which are too short for the index fall back to the icontains lookups of search_fields.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        book_ids = BookSearch(queryset.db).search(terms)
+        if book_ids is None:
+            return super().filter_queryset(request, queryset, view)
+        if not book_ids:
+            return queryset.none()
+        rank = Case(*[When(book_id=book_id, then=i) for i, book_id in enumerate(book_ids)],
+                    output_field=IntegerField())
+        return queryset.filter(book_id__in=book_ids).order_by(rank, '-updated_at')
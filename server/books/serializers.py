@@ -4,9 +4,9 @@ from users.models import User
 from users.serializers import UserRelatedField
 from stores.models import Trade
 from utils.serializers import BaseSerializer, CustomPKRelatedField
-from utils.enums import CeleryTaskStatus, BlockChainType
+from utils.enums import BookStatus, BlockChainType, StorageMode
 from rest_framework.validators import UniqueValidator, UniqueTogetherValidator
-from django.db.models import Max, Min, Sum
+from django.db.models import Count, Exists, Max, Min, OuterRef, Prefetch, Subquery, Sum
 from django.contrib.auth.models import AnonymousUser
 from django.forms.models import model_to_dict
 from django.utils import timezone
@@ -39,21 +39,27 @@ class BookSerializer(BaseSerializer):
     cover_url = serializers.SerializerMethodField(read_only=True)
 
     status = serializers.ReadOnlyField()
+    ingest_error = serializers.ReadOnlyField()
     preview = serializers.SerializerMethodField(read_only=True)
     n_pages = serializers.ReadOnlyField()
     cid = serializers.ReadOnlyField()
+    storage_mode = serializers.ChoiceField(choices=StorageMode.choices(), required=False)
+    pages_per_object = serializers.ReadOnlyField()
     has_issued = serializers.SerializerMethodField(read_only=True)
 
     def get_has_issued(self, obj):
+        if hasattr(obj, 'issued'):
+            return obj.issued
+        # the reverse relation is cached if the book is loaded by its issue
         try:
-            models.Issue.objects.get(book=obj)
+            obj.issue_book
             return True
         except models.Issue.DoesNotExist:
             return False
 
     def get_preview(self, obj):
         try:
-            instance = models.Preview.objects.get(book=obj)
+            instance = obj.preview_book
             return PreviewListingSerializer(instance=instance, many=False, context=self.context).data
         except models.Preview.DoesNotExist:
             return {}
@@ -63,7 +69,7 @@ class BookSerializer(BaseSerializer):
 
     class Meta:
         model = models.Book
-        exclude = ['task_id', 'type']
+        exclude = ['task_id', 'type', 'ingest_revision', 'ingest_attempts']
 
     def validate_file(self, value):
         self._validate_file(value, ['pdf', 'epub', 'txt'], 200 * 1024 * 1024)
@@ -162,12 +168,12 @@ class PreviewListingSerializer(PreviewSerializer):
 
 class BookRelatedField(CustomPKRelatedField):
 
+    def use_pk_only_optimization(self):
+        # the book is loaded with its issue, see IssueSerializer.setup_queryset
+        return False
+
     def to_representation(self, value):
-        try:
-            obj = models.Book.objects.get(id=value.pk)
-            return BookSerializer(obj, context=self.context).data
-        except models.Book.DoesNotExist:
-            return {}
+        return BookSerializer(value, context=self.context).data
 
 
 class IssueSerializer(BaseSerializer):
@@ -201,6 +207,34 @@ class IssueSerializer(BaseSerializer):
         model = models.Issue
         fields = '__all__'
 
+    @staticmethod
+    def setup_queryset(queryset, user):
+        """
+        load the related objects and the values of getters for a page of issues in a constant number of queries,
+        the getters query by themselves if the issues are not loaded by this queryset
+        """
+        def issue_values(model, field, aggregate, **filters):
+            # group by issue, clear the default ordering which would be grouped too
+            return Subquery(model.objects.filter(issue=OuterRef('pk'), **filters).order_by().values('issue').annotate(
+                v=aggregate(field)).values('v'))
+
+        queryset = queryset.select_related('book__author', 'book__preview_book', 'token_issue').annotate(
+            min_trade_price=issue_values(Trade, 'price', Min),
+            max_trade_price=issue_values(Trade, 'price', Max),
+            n_assets=issue_values(models.Asset, 'id', Count)
+        ).prefetch_related(
+            Prefetch('trade_issue', queryset=Trade.objects.filter(first_release=True), to_attr='first_trades')
+        )
+        if user is None or not user.is_authenticated:
+            return queryset
+        return queryset.annotate(
+            wished=Exists(models.Wishlist.objects.filter(user=user, issue=OuterRef('pk'))),
+            owned_quantity=issue_values(models.Asset, 'quantity', Sum, user=user),
+            traded_quantity=issue_values(Trade, 'quantity', Sum, user=user)
+        ).prefetch_related(
+            Prefetch('bookmark_issue', queryset=models.Bookmark.objects.filter(user=user), to_attr='user_bookmarks')
+        )
+
     def validate_royalty(self, value):
         if value == 0:
             raise serializers.ValidationError('This field must be larger than 0')
@@ -213,7 +247,7 @@ class IssueSerializer(BaseSerializer):
         return value
 
     def validate_book(self, value):
-        if value.status != CeleryTaskStatus.SUCCESS.value:
+        if value.status != BookStatus.UPLOADED.value:
             raise serializers.ValidationError(
                 "It is not allowed to issue this book which has not been uploaded successfully.")
         user = self.context['request'].user
@@ -239,7 +273,10 @@ class IssueSerializer(BaseSerializer):
             return 0
 
     def get_price_range(self, obj):
-        _range = Trade.objects.filter(issue=obj).aggregate(min_price=Min('price'), max_price=Max('price'))
+        if hasattr(obj, 'min_trade_price'):
+            _range = {'min_price': obj.min_trade_price, 'max_price': obj.max_trade_price}
+        else:
+            _range = Trade.objects.filter(issue=obj).aggregate(min_price=Min('price'), max_price=Max('price'))
         if _range['min_price'] is None:
             _range['min_price'] = 0
         if _range['max_price'] is None:
@@ -259,6 +296,10 @@ class IssueSerializer(BaseSerializer):
         user = self.context['request'].user
         if isinstance(user, AnonymousUser):
             return 0
+        if hasattr(obj, 'owned_quantity'):
+            if obj.owned_quantity is None:
+                return 0
+            return obj.owned_quantity - (obj.traded_quantity or 0)
         try:
             n_assets = models.Asset.objects.get(user=user, issue=obj).quantity
             n_trades = Trade.objects.filter(user=user, issue=obj).aggregate(q=Sum('quantity'))['q']
@@ -269,12 +310,16 @@ class IssueSerializer(BaseSerializer):
             return 0
 
     def get_n_owners(self, obj):
+        if hasattr(obj, 'n_assets'):
+            return obj.n_assets or 0
         return models.Asset.objects.filter(issue=obj).count()
 
     def get_is_wished(self, obj):
         user = self.context['request'].user
         if isinstance(user, AnonymousUser):
             return False
+        if hasattr(obj, 'wished'):
+            return obj.wished
         try:
             models.Wishlist.objects.get(user=user, issue=obj)
             return True
@@ -282,6 +327,10 @@ class IssueSerializer(BaseSerializer):
             return False
 
     def get_trade(self, obj):
+        if hasattr(obj, 'first_trades'):
+            if not obj.first_trades:
+                return {}
+            return model_to_dict(obj.first_trades[0], fields=['id', 'quantity', 'price'])
         try:
             obj_trade = Trade.objects.get(issue=obj, first_release=True)
             return model_to_dict(obj_trade, fields=['id', 'quantity', 'price'])
@@ -292,6 +341,10 @@ class IssueSerializer(BaseSerializer):
         _user = self.context['request'].user
         if isinstance(_user, AnonymousUser):
             return {}
+        if hasattr(obj, 'user_bookmarks'):
+            if not obj.user_bookmarks:
+                return {}
+            return BookmarkSerializer(instance=obj.user_bookmarks[0], many=False).data
         try:
             obj_bookmark = models.Bookmark.objects.get(user=_user, issue=obj)
             return BookmarkSerializer(instance=obj_bookmark, many=False).data
@@ -309,12 +362,13 @@ class IssueSerializer(BaseSerializer):
         obj_issue = super().update(instance, validated_data)
         if token:
             token['issue'] = obj_issue
-            try:
-                obj_token = models.Token.objects.get(issue=obj_issue)
+            # update the token cached by the issue, it is serialized in the response
+            obj_token = obj_issue.token
+            if obj_token is not None:
                 for key, value in token.items():
                     setattr(obj_token, key, value)
                 obj_token.save()
-            except models.Token.DoesNotExist:
+            else:
                 models.Token.objects.create(**token)
         return obj_issue
 
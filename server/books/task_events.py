@@ -0,0 +1,89 @@
+import json
+import logging
+import socket
+import time
+import redis
+from django.conf import settings
+from django.db import close_old_connections
+from utils.enums import CeleryTaskStatus
+from utils.redis_accessor import RedisAccessor
+from .file_service_config import FileServiceConfig
+from .ingest import BookIngest
+
+logger = logging.getLogger(__name__)
+
+
+class TaskEventConsumer:
+    """
+    Consume the events of upload tasks which are pushed by the file service, see fileservice/handlers/event_handler.py.
+    The stream is read by a consumer group, an event is acked after it is handled. The events of a consumer which
+    exits before acking are read again when it restarts. A missed event is caught up by BookIngest.reconcile.
+    """
+    group = 'server'
+    tasks = {FileServiceConfig.TASK_UPLOAD_FILE, FileServiceConfig.TASK_UPLOAD_PAGES}
+
+    def __init__(self, conn: redis.Redis = None, name: str = None):
+        self.conn = conn or RedisAccessor().conn
+        self.stream = settings.TASK_EVENT_STREAM
+        self.name = name or socket.gethostname()
+        # read the pending events of this consumer first
+        self.last_id = '0'
+
+    def create_group(self):
+        try:
+            self.conn.xgroup_create(self.stream, self.group, id='0', mkstream=True)
+        except redis.ResponseError as e:
+            # BUSYGROUP Consumer Group name already exists
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    @classmethod
+    def handle(cls, event: dict) -> bool:
+        """
+        :param event: dict, {task, task_id, status, result}
+        :return: bool, True if a book is updated
+        """
+        if event.get('task') not in cls.tasks:
+            return False
+        result = json.loads(event['result'])
+        if event['status'] == CeleryTaskStatus.SUCCESS.value:
+            return BookIngest.finish_upload(event['task_id'], result)
+        if event['status'] == CeleryTaskStatus.FAILURE.value:
+            return BookIngest.fail_upload(event['task_id'], result)
+        return False
+
+    def consume(self, count: int = 10, block: int = 1000) -> int:
+        """
+        handle a batch of events
+        :param count: int, the max number of events
+        :param block: int, milliseconds to wait for new events, None not to wait
+        :return: int, the number of events
+        """
+        res = self.conn.xreadgroup(self.group, self.name, {self.stream: self.last_id}, count=count,
+                                   block=None if self.last_id == '0' else block)
+        entries = res[0][1] if res else []
+        if self.last_id == '0' and not entries:
+            # no pending events, wait for new ones
+            self.last_id = '>'
+        for event_id, fields in entries:
+            # the fields of a pending event are None if it is trimmed from the stream
+            event = {k.decode(): v.decode() for k, v in (fields or {}).items()}
+            try:
+                self.handle(event)
+            except Exception as e:
+                # the book is left to the reconciliation
+                logger.error(f'Exception when handling task event {event_id}: {e}')
+            self.conn.xack(self.stream, self.group, event_id)
+        return len(entries)
+
+    def run(self):
+        logger.info(f'Consuming task events from {self.stream} as {self.name}...')
+        self.create_group()
+        while True:
+            try:
+                if self.consume():
+                    # like the end of a request, the connection is not kept while waiting
+                    close_old_connections()
+            except redis.ConnectionError as e:
+                logger.error(f'Redis connection error when consuming task events: {e}')
+                time.sleep(1)
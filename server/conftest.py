@@ -1,3 +1,4 @@
+import fakeredis
 import pytest
 import books.models
 import users.models
@@ -5,6 +6,7 @@ from utils.enums import IssueStatus
 from rest_framework.test import APIClient
 from rest_framework.authtoken.models import Token
 from django.contrib.auth.models import Permission
+from utils import redis_accessor
 
 
 @pytest.fixture(scope='session')
@@ -12,6 +14,15 @@ def django_db_setup():
     pass
 
 
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch):
+    # the clients of utils.redis_accessor share a fake server per test, no redis server is required
+    pool = redis_accessor.MeteredConnectionPool(connection_class=fakeredis.FakeConnection,
+                                                server=fakeredis.FakeServer())
+    monkeypatch.setattr(redis_accessor, '_pool', pool)
+    return pool
+
+
 @pytest.fixture
 def default_user(db):
     obj = users.models.User.objects.create_user(username='seller', address="abcd")
@@ -55,6 +55,7 @@ INSTALLED_APPS = [
  ] + D_BOOK_APPS + THIRD_APPS
 
 MIDDLEWARE = [
+    'utils.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # cors
@@ -161,6 +162,27 @@ TEMPORARY_DIR = 'tmp'
 TEMPORARY_ROOT = os.path.join(MEDIA_ROOT, TEMPORARY_DIR)
 BOOK_DIR = 'book'
 BOOK_ROOT = os.path.join(MEDIA_ROOT, BOOK_DIR)
+# decrypted books keyed by cid, the least recently read ones are removed when the cache is over budget
+BLOB_CACHE_ROOT = os.path.join(BOOK_ROOT, 'cache')
+BLOB_CACHE_SIZE = int(os.getenv('BLOB_CACHE_SIZE_MB', 10 * 1024)) * 1024 * 1024
+# paged storage mode, the number of pages of an encrypted object
+BOOK_PAGES_PER_OBJECT = int(os.getenv('BOOK_PAGES_PER_OBJECT', 5))
+# the pages prepared around the bookmark when reading a paged book
+READ_PAGES_BEFORE = int(os.getenv('READ_PAGES_BEFORE', 2))
+READ_PAGES_AFTER = int(os.getenv('READ_PAGES_AFTER', 8))
+# the redis stream which the file service pushes the completion of upload tasks into
+TASK_EVENT_STREAM = os.getenv('TASK_EVENT_STREAM', 'file-service:task-events')
+# the max number of ranked books returned by the full-text search of issues
+SEARCH_MAX_RESULTS = int(os.getenv('SEARCH_MAX_RESULTS', 500))
+# request metrics, see utils.middleware.MetricsMiddleware
+# add the queries, redis and celery calls and response time of a request to the response headers
+METRICS_HEADERS = os.getenv('METRICS_HEADERS', str(DEBUG)).lower() in ('1', 'true')
+# log the sql of the queries / requests over the thresholds
+METRICS_SLOW_QUERY_MS = float(os.getenv('METRICS_SLOW_QUERY_MS', 100))
+METRICS_SLOW_REQUEST_MS = float(os.getenv('METRICS_SLOW_REQUEST_MS', 1000))
+METRICS_MAX_QUERIES = int(os.getenv('METRICS_MAX_QUERIES', 50))
+# the bearer token of the prometheus scraper, the metrics endpoint is closed without it unless DEBUG
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
 PREVIEW_DIR = 'previews'
 PREVIEW_DOC_ROOT = os.path.join(MEDIA_ROOT, PREVIEW_DIR)
 
@@ -22,6 +22,7 @@ from rest_framework.documentation import include_docs_urls
 
 import apis.urls
 import books.urls
+import utils.views
 from rest_swagger.views import get_swagger_view
 
 schema_view = get_swagger_view(title='D-BOOK API')
@@ -31,6 +32,8 @@ urlpatterns = [
     path('grappelli/', include('grappelli.urls')),
     path('d-book-admin/', admin.site.urls),
     path(r'api/v1/', include(apis.urls)),
+    # prometheus
+    path('metrics', utils.views.metrics),
     path('api-doc/', include_docs_urls(title='api文档')),
     # re_path(r'^api-doc$', schema_view),
     re_path(r'^api-auth/', include('rest_framework.urls', namespace='rest_framework'))
@@ -1,50 +1,47 @@
-from uuid import uuid4
-import os
-import shutil
-import zipfile
-from epubconverter.extractor import Extractor
-from epubconverter.pdf_manager import PDFManager
-from django.conf import settings
-
-
-def epub_to_pdf(filename: str, pdf_filename: str):
+from io import BytesIO
+from weasyprint import HTML, default_url_fetcher
+from weasyprint.text.fonts import FontConfiguration
+from epubconverter.reader import EpubReader
+
+
+def epub_to_pdf(filename: str, pdf_filename: str, max_pages: int = None):
+    """
+    Convert an epub to pdf in one rendering session, the documents of spine are read from the zip and rendered
+    with shared fonts, then all of their pages are written into the pdf at once.
+    :param max_pages: int, only the first max_pages pages are converted, the documents after them are not read,
+                      e.g. for a preview
+    """
     if not filename.endswith(".epub"):
         return
 
-    zip_filename = "{}.zip".format(os.path.splitext(filename)[0])
-
-    # zip file extracted directory
-    # p_dir, _ = os.path.split(filename)
-    extracted_dir = os.path.join(settings.TEMPORARY_ROOT, uuid4().hex)
-    if not os.path.exists(extracted_dir):
-        os.makedirs(extracted_dir)
-
     try:
-        # convert epub to zip
-        shutil.copyfile(filename, zip_filename)
-
-        with zipfile.ZipFile(zip_filename) as f:
-            f.extractall(extracted_dir)
-
-        extractor = Extractor(extracted_dir)
-        extractor.get_all()
-        extractor.get_html()
-        extractor.get_css()
-        extractor.get_images()
-
-        _html_files = extractor.html_files
-        _style_files = extractor.css_files
-
-        pdf = PDFManager(_html_files, _style_files, pdf_filename)
-        pdf.convert()
+        with EpubReader(filename) as reader:
+            def url_fetcher(url: str) -> dict:
+                if url.startswith('data:'):
+                    return default_url_fetcher(url)
+                return reader.fetch(url)
+
+            font_config = FontConfiguration()
+            documents = []
+            pages = []
+            for name in reader.get_spine():
+                document = HTML(file_obj=BytesIO(reader.read(name)), base_url=reader.get_url(name),
+                                url_fetcher=url_fetcher).render(font_config=font_config)
+                documents.append(document)
+                pages.extend(document.pages)
+                if max_pages is not None and len(pages) >= max_pages:
+                    pages = pages[:max_pages]
+                    break
+            if not documents:
+                raise ValueError('No document found in the spine')
+
+            with open(pdf_filename, 'wb') as f:
+                documents[0].copy(pages).write_pdf(f)
+            print(f'--- {len(documents)} documents converted to pdf, {len(pages)} pages')
 
     except Exception as e:
         print(f'Fail to convert epub to pdf, error -> {e}')
         raise
-    finally:
-        shutil.rmtree(extracted_dir)
-        if os.path.exists(zip_filename):
-            os.remove(zip_filename)
 
 
 def html_to_epub():
@@ -0,0 +1,103 @@
+from bs4 import BeautifulSoup
+from urllib.parse import quote, unquote, urldefrag
+import mimetypes
+import posixpath
+import zipfile
+
+
+class EpubReader(object):
+    """
+
+        This class reads an epub straight from its zip file, nothing is extracted to disk.
+
+        The class contains the following methods:
+
+        get_title() --- Which gets the title in the metadata.
+
+        get_spine() --- Which gets the documents in reading order.
+
+        get_url() --- Which gets the url of a document, relative links in it are resolved against this url.
+
+        fetch() --- Which reads the file of a url, only the files in the epub can be read.
+
+
+        To create an instance of this object, pass in the path of the epub file.
+
+
+    """
+    # a virtual root of the files in the epub
+    base_url = 'file:///epub/'
+
+    def __init__(self, filename):
+        self.zip_file = zipfile.ZipFile(filename)
+        self.names = set(self.zip_file.namelist())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.zip_file.close()
+
+    def read(self, name: str) -> bytes:
+        return self.zip_file.read(name)
+
+    def get_opf(self) -> str:
+        """
+        :return: str, the name of package document
+        """
+        if 'META-INF/container.xml' in self.names:
+            container = BeautifulSoup(self.read('META-INF/container.xml'), features='xml')
+            rootfile = container.find('rootfile')
+            if rootfile is not None and rootfile.get('full-path') in self.names:
+                return rootfile['full-path']
+        # the container is broken, use the first opf file
+        for name in sorted(self.names):
+            if name.endswith('.opf'):
+                return name
+        raise ValueError('No package document found in the epub')
+
+    def get_title(self) -> [str, None]:
+        tree = BeautifulSoup(self.read(self.get_opf()), features='xml')
+        # dc:title
+        title = tree.find('title')
+        if title is None:
+            return None
+        return title.get_text().strip() or None
+
+    def get_spine(self) -> list:
+        """
+        :return: list, the names of html documents in the order of spine
+        """
+        opf = self.get_opf()
+        base_dir = posixpath.dirname(opf)
+        tree = BeautifulSoup(self.read(opf), features='xml')
+        manifest = {item['id']: item for item in tree.package.manifest.find_all('item') if item.get('id')}
+        names = []
+        for itemref in tree.package.spine.find_all('itemref'):
+            item = manifest.get(itemref.get('idref'))
+            # application/xhtml+xml or text/html
+            if item is None or 'html' not in item.get('media-type', ''):
+                continue
+            name = posixpath.normpath(posixpath.join(base_dir, unquote(urldefrag(item['href'])[0])))
+            if name in self.names:
+                names.append(name)
+        return names
+
+    def get_url(self, name: str) -> str:
+        return f'{self.base_url}{quote(name)}'
+
+    def fetch(self, url: str) -> dict:
+        """
+        :param url: str, a url under base_url
+        :return: dict, {string, mime_type, redirected_url}
+        """
+        url = urldefrag(url)[0]
+        if not url.startswith(self.base_url):
+            raise ValueError(f'Only the files in the epub can be read, url -> {url}')
+        name = posixpath.normpath(unquote(url[len(self.base_url):]))
+        if name not in self.names:
+            raise ValueError(f'File not found in the epub, url -> {url}')
+        return {'string': self.read(name), 'mime_type': mimetypes.guess_type(name)[0], 'redirected_url': url}
@@ -9,3 +9,5 @@ class NotificationViewSet(BaseViewSet):
     filterset_class = filters.NotificationFilter
     permission_classes = [IsAuthenticated]
     http_method_names = ['get', 'put', 'patch', 'delete']
+    # ?cursor= for the keyset pagination
+    cursor_ordering = ('-created_at', '-id')
@@ -11,6 +11,12 @@ class Notification(BaseModel):
 
     class Meta:
         ordering = ['-created_at', '-is_read']
+        # the key of the cursor pagination
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='notification_created_id_idx'),
+            models.Index(fields=['receiver', 'is_read'], name='notification_receiver_read_idx'),
+            models.Index(fields=['receiver', 'created_at'], name='notification_receiver_idx')
+        ]
         verbose_name = '消息通知'
         verbose_name_plural = verbose_name
 
@@ -2,8 +2,14 @@
 
 python manage.py makemigrations
 
+# before the unique constraints are migrated
+python manage.py removeduplicates
+
 python manage.py migrate --fake-initial
 
+# the books which were uploaded by celery states only
+python manage.py migratebookstatus
+
 #python manage.py loaddata db_data.json
 
 python manage.py autocreatesuperuser ${ADMIN_NAME} ${ADMIN_PASSWORD} ${ADMIN_EMAIL}
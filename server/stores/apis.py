@@ -32,6 +32,8 @@ class TransactionViewSet(BaseViewSet):
     serializer_class = serializers.TransactionSerializer
     filterset_class = filters.TransactionFilter
     http_method_names = ['get', 'post']
+    # ?cursor= for the keyset pagination
+    cursor_ordering = ('-updated_at', '-id')
 
     @action(methods=['get'], detail=False, url_path='current', permission_classes=[IsAuthenticated])
     def list_current(self, request, *args, **kwargs):
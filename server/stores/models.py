@@ -15,6 +15,12 @@ class Trade(BaseModel):
 
     class Meta:
         ordering = ['-updated_at']
+        # a user can list an issue more than once, the first release of an issue is the only one
+        indexes = [
+            models.Index(fields=['issue', 'first_release'], name='trade_issue_first_release_idx'),
+            models.Index(fields=['user', 'issue'], name='trade_user_issue_idx'),
+            models.Index(fields=['updated_at'], name='trade_updated_idx')
+        ]
         verbose_name = '书籍上市'
         verbose_name_plural = verbose_name
 
@@ -41,6 +47,11 @@ class Transaction(BaseModel):
 
     class Meta:
         ordering = ['-updated_at']
+        # the key of the cursor pagination
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='transaction_updated_id_idx'),
+            models.Index(fields=['buyer', 'issue', 'status'], name='transaction_buyer_issue_idx')
+        ]
         verbose_name = '交易记录'
         verbose_name_plural = verbose_name
 
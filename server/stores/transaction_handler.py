@@ -92,7 +92,7 @@ class TransactionHandler:
         try:
             # if it's a first trade, call the smart contract to send a transaction on block chain polygon or bnb.
             if bool(self.obj.trade.first_release and self.obj.issue.n_circulations == 0):
-                with RedisLock(f'issue_first_transaction_lock_{self.obj.issue.id}'):
+                with RedisLock(f'issue_first_transaction_lock_{self.obj.issue.id}', timeout=60, auto_renew=True):
                     # if it's a first trade, call the smart contract to
                     # send a transaction on block chain polygon or bnb.
                     if bool(self.obj.trade.first_release and self.obj.issue.n_circulations == 0):
@@ -0,0 +1,64 @@
+from datetime import timedelta
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from books.models import Asset, Book, Issue
+from tests.base import config
+from users.models import Fans, User
+
+BASE_URL = f'{config["api"]}/users'
+
+
+def make_author(i, n_issues, reader):
+    author = User.objects.create_user(username=f'author{i}', address=f'author{i}', is_verified=True)
+    for j in range(n_issues):
+        book = Book.objects.create(author=author, title=f'book{j}', desc=f'book{j}', cover='covers/book.png')
+        issue = Issue.objects.create(book=book, quantity=10, price=1 + j, n_circulations=j,
+                                     published_at=timezone.now() + timedelta(days=1), duration=10)
+        Asset.objects.create(user=reader, issue=issue, quantity=1)
+    Fans.objects.create(user=reader, author=author)
+    return author
+
+
+def get_users(client):
+    with CaptureQueriesContext(connection) as ctx:
+        response = client.get(BASE_URL, {'is_verified': True, 'page_size': 100})
+    assert response.status_code == 200
+    return response.data['results'], len(ctx.captured_queries)
+
+
+def test_list_queries(auth_client_with_normal_user, normal_user):
+    make_author(0, 1, normal_user)
+    _, n_queries = get_users(auth_client_with_normal_user)
+
+    for i in range(1, 4):
+        make_author(i, 5, normal_user)
+    results, n = get_users(auth_client_with_normal_user)
+    assert len(results) == 4
+    assert n == n_queries
+
+
+def test_statistic(auth_client_with_normal_user, normal_user):
+    make_author(0, 3, normal_user)
+    User.objects.create_user(username='author1', address='author1', is_verified=True)
+    results, _ = get_users(auth_client_with_normal_user)
+    results = {item['address']: item for item in results}
+
+    # prices 1, 2, 3 and circulations 0, 1, 2
+    assert results['author0']['statistic'] == {
+        'total_volume': 8,
+        'min_price': 1,
+        'max_price': 3,
+        'total_books': 30,
+        'sales': 8,
+        'n_destroyed': 27,
+        'n_owners': 3
+    }
+    assert results['author0']['is_fans'] is True
+    assert results['author1']['statistic']['total_books'] == 0
+    assert results['author1']['is_fans'] is False
+
+    # a single user
+    response = auth_client_with_normal_user.get(f'{BASE_URL}/{results["author0"]["id"]}')
+    assert response.data['statistic'] == results['author0']['statistic']
+    assert response.data['is_fans'] is True
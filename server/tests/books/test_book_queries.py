@@ -0,0 +1,43 @@
+from datetime import timedelta
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from books.models import Book, Issue
+from tests.base import config
+
+BASE_URL = f'{config["api"]}/books'
+
+
+def make_books(author, n, n_issued):
+    for i in range(n):
+        book = Book.objects.create(author=author, title=f'book{i}', desc=f'book{i}', cover='covers/book.png')
+        if i < n_issued:
+            Issue.objects.create(book=book, quantity=10, price=1, published_at=timezone.now() + timedelta(days=1),
+                                 duration=10)
+
+
+def get_books(client):
+    with CaptureQueriesContext(connection) as ctx:
+        response = client.get(BASE_URL, {'page_size': 100})
+    assert response.status_code == 200
+    return response.data['results'], len(ctx.captured_queries)
+
+
+def test_list_queries(auth_client, default_user):
+    make_books(default_user, 2, 1)
+    _, n_queries = get_books(auth_client)
+
+    make_books(default_user, 20, 10)
+    results, n = get_books(auth_client)
+    assert n == n_queries
+    # only the books which are not issued
+    assert len(results) == 11
+    assert all(item['has_issued'] is False for item in results)
+
+
+def test_retrieve_issued(auth_client, default_user):
+    make_books(default_user, 2, 1)
+    issued = Issue.objects.get().book
+    book = Book.objects.exclude(id=issued.id).get()
+    assert auth_client.get(f'{BASE_URL}/{book.id}').status_code == 200
+    assert auth_client.get(f'{BASE_URL}/{issued.id}').status_code == 404
@@ -1,5 +1,9 @@
-from books.file_handler import EPUBHandler
+from books.file_handler import EPUBHandler, TextHandler
+from ebooklib import epub
 from pathlib import Path
+from unittest.mock import patch
+import fitz
+import math
 import os
 
 test_dir = Path(__file__).resolve().parent.parent
@@ -11,3 +15,85 @@ def test_epub_handler():
     new_path = handler.get_preview_doc(0, 20)
     assert new_path
 
+
+
+class FakeDocument:
+    """
+    a page per 100 '#'
+    """
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    def copy(self, pages):
+        return FakeDocument(pages)
+
+    def write_pdf(self, target):
+        doc = fitz.open()
+        for _ in self.pages:
+            doc.new_page()
+        doc.save(target)
+
+
+class FakeHTML:
+    rendered = []
+
+    def __init__(self, string=None, file_obj=None, **kwargs):
+        self.text = string if string is not None else file_obj.read().decode()
+
+    def render(self, **kwargs):
+        self.rendered.append(len(self.text))
+        return FakeDocument(list(range(math.ceil(self.text.count('#') / 100))))
+
+
+def test_text_handler_preview(tmp_path, settings):
+    settings.TEMPORARY_ROOT = str(tmp_path)
+    settings.PREVIEW_DOC_ROOT = str(tmp_path / 'previews')
+    file_path = tmp_path / 'book.txt'
+    # 10000 pages
+    file_path.write_text('#' * 1000000)
+
+    FakeHTML.rendered = []
+    with patch('books.file_handler.HTML', FakeHTML), patch.object(TextHandler, 'chunk_size', 200):
+        handler = TextHandler(str(file_path))
+        new_path = handler.get_preview_doc(0, 9)
+    assert fitz.open(os.path.join(settings.PREVIEW_DOC_ROOT, os.path.basename(new_path))).page_count == 10
+    # the text is read until there is a page after the preview
+    assert FakeHTML.rendered == [200, 600, 1400]
+    os.remove(os.path.join(settings.PREVIEW_DOC_ROOT, os.path.basename(new_path)))
+
+    # the book is shorter than the preview
+    file_path.write_text('#' * 250)
+    FakeHTML.rendered = []
+    with patch('books.file_handler.HTML', FakeHTML), patch.object(TextHandler, 'chunk_size', 200):
+        new_path = TextHandler(str(file_path)).get_preview_doc(0, 9)
+    assert fitz.open(os.path.join(settings.PREVIEW_DOC_ROOT, os.path.basename(new_path))).page_count == 3
+    assert FakeHTML.rendered == [200, 250]
+    os.remove(os.path.join(settings.PREVIEW_DOC_ROOT, os.path.basename(new_path)))
+
+
+def test_epub_preview(tmp_path, settings):
+    settings.TEMPORARY_ROOT = str(tmp_path)
+    settings.PREVIEW_DOC_ROOT = str(tmp_path / 'previews')
+    book = epub.EpubBook()
+    book.set_title('Simple book')
+    chapters = []
+    for i in range(30):
+        chapter = epub.EpubHtml(title=f'Chapter {i}', file_name=f'chapter-{i}.xhtml')
+        # 3 pages per chapter
+        chapter.set_content(f'<html><body><p>{"#" * 250}</p></body></html>')
+        book.add_item(chapter)
+        chapters.append(chapter)
+    book.spine = chapters
+    file_path = str(tmp_path / 'book.epub')
+    epub.write_epub(file_path, book)
+
+    FakeHTML.rendered = []
+    with patch('epubconverter.main.HTML', FakeHTML), patch('epubconverter.main.FontConfiguration'):
+        handler = EPUBHandler(file_path)
+        assert handler.get_file_name() == 'Simple-book'
+        new_path = handler.get_preview_doc(0, 9)
+    assert fitz.open(os.path.join(settings.PREVIEW_DOC_ROOT, os.path.basename(new_path))).page_count == 10
+    # only the chapters of the first 10 pages are rendered
+    assert len(FakeHTML.rendered) == 4
+    os.remove(os.path.join(settings.PREVIEW_DOC_ROOT, os.path.basename(new_path)))
@@ -0,0 +1,103 @@
+import os
+import pytest
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest.mock import patch
+from django.core.files import File
+from django.core.management import call_command
+from django.utils import timezone
+from books.models import Book, Preview
+from books.ingest import BookIngest
+from utils.enums import BookStatus, CeleryTaskStatus
+
+test_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def book(db, default_user, settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.PREVIEW_DOC_ROOT = str(tmp_path / settings.PREVIEW_DIR)
+    obj = Book(author=default_user, title='book1', desc='book1', cover='covers/book1.png')
+    with open(os.path.join(test_dir, 'output.pdf'), 'rb') as f:
+        obj.file.save('book1.pdf', File(f))
+    BookIngest.reset(obj)
+    return obj
+
+
+@patch('books.ingest.FileServiceConnector')
+def test_ingest(mock_fsc, book):
+    assert book.status == BookStatus.STORED.value
+    mock_fsc.return_value.upload_file.return_value = SimpleNamespace(task_id='task-1')
+
+    BookIngest.watch()
+    book.refresh_from_db()
+    # all stages are run at once
+    assert book.status == BookStatus.UPLOADING.value
+    assert book.n_pages == 1
+    assert book.task_id == 'task-1'
+    assert Preview.objects.get(book=book).file
+    mock_fsc.return_value.upload_file.assert_called_once_with(book.file.path)
+
+
+@patch('books.ingest.FileServiceConnector')
+def test_ingest_retry(mock_fsc, book):
+    mock_fsc.return_value.upload_file.return_value = None
+
+    BookIngest.watch()
+    book.refresh_from_db()
+    # only the failed stage is retried
+    assert book.status == BookStatus.PREVIEWED.value
+    assert book.ingest_attempts == 1
+    assert book.ingest_error.startswith(BookStatus.PREVIEWED.value)
+
+    # backoff
+    BookIngest.watch()
+    assert mock_fsc.return_value.upload_file.call_count == 1
+
+    for attempts in range(2, BookIngest.max_attempts + 1):
+        Book.objects.filter(id=book.id).update(updated_at=timezone.now() - timedelta(hours=1))
+        BookIngest.watch()
+        book.refresh_from_db()
+        assert book.ingest_attempts == attempts
+    # give up
+    Book.objects.filter(id=book.id).update(updated_at=timezone.now() - timedelta(hours=1))
+    BookIngest.watch()
+    assert mock_fsc.return_value.upload_file.call_count == BookIngest.max_attempts
+
+    BookIngest.retry(book)
+    mock_fsc.return_value.upload_file.return_value = SimpleNamespace(task_id='task-1')
+    BookIngest.watch()
+    book.refresh_from_db()
+    assert book.status == BookStatus.UPLOADING.value
+    assert book.ingest_attempts == 0
+    assert book.ingest_error == ''
+
+
+@patch('books.ingest.FileServiceConnector')
+def test_ingest_new_file(mock_fsc, book):
+    mock_fsc.return_value.upload_file.return_value = SimpleNamespace(task_id='task-1')
+    ingest = BookIngest(Book.objects.get(id=book.id))
+    # a new file is uploaded while the stage is running
+    BookIngest.reset(book)
+    assert not ingest.run()
+    book.refresh_from_db()
+    assert book.status == BookStatus.STORED.value
+
+
+def test_legacy_status(db, default_user):
+    expected = {
+        (CeleryTaskStatus.SUCCESS.value, 'task-1'): BookStatus.UPLOADED.value,
+        (CeleryTaskStatus.PENDING.value, ''): BookStatus.STORED.value,
+        (CeleryTaskStatus.FAILURE.value, ''): BookStatus.STORED.value,
+        (CeleryTaskStatus.FAILURE.value, 'task-2'): BookStatus.PREVIEWED.value,
+        (CeleryTaskStatus.STARTED.value, 'task-3'): BookStatus.UPLOADING.value,
+        (BookStatus.PREVIEWED.value, ''): BookStatus.PREVIEWED.value,
+    }
+    books = {}
+    for (status, task_id), new_status in expected.items():
+        book = Book.objects.create(author=default_user, title='book1', desc='book1', cover='covers/book1.png',
+                                   task_id=task_id)
+        Book.objects.filter(id=book.id).update(status=status)
+        books[book.id] = new_status
+    call_command('migratebookstatus')
+    assert dict(Book.objects.filter(id__in=books).values_list('id', 'status')) == books
@@ -0,0 +1,73 @@
+from datetime import timedelta
+from types import SimpleNamespace
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from books.models import Asset, Book, Issue, Preview, Token, Wishlist
+from books.serializers import IssueSerializer
+from stores.models import Trade
+from tests.base import config
+from utils.enums import BookStatus
+
+BASE_URL = f'{config["api"]}/issues'
+
+
+def make_issues(n, author, buyer):
+    for i in range(n):
+        book = Book.objects.create(author=author, title=f'book{i}', desc=f'book{i}', cover='covers/book.png',
+                                   status=BookStatus.UPLOADED.value)
+        Preview.objects.create(book=book, file='previews/book.pdf')
+        issue = Issue.objects.create(book=book, quantity=10, price=1 + i,
+                                     published_at=timezone.now() + timedelta(days=1), duration=10)
+        Token.objects.create(issue=issue)
+        Trade.objects.create(user=author, issue=issue, quantity=10, price=1 + i, first_release=True)
+        Trade.objects.create(user=buyer, issue=issue, quantity=1, price=5 + i)
+        # the bookmark is added with the asset
+        Asset.objects.create(user=buyer, issue=issue, quantity=3)
+        if i % 2 == 0:
+            Wishlist.objects.create(user=buyer, issue=issue)
+
+
+def count_queries(client) -> int:
+    with CaptureQueriesContext(connection) as ctx:
+        response = client.get(BASE_URL, {'page_size': 100})
+    assert response.status_code == 200
+    return len(ctx.captured_queries)
+
+
+def test_list_queries(auth_client_with_normal_user, default_user, normal_user):
+    make_issues(2, default_user, normal_user)
+    n_queries = count_queries(auth_client_with_normal_user)
+
+    make_issues(5, default_user, normal_user)
+    assert count_queries(auth_client_with_normal_user) == n_queries
+
+
+def test_list_values(auth_client_with_normal_user, default_user, normal_user):
+    make_issues(3, default_user, normal_user)
+    response = auth_client_with_normal_user.get(BASE_URL)
+    results = {item['id']: item for item in response.data['results']}
+    assert len(results) == 3
+
+    # the same as the getters without annotations
+    request = SimpleNamespace(user=normal_user, build_absolute_uri=lambda url: f'http://testserver{url}')
+    for issue in Issue.objects.all():
+        data = IssueSerializer(issue, context={'request': request}).data
+        item = results[str(issue.id)]
+        for field in ['price_range', 'trade', 'is_wished', 'n_owners', 'bookmark', 'n_owned', 'token']:
+            assert item[field] == data[field], field
+        assert item['book']['has_issued'] is True
+        assert item['book']['author']['id'] == default_user.id
+        assert item['book']['preview']['file_url'].endswith('previews/book.pdf')
+    item = next(iter(results.values()))
+    assert item['n_owned'] == 2
+    assert item['n_owners'] == 1
+
+
+def test_list_anonymous(client, default_user, normal_user):
+    make_issues(2, default_user, normal_user)
+    response = client.get(BASE_URL)
+    item = response.data['results'][0]
+    assert item['is_wished'] is False
+    assert item['n_owned'] == 0
+    assert item['bookmark'] == {}
@@ -0,0 +1,60 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from books.models import Book, Issue
+from books.search import BookSearch
+from tests.base import config
+
+BASE_URL = f'{config["api"]}/issues'
+
+
+def make_issue(author, title, desc):
+    book = Book.objects.create(author=author, title=title, desc=desc, cover='covers/book.png')
+    Issue.objects.create(book=book, quantity=10, price=1, published_at=timezone.now(), duration=10)
+    return book
+
+
+def search(client, term) -> list:
+    response = client.get(BASE_URL, {'search': term})
+    assert response.status_code == 200
+    return [item['book']['title'] for item in response.data['results']]
+
+
+def test_ranked(client, default_user):
+    make_issue(default_user, 'cooking', 'recipes of the python kitchen')
+    make_issue(default_user, 'python', 'python, python and python')
+    make_issue(default_user, 'history', 'rome')
+
+    assert search(client, 'python') == ['python', 'cooking']
+    # every term is required
+    assert search(client, 'python kitchen') == ['cooking']
+    assert search(client, 'nothing') == []
+    # too short for the index
+    assert search(client, 'ro') == ['history']
+
+    with CaptureQueriesContext(connection) as ctx:
+        search(client, 'python')
+    assert not any('LIKE' in query['sql'] for query in ctx.captured_queries)
+
+
+def test_updated(client, default_user):
+    default_user.name = 'alice'
+    default_user.save()
+    book = make_issue(default_user, 'python', 'snakes')
+    assert search(client, 'alice') == ['python']
+
+    book.title = 'java'
+    book.save()
+    assert search(client, 'python') == []
+    assert search(client, 'java') == ['java']
+
+    default_user.name = 'bob'
+    default_user.save()
+    assert search(client, 'alice') == []
+    assert search(client, 'bob') == ['java']
+
+    assert BookSearch().search(['snakes']) == [book.id]
+
+    Issue.objects.filter(book=book).delete()
+    book.delete()
+    assert BookSearch().search(['snakes']) == []
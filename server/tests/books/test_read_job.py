@@ -0,0 +1,139 @@
+import os
+import uuid
+import pytest
+from types import SimpleNamespace
+from unittest.mock import patch, Mock
+from books.models import Book, EncryptionKey
+from books.read_job import ReadJob
+from utils.blob_cache import BlobCache
+
+
+@pytest.fixture
+def book(db, default_user):
+    obj = Book.objects.create(author=default_user, title='book1', desc='book1', cover='covers/book1.png',
+                              cid=f'bafy{uuid.uuid4().hex}')
+    EncryptionKey.objects.create(user=default_user, book=obj, key='key')
+    return obj
+
+
+@pytest.fixture
+def read_job(book, tmp_path, settings, monkeypatch):
+    settings.BLOB_CACHE_ROOT = str(tmp_path / 'cache')
+    monkeypatch.setattr(BlobCache, 'prefix', f'test-blob-cache-{uuid.uuid4().hex}')
+    monkeypatch.setattr(ReadJob, 'prefix', f'test-read-job-{uuid.uuid4().hex}')
+    monkeypatch.setattr(ReadJob, 'pending_key', f'test-read-jobs-{uuid.uuid4().hex}')
+    job = ReadJob(book)
+    yield job
+    job.conn.delete(job.key, job.readers_key, job.pending_key, job.cache.entries_key, job.cache.lru_key,
+                    job.cache.stats_key)
+
+
+@patch.object(ReadJob, 'notify')
+@patch('books.read_job.FileServiceConnector')
+def test_read_job(mock_fsc, mock_notify, read_job, book, tmp_path):
+    mock_fsc.return_value.download_file_async.return_value = 'task-1'
+    result = mock_fsc.return_value.get_async_result.return_value
+    result.ready.return_value = False
+
+    # readers share a job
+    assert read_job.start(SimpleNamespace(id=1, user=SimpleNamespace(id=1))) == {'status': 'pending', 'job': book.cid}
+    assert read_job.start(SimpleNamespace(id=2, user=SimpleNamespace(id=2))) == {'status': 'pending', 'job': book.cid}
+    assert mock_fsc.return_value.download_file_async.call_count == 1
+    assert read_job.conn.scard(read_job.readers_key) == 2
+
+    # the scheduler does the job when the task is finished
+    downloaded = tmp_path / 'book.pdf'
+    downloaded.write_bytes(b'book')
+    result.ready.return_value = True
+    result.successful.return_value = True
+    # hashed by the file service
+    result.get.return_value = {'path': str(downloaded), 'sha256': 'hash'}
+    ReadJob.watch()
+    mock_notify.assert_called_once_with('ready')
+    assert read_job.cache._get_entry(book.cid)['sha256'] == 'hash'
+    assert not read_job.conn.exists(read_job.key)
+    assert not read_job.conn.sismember(read_job.pending_key, book.cid)
+
+    # read from cache
+    state = read_job.start(SimpleNamespace(id=1, user=SimpleNamespace(id=1)))
+    assert state['status'] == 'ready'
+    with open(state['path'], 'rb') as f:
+        assert f.read() == b'book'
+    assert mock_fsc.return_value.download_file_async.call_count == 1
+
+
+@patch.object(ReadJob, 'notify')
+@patch('books.read_job.FileServiceConnector')
+def test_read_job_failure(mock_fsc, mock_notify, read_job, book):
+    mock_fsc.return_value.download_file_async.return_value = 'task-1'
+    result = mock_fsc.return_value.get_async_result.return_value
+    result.ready.return_value = True
+    result.successful.return_value = False
+
+    reader = SimpleNamespace(id=1, user=SimpleNamespace(id=1))
+    assert read_job.start(reader)['status'] == 'pending'
+    assert read_job.check()['status'] == 'failure'
+    mock_notify.assert_called_once_with('failure')
+    # the reader polling sees the failure once, then a new job is started
+    assert read_job.start(reader)['status'] == 'failure'
+    assert read_job.start(reader)['status'] == 'pending'
+    assert mock_fsc.return_value.download_file_async.call_count == 2
+
+    # fail to send task
+    read_job.conn.delete(read_job.key)
+    mock_fsc.return_value.download_file_async.return_value = None
+    with pytest.raises(RuntimeError):
+        read_job.start(reader)
+    assert not read_job.conn.exists(read_job.key)
+
+    # no encryption key
+    EncryptionKey.objects.all().delete()
+    with pytest.raises(EncryptionKey.DoesNotExist):
+        read_job.start(reader)
+    assert not read_job.conn.exists(read_job.key)
+
+
+def test_notify(read_job, book):
+    read_job.conn.sadd(read_job.readers_key, '1:10', '2:20')
+    with patch('books.read_job.async_to_sync') as mock_ats:
+        read_job.notify('ready')
+    messages = sorted((c.args[0], c.args[1]['message']['asset']) for c in mock_ats.return_value.call_args_list)
+    assert messages == [('notification_1', 10), ('notification_2', 20)]
+    assert not read_job.conn.exists(read_job.readers_key)
+
+
+@patch.object(ReadJob, 'notify')
+@patch('books.read_job.FileServiceConnector')
+def test_read_job_paged(mock_fsc, mock_notify, read_job, book, tmp_path):
+    mock_fsc.return_value.download_file_async.side_effect = ['task-0', 'task-1']
+    results = {'task-0': Mock(), 'task-1': Mock()}
+    mock_fsc.return_value.get_async_result.side_effect = lambda task_id: results[task_id]
+    for result in results.values():
+        result.ready.return_value = False
+    reader = SimpleNamespace(id=1, user=SimpleNamespace(id=1))
+
+    # every object of pages is a separate job
+    jobs = [ReadJob(book, index) for index in range(2)]
+    assert [job.start(reader) for job in jobs] == [{'status': 'pending', 'job': f'{book.cid}-{index}'}
+                                                   for index in range(2)]
+    mock_fsc.return_value.download_file_async.assert_called_with(book.cid, 'key', 'pdf', '00001.pdf.bin')
+
+    # the first object is downloaded
+    downloaded = tmp_path / 'page.pdf'
+    downloaded.write_bytes(b'pages')
+    results['task-0'].ready.return_value = True
+    results['task-0'].successful.return_value = True
+    # the path only, from a file service without with_hash
+    results['task-0'].get.return_value = str(downloaded)
+    ReadJob.watch()
+    mock_notify.assert_called_once_with('ready')
+    assert not read_job.conn.sismember(read_job.pending_key, jobs[0].job)
+    assert read_job.conn.sismember(read_job.pending_key, jobs[1].job)
+
+    state = ReadJob(book, 0).start(reader)
+    assert state['status'] == 'ready'
+    assert state['path'] == ReadJob(book, 0).cache.get(f'{book.cid}-0')
+    with open(state['path'], 'rb') as f:
+        assert f.read() == b'pages'
+    for job in jobs:
+        job.conn.delete(job.key, job.readers_key)
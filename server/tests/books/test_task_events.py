@@ -0,0 +1,115 @@
+import json
+import os
+import fakeredis
+import pytest
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest.mock import patch
+from django.core.files import File
+from django.utils import timezone
+from books.models import Book, EncryptionKey
+from books.ingest import BookIngest
+from books.task_events import TaskEventConsumer
+from utils.enums import BookStatus
+
+test_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def book(db, default_user, settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    obj = Book(author=default_user, title='book1', desc='book1', cover='covers/book1.png',
+               status=BookStatus.UPLOADING.value, task_id='task-1')
+    with open(os.path.join(test_dir, 'output.pdf'), 'rb') as f:
+        obj.file.save('book1.pdf', File(f))
+    return obj
+
+
+@pytest.fixture
+def consumer():
+    consumer = TaskEventConsumer(fakeredis.FakeRedis(), name='test')
+    consumer.create_group()
+    # create again
+    consumer.create_group()
+    consumer.last_id = '>'
+    return consumer
+
+
+def publish(consumer, task_id, status, result, task='upload_file'):
+    consumer.conn.xadd(consumer.stream, {'task': task, 'task_id': task_id, 'status': status,
+                                         'result': json.dumps(result)})
+
+
+def test_consume(book, consumer):
+    file_path = book.file.path
+    publish(consumer, 'task-0', 'success', {'cid': 'cid-0', 'key': 'key-0'})
+    publish(consumer, 'task-1', 'success', {'cid': 'cid-1', 'key': 'key-1'})
+    publish(consumer, 'task-1', 'success', {'cid': 'cid-1', 'key': 'key-1'}, task='download_file')
+
+    assert consumer.consume(block=None) == 3
+    book.refresh_from_db()
+    assert book.status == BookStatus.UPLOADED.value
+    assert book.cid == 'cid-1'
+    assert not book.file
+    assert not os.path.exists(file_path)
+    assert EncryptionKey.objects.get(book=book, user=book.author).key == 'key-1'
+    # all events are acked
+    assert consumer.conn.xpending(consumer.stream, consumer.group)['pending'] == 0
+
+    # duplicated event
+    publish(consumer, 'task-1', 'success', {'cid': 'cid-2', 'key': 'key-2'})
+    assert consumer.consume(block=None) == 1
+    book.refresh_from_db()
+    assert book.cid == 'cid-1'
+
+
+def test_consume_failure(book, consumer):
+    publish(consumer, 'task-1', 'failure', 'RuntimeError: timeout')
+    consumer.consume(block=None)
+    book.refresh_from_db()
+    assert book.status == BookStatus.PREVIEWED.value
+    assert book.ingest_attempts == 1
+    assert book.ingest_error == 'uploading: RuntimeError: timeout'
+
+
+def test_consume_pending(book, consumer):
+    publish(consumer, 'task-1', 'success', {'cid': 'cid-1', 'key': 'key-1'})
+    # read but not acked, e.g. the consumer is killed
+    entries = consumer.conn.xreadgroup(consumer.group, consumer.name, {consumer.stream: '>'})
+
+    restarted = TaskEventConsumer(consumer.conn, name=consumer.name)
+    with patch.object(consumer.conn, 'xreadgroup', side_effect=[entries, [[consumer.stream.encode(), []]]]) as read:
+        assert restarted.consume() == 1
+        assert restarted.consume() == 0
+    # the pending events are read first
+    assert read.call_args_list[0].args[2] == {consumer.stream: '0'}
+    assert restarted.last_id == '>'
+    book.refresh_from_db()
+    assert book.status == BookStatus.UPLOADED.value
+    assert consumer.conn.xpending(consumer.stream, consumer.group)['pending'] == 0
+
+
+@patch('books.ingest.FileServiceConnector')
+def test_reconcile(mock_fsc, book, default_user):
+    pending = Book.objects.create(author=default_user, title='book2', desc='book2', cover='covers/book2.png',
+                                  status=BookStatus.UPLOADING.value, task_id='task-2')
+    results = {
+        'task-1': SimpleNamespace(status='SUCCESS', get=lambda: {'cid': 'cid-1', 'key': 'key-1'}),
+        'task-2': SimpleNamespace(status='PENDING')
+    }
+    mock_fsc.return_value.get_async_result.side_effect = results.get
+
+    # recent books wait for the events
+    BookIngest.reconcile()
+    assert not mock_fsc.return_value.get_async_result.called
+
+    old = timezone.now() - timedelta(seconds=BookIngest.reconcile_after + 1)
+    Book.objects.filter(id__in=[book.id, pending.id]).update(updated_at=old)
+    BookIngest.reconcile()
+    book.refresh_from_db()
+    pending.refresh_from_db()
+    assert book.status == BookStatus.UPLOADED.value
+    assert book.cid == 'cid-1'
+    # an unfinished task goes to the end of the line
+    assert pending.status == BookStatus.UPLOADING.value
+    assert pending.updated_at > old
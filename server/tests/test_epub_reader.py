@@ -0,0 +1,55 @@
+import pytest
+from urllib.parse import urljoin
+from ebooklib import epub
+from epubconverter.reader import EpubReader
+
+
+@pytest.fixture
+def epub_file(tmp_path):
+    book = epub.EpubBook()
+    book.set_title('Simple book')
+    book.add_author('ABC')
+
+    style = epub.EpubItem(uid='style_base', file_name='style/base.css', media_type='text/css',
+                          content='body { color: black; }')
+    book.add_item(style)
+    chapters = []
+    for i in range(3):
+        chapter = epub.EpubHtml(title=f'Chapter {i}', file_name=f'text/chapter {i}.xhtml')
+        chapter.set_content(f'<html><body><p>Chapter {i}</p></body></html>')
+        chapter.add_link(href='../style/base.css', rel='stylesheet', type='text/css')
+        book.add_item(chapter)
+        chapters.append(chapter)
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    # reading order differs from the order of manifest
+    book.spine = ['nav', chapters[2], chapters[0], chapters[1]]
+
+    path = str(tmp_path / 'book.epub')
+    epub.write_epub(path, book)
+    return path
+
+
+def test_get_spine(epub_file):
+    with EpubReader(epub_file) as reader:
+        assert reader.get_spine() == ['EPUB/nav.xhtml', 'EPUB/text/chapter 2.xhtml', 'EPUB/text/chapter 0.xhtml',
+                                      'EPUB/text/chapter 1.xhtml']
+
+
+def test_fetch(epub_file):
+    with EpubReader(epub_file) as reader:
+        url = reader.get_url('EPUB/text/chapter 0.xhtml')
+        assert b'Chapter 0' in reader.fetch(url)['string']
+
+        # relative links are resolved against the url of document
+        res = reader.fetch(urljoin(url, '../style/base.css#x'))
+        assert res['string'] == b'body { color: black; }'
+        assert res['mime_type'] == 'text/css'
+
+        # files out of the epub
+        with pytest.raises(ValueError):
+            reader.fetch('file:///etc/passwd')
+        with pytest.raises(ValueError):
+            reader.fetch(urljoin(url, '../../../../etc/passwd'))
+        with pytest.raises(ValueError):
+            reader.fetch(urljoin(url, 'missing.png'))
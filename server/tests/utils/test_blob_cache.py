@@ -0,0 +1,92 @@
+import json
+import os
+import uuid
+import pytest
+from utils.blob_cache import BlobCache
+
+
+@pytest.fixture
+def blob_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(BlobCache, 'prefix', f'test-blob-cache-{uuid.uuid4().hex}')
+    cache = BlobCache(root=str(tmp_path / 'cache'), max_size=100)
+    yield cache
+    cache.conn.delete(cache.entries_key, cache.lru_key, cache.stats_key)
+
+
+def make_file(tmp_path, size: int) -> str:
+    path = tmp_path / uuid.uuid4().hex
+    path.write_bytes(os.urandom(size))
+    return str(path)
+
+
+def test_get_and_put(blob_cache, tmp_path):
+    assert blob_cache.get('a') is None
+
+    path = blob_cache.put('a', make_file(tmp_path, 10), 'pdf')
+    # not guessable by the cid
+    assert os.path.dirname(path) == blob_cache.root
+    assert path.endswith('.pdf') and not os.path.basename(path).startswith('a')
+    assert blob_cache.get('a') == path
+    assert blob_cache.get('a') == path
+
+    stats = blob_cache.get_stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 1
+    assert stats['entries'] == 1
+    assert stats['size'] == 10
+
+
+def test_evict(blob_cache, tmp_path):
+    a = blob_cache.put('a', make_file(tmp_path, 40), 'pdf')
+    blob_cache.put('b', make_file(tmp_path, 40), 'pdf')
+    # a is used recently
+    assert blob_cache.get('a') == a
+
+    c = blob_cache.put('c', make_file(tmp_path, 40), 'pdf')
+    assert blob_cache.get('b') is None
+    assert blob_cache.get('a') == a
+    assert blob_cache.get('c') == c
+    assert sorted(os.listdir(blob_cache.root)) == sorted(os.path.basename(p) for p in [a, c])
+    assert blob_cache.get_stats()['evictions'] == 1
+    assert blob_cache.get_size() == 80
+
+    # a file over budget is kept until the next put
+    d = blob_cache.put('d', make_file(tmp_path, 200), 'pdf')
+    assert blob_cache.get('d') == d
+    assert blob_cache.get_stats()['entries'] == 1
+
+
+def test_broken_entry(blob_cache, tmp_path):
+    path = blob_cache.put('a', make_file(tmp_path, 10), 'pdf')
+    os.remove(path)
+    assert blob_cache.get('a') is None
+    assert blob_cache.get_stats()['entries'] == 0
+
+    # same size but different content
+    path = blob_cache.put('a', make_file(tmp_path, 10), 'pdf')
+    with open(path, 'wb') as f:
+        f.write(os.urandom(10))
+    os.utime(path, ns=(0, 0))
+    assert blob_cache.get('a') is None
+    assert not os.path.exists(path)
+
+
+def test_replace(blob_cache, tmp_path):
+    old = blob_cache.put('a', make_file(tmp_path, 10), 'pdf')
+    new = blob_cache.put('a', make_file(tmp_path, 10), 'pdf')
+    assert new != old
+    assert not os.path.exists(old)
+    assert blob_cache.get('a') == new
+
+
+def test_legacy_entry(blob_cache, tmp_path):
+    # the file named by the cid before
+    path = blob_cache.put('a', make_file(tmp_path, 10), 'pdf')
+    legacy = os.path.join(blob_cache.root, 'a.pdf')
+    os.rename(path, legacy)
+    entry = blob_cache._get_entry('a')
+    entry['path'] = legacy
+    blob_cache.conn.hset(blob_cache.entries_key, 'a', json.dumps(entry))
+
+    assert blob_cache.get('a') is None
+    assert not os.path.exists(legacy)
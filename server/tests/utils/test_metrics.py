@@ -0,0 +1,86 @@
+import logging
+import uuid
+import fakeredis
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from books.models import Book
+from utils import metrics
+from utils.redis_accessor import MeteredConnectionPool
+from utils.redis_handler import RequestMetricsStore
+from tests.base import config
+
+BASE_URL = f'{config["api"]}/books'
+
+
+@pytest.fixture
+def store(monkeypatch):
+    monkeypatch.setattr(RequestMetricsStore, 'name', f'test-metrics-{uuid.uuid4().hex}')
+    store = RequestMetricsStore()
+    yield store
+    store.redis.delete(store.name)
+
+
+def test_headers(auth_client, default_user, settings, store):
+    settings.METRICS_HEADERS = True
+    Book.objects.create(author=default_user, title='book1', desc='book1', cover='covers/book1.png')
+    with CaptureQueriesContext(connection) as ctx:
+        response = auth_client.get(BASE_URL)
+    assert response.status_code == 200
+    assert int(response['X-DB-Queries']) == len(ctx.captured_queries)
+    assert float(response['X-Response-Time-Ms']) >= float(response['X-DB-Time-Ms'])
+
+    settings.METRICS_HEADERS = False
+    assert 'X-DB-Queries' not in auth_client.get(BASE_URL)
+
+
+def test_totals(auth_client, client, store, settings):
+    settings.METRICS_HEADERS = True
+    queries = [int(auth_client.get(BASE_URL)['X-DB-Queries']) for _ in range(2)]
+    client.get(f'{BASE_URL}/0')
+
+    totals = store.get_totals()
+    assert totals['requests'][('books.BookViewSet', 'list', '200')] == 2
+    assert totals['queries'][('books.BookViewSet', 'list', '200')] == sum(queries)
+    assert totals['requests'][('books.BookViewSet', 'retrieve', '401')] == 1
+    assert totals['duration_seconds'][('books.BookViewSet', 'list', '200')] > 0
+
+    settings.METRICS_TOKEN = 'secret'
+    response = client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+    assert response.status_code == 200
+    text = response.content.decode()
+    assert 'dbook_http_requests_total{view="books.BookViewSet",action="list",status="200"} 2\n' in text
+    assert '# TYPE dbook_redis_pool_in_use gauge' in text
+    assert client.get('/metrics').status_code == 403
+
+
+def test_metrics_without_token(client, settings, store):
+    settings.METRICS_TOKEN = ''
+    settings.DEBUG = False
+    assert client.get('/metrics').status_code == 403
+    assert client.get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code == 403
+    settings.DEBUG = True
+    assert client.get('/metrics').status_code == 200
+
+
+def test_thresholds(auth_client, settings, store, caplog):
+    settings.METRICS_SLOW_QUERY_MS = 0
+    settings.METRICS_MAX_QUERIES = 0
+    with caplog.at_level(logging.WARNING, logger='utils.metrics'):
+        auth_client.get(BASE_URL)
+    messages = [record.getMessage() for record in caplog.records]
+    assert any(message.startswith('Slow query of books.BookViewSet.list') for message in messages)
+    # the sql of the request
+    assert any(message.startswith('books.BookViewSet.list took') and 'SELECT' in message for message in messages)
+
+
+def test_redis_calls():
+    pool = MeteredConnectionPool(connection_class=fakeredis.FakeConnection, server=fakeredis.FakeServer())
+    with metrics.track() as request_metrics:
+        pool.release(pool.get_connection('GET'))
+        metrics.incr('celery_calls')
+    assert request_metrics.redis_calls == 1
+    assert request_metrics.celery_calls == 1
+    # out of requests
+    pool.get_connection('GET')
+    assert request_metrics.redis_calls == 1
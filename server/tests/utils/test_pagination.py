@@ -0,0 +1,75 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from notifications.models import Notification
+from tests.base import config
+
+BASE_URL = f'{config["api"]}/notifications'
+
+
+def make_notifications(n, receiver):
+    Notification.objects.bulk_create([Notification(receiver=receiver, message=f'message{i}') for i in range(n)])
+    # half of them have the same created_at, the id breaks the tie
+    now = timezone.now()
+    ids = list(Notification.objects.order_by('id').values_list('id', flat=True))
+    Notification.objects.filter(id__in=ids[:n // 2]).update(created_at=now)
+    return list(Notification.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+
+def walk(client, url, key):
+    ids = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        ids.extend(item['id'] for item in response.data['results'])
+        url = response.data[key]
+    return ids
+
+
+def test_cursor_pages(auth_client, default_user):
+    expected = make_notifications(25, default_user)
+    response = auth_client.get(BASE_URL, {'cursor': '', 'page_size': 10, 'count': 'true'})
+    assert response.data['count'] == 25
+    assert response.data['previous'] is None
+    assert 'page' not in response.data
+
+    # forward
+    ids = walk(auth_client, response.data['next'], 'next')
+    assert [item['id'] for item in response.data['results']] + ids == expected
+
+    # backward from the last page
+    response = auth_client.get(BASE_URL, {'cursor': '', 'page_size': 10})
+    url = response.data['next']
+    while url:
+        last = auth_client.get(url)
+        url = last.data['next']
+    assert 'count' not in last.data
+    ids = walk(auth_client, last.data['previous'], 'previous')
+    assert len(ids) == 20
+    assert sorted(ids) == sorted(expected[:20])
+
+
+def test_cursor_queries(auth_client, default_user):
+    make_notifications(60, default_user)
+    response = auth_client.get(BASE_URL, {'cursor': '', 'page_size': 10})
+    for _ in range(4):
+        response = auth_client.get(response.data['next'])
+    with CaptureQueriesContext(connection) as ctx:
+        response = auth_client.get(response.data['next'])
+    assert len(response.data['results']) == 10
+    sql = [query['sql'] for query in ctx.captured_queries if 'notifications_notification' in query['sql']]
+    assert len(sql) == 1
+    assert 'OFFSET' not in sql[0]
+    assert 'COUNT' not in sql[0]
+
+
+def test_invalid_cursor(auth_client):
+    response = auth_client.get(BASE_URL, {'cursor': 'invalid'})
+    assert response.status_code == 404
+
+
+def test_page_number(auth_client, default_user):
+    make_notifications(3, default_user)
+    response = auth_client.get(BASE_URL)
+    assert response.data['count'] == 3
+    assert response.data['page'] == 1
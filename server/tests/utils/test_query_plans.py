@@ -0,0 +1,77 @@
+import uuid
+import pytest
+from django.db import connection
+from books.models import Asset, Book, Bookmark, Issue, Wishlist
+from notifications.models import Notification
+from stores.models import Trade, Transaction
+from users.models import Fans
+from utils.enums import TransactionStatus
+
+pytestmark = pytest.mark.skipif(connection.vendor not in ('mysql', 'sqlite'), reason='the plans of mysql and sqlite')
+
+ISSUE = uuid.uuid4()
+
+
+def explain_mysql(queryset) -> dict:
+    """
+    the row of the table of queryset in the plan, e.g. {'key': ..., 'possible_keys': ..., 'Extra': ...}
+    """
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN {sql}', params)
+        columns = [col[0] for col in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    return next(row for row in rows if row['table'] == queryset.model._meta.db_table)
+
+
+@pytest.mark.parametrize('queryset, index, search', [
+    (Asset.objects.filter(user=1, issue=ISSUE), 'unique_asset_user_issue',
+     'books_asset USING INDEX sqlite_autoindex_books_asset_1 (user_id=? AND issue_id=?)'),
+    (Bookmark.objects.filter(user=1, issue=ISSUE), 'unique_bookmark_user_issue',
+     'books_bookmark USING INDEX sqlite_autoindex_books_bookmark_1 (user_id=? AND issue_id=?)'),
+    (Wishlist.objects.filter(user=1, issue=ISSUE), 'unique_wishlist_user_issue',
+     'books_wishlist USING INDEX sqlite_autoindex_books_wishlist_1 (user_id=? AND issue_id=?)'),
+    (Fans.objects.filter(user=1, author=2), 'unique_fans_user_author',
+     'users_fans USING INDEX sqlite_autoindex_users_fans_1 (user_id=? AND author_id=?)'),
+    (Trade.objects.filter(issue=ISSUE, first_release=True), 'trade_issue_first_release_idx',
+     'stores_trade USING INDEX trade_issue_first_release_idx'),
+    (Trade.objects.filter(user=1, issue=ISSUE), 'trade_user_issue_idx',
+     'stores_trade USING INDEX trade_user_issue_idx (user_id=? AND issue_id=?)'),
+    (Transaction.objects.filter(buyer=1, issue=ISSUE, status__in=[TransactionStatus.PENDING.value,
+                                                                  TransactionStatus.SUCCESS.value]),
+     'transaction_buyer_issue_idx',
+     'stores_transaction USING INDEX transaction_buyer_issue_idx (buyer_id=? AND issue_id=? AND status=?)'),
+    # sqlite compares the boolean by NOT is_read, only the receiver is searched
+    (Notification.objects.filter(receiver=1, is_read=False), 'notification_receiver_read_idx',
+     'notifications_notification USING INDEX'),
+])
+def test_lookup(db, queryset, index, search):
+    if connection.vendor == 'mysql':
+        # the optimizer may skip the index of an empty table, it has to be a candidate at least
+        row = explain_mysql(queryset)
+        assert index in (row['possible_keys'] or '').split(','), row
+        return
+    plan = queryset.explain()
+    assert f'SEARCH {search}' in plan, plan
+
+
+@pytest.mark.parametrize('queryset, index', [
+    (Asset.objects.filter(user=1), 'asset_user_updated_idx'),
+    (Wishlist.objects.filter(user=1), 'wishlist_user_updated_idx'),
+    (Book.objects.filter(author=1), 'book_author_updated_idx'),
+    (Trade.objects.all(), 'trade_updated_idx'),
+    (Issue.objects.all(), 'issue_updated_id_idx'),
+    (Transaction.objects.all(), 'transaction_updated_id_idx'),
+    (Notification.objects.order_by('-created_at', '-id'), 'notification_created_id_idx'),
+])
+def test_ordering(db, queryset, index):
+    # ordered by the index without sorting
+    if connection.vendor == 'mysql':
+        # a page of the list
+        row = explain_mysql(queryset[:20])
+        assert row['key'] == index, row
+        assert 'filesort' not in (row['Extra'] or ''), row
+        return
+    plan = queryset.explain()
+    assert f'USING INDEX {index}' in plan, plan
+    assert 'TEMP B-TREE' not in plan, plan
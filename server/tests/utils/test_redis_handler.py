@@ -0,0 +1,118 @@
+import time
+import uuid
+import pytest
+from datetime import timedelta
+from django.utils import timezone
+from books.models import Book, Issue, Token
+from utils.enums import IssueStatus
+from utils.redis_handler import IssueQueue, IssueScheduler
+from utils.scheduled_jobs import issue_timer
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    monkeypatch.setattr(IssueQueue, 'name', f'test-issuing-list-{uuid.uuid4().hex}')
+    que = IssueQueue()
+    yield que
+    que.redis.delete(que.name, que.processing)
+
+
+def test_claim(queue):
+    now = time.time()
+    queue.check_in('a', now - 1)
+    queue.check_in('b', now + 100)
+
+    assert queue.claim() == ['a']
+    assert queue.claim() == []
+    # the lease of a
+    assert queue.get_next_time() == pytest.approx(now + queue.lease, abs=1)
+
+    queue.ack('a')
+    assert queue.get_next_time() == now + 100
+
+
+def test_claim_expired(queue):
+    queue.lease = 0
+    queue.check_in('a', time.time() - 1)
+    assert queue.claim() == ['a']
+    # the claimer dies before acking
+    assert queue.claim() == ['a']
+    queue.ack('a')
+    assert queue.claim() == []
+
+
+def test_check_out(queue):
+    queue.check_in('a', time.time() - 2)
+    queue.check_in('b', time.time() - 1)
+    queue.check_out('b')
+    assert queue.claim() == ['a']
+
+
+def test_scheduler(queue):
+    handled = []
+    scheduler = IssueScheduler(handled.extend, queue)
+    assert scheduler.get_timeout() == scheduler.max_sleep
+
+    queue.check_in('a', time.time() + 10)
+    assert 9 < scheduler.get_timeout() <= 10
+    assert scheduler.run_once() == []
+
+    queue.check_in('b', time.time() - 1)
+    assert scheduler.get_timeout() == 0
+    assert scheduler.run_once() == ['b']
+    assert handled == ['b']
+
+
+def test_wakeup(queue):
+    scheduler = IssueScheduler(list, queue)
+    scheduler.pubsub.subscribe(queue.channel)
+    scheduler.pubsub.get_message(timeout=0.1)
+
+    queue.check_in('a', time.time() + 10)
+    assert scheduler.pubsub.get_message(timeout=1) is not None
+
+
+def test_issue_timer(queue, default_user, django_capture_on_commit_callbacks):
+    book = Book.objects.create(author=default_user, title='book1', desc='book1', cover='covers/book1.png')
+    published_at = timezone.now() - timedelta(seconds=1)
+    with django_capture_on_commit_callbacks(execute=True):
+        issue = Issue.objects.create(book=book, quantity=10, price=1, published_at=published_at, duration=10)
+        # queued after the commit
+        assert queue.claim() == []
+    Token.objects.create(issue=issue)
+
+    keys = queue.claim()
+    assert keys == [str(issue.id)]
+    with django_capture_on_commit_callbacks(execute=True):
+        issue_timer(keys)
+    issue.refresh_from_db()
+    assert issue.status == IssueStatus.ON_SALE.value
+    # waiting for the end of sale
+    end_time = published_at + timedelta(minutes=10)
+    assert queue.get_next_time() == pytest.approx(end_time.timestamp())
+    assert queue.claim() == []
+
+    # the time is changed
+    Issue.objects.filter(id=issue.id).update(duration=20)
+    with django_capture_on_commit_callbacks(execute=True):
+        issue_timer([str(issue.id)])
+    issue.refresh_from_db()
+    assert issue.status == IssueStatus.ON_SALE.value
+    assert queue.get_next_time() == pytest.approx((published_at + timedelta(minutes=20)).timestamp())
+
+    # not committed, the issue is claimed again after the lease
+    key = str(uuid.uuid4())
+    queue.check_in(key, time.time() - 1)
+    assert queue.claim() == [key]
+    issue_timer([key])
+    assert queue.redis.zscore(queue.processing, key) is not None
+
+
+def test_issue_removed(queue, default_user, django_capture_on_commit_callbacks):
+    book = Book.objects.create(author=default_user, title='book1', desc='book1', cover='covers/book1.png')
+    with django_capture_on_commit_callbacks(execute=True):
+        issue = Issue.objects.create(book=book, quantity=10, price=1, published_at=timezone.now(), duration=10)
+    assert queue.claim() == [str(issue.id)]
+    with django_capture_on_commit_callbacks(execute=True):
+        issue.delete()
+    assert queue.get_next_time() is None
@@ -0,0 +1,63 @@
+import threading
+import time
+import uuid
+import pytest
+from utils.redis_accessor import RedisLock, LockTimeout
+
+
+@pytest.fixture
+def key():
+    key = f'test-lock-{uuid.uuid4().hex}'
+    yield key
+    RedisLock(key).conn.delete(key)
+
+
+def test_lock(key):
+    with RedisLock(key) as lock:
+        assert lock.conn.get(key).decode() == lock.token
+        assert not RedisLock(key).acquire(blocking=False)
+        with pytest.raises(LockTimeout):
+            with RedisLock(key, timeout=0.05):
+                pass
+    assert lock.conn.get(key) is None
+    assert RedisLock(key).acquire(blocking=False)
+
+
+def test_release_expired(key):
+    lock = RedisLock(key, lease=0.05)
+    assert lock.acquire()
+    time.sleep(0.1)
+    # the lock is expired and acquired by others
+    other = RedisLock(key)
+    assert other.acquire(blocking=False)
+    assert not lock.release()
+    assert not lock.extend()
+    assert other.conn.get(key).decode() == other.token
+
+
+def test_wait(key):
+    lock = RedisLock(key)
+    lock.acquire()
+    threading.Timer(0.1, lock.release).start()
+
+    start = time.monotonic()
+    with RedisLock(key, timeout=1):
+        waited = time.monotonic() - start
+    # acquired shortly after the release
+    assert 0.1 <= waited < 0.3
+
+
+def test_extend(key):
+    lock = RedisLock(key, lease=0.1)
+    lock.acquire()
+    assert lock.extend(10)
+    time.sleep(0.15)
+    assert not RedisLock(key).acquire(blocking=False)
+    assert lock.release()
+
+
+def test_auto_renew(key):
+    with RedisLock(key, lease=0.1, auto_renew=True):
+        time.sleep(0.3)
+        assert not RedisLock(key).acquire(blocking=False)
+    assert RedisLock(key).acquire(blocking=False)
@@ -0,0 +1,51 @@
+import os
+import fakeredis
+import pytest
+import redis
+import utils.redis_accessor as redis_accessor
+from utils.redis_accessor import MeteredConnectionPool, get_connection_pool, get_pool_stats
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = MeteredConnectionPool(max_connections=2, timeout=0.01, connection_class=fakeredis.FakeConnection,
+                                 server=fakeredis.FakeServer())
+    monkeypatch.setattr(redis_accessor, '_pool', pool)
+    return pool
+
+
+def test_shared_pool(pool):
+    assert get_connection_pool() is pool
+    conn = get_connection_pool().get_connection('SET')
+    get_connection_pool().release(conn)
+    # the connection is reused
+    assert get_connection_pool().get_connection('GET') is conn
+    get_connection_pool().release(conn)
+
+    stats = get_pool_stats()
+    assert stats['max_connections'] == 2
+    assert stats['connections'] == 1
+    assert stats['idle'] == 1
+    assert stats['in_use'] == 0
+
+
+def test_pool_limit(pool):
+    conns = [pool.get_connection('GET') for _ in range(2)]
+    assert get_pool_stats()['in_use'] == 2
+    with pytest.raises(redis.ConnectionError):
+        pool.get_connection('GET')
+    assert get_pool_stats()['timeouts'] == 1
+
+    pool.release(conns[0])
+    assert pool.get_connection('GET') is conns[0]
+
+
+def test_fork(pool, monkeypatch):
+    created = get_pool_stats()['pools_created']
+    # in a forked child
+    monkeypatch.setattr(os, 'getpid', lambda: pool.pid + 1)
+    child_pool = get_connection_pool()
+    assert child_pool is not pool
+    assert child_pool.pid == pool.pid + 1
+    assert get_connection_pool() is child_pool
+    assert get_pool_stats()['pools_created'] == created + 1
@@ -53,6 +53,7 @@ class Fans(BaseModel):
 
     class Meta:
         ordering = ['id']
+        constraints = [models.UniqueConstraint(fields=['user', 'author'], name='unique_fans_user_author')]
         verbose_name = '粉丝'
         verbose_name_plural = verbose_name
 
@@ -3,7 +3,7 @@ from rest_framework.validators import UniqueValidator, UniqueTogetherValidator
 from rest_framework.exceptions import PermissionDenied
 from .models import User, Fans
 from utils.serializers import CustomPKRelatedField
-from django.db.models import Min, Max
+from django.db.models import Count, F, FloatField, Min, Max, Sum
 from django.contrib.auth.models import AnonymousUser
 from books.models import Issue, Asset
 import logging
@@ -31,6 +31,18 @@ class UserLoginSerializer(serializers.ModelSerializer):
         fields = ['address', 'nonce', 'signature']
 
 
+class UserListSerializer(serializers.ListSerializer):
+    """
+    the statistics of a page of users are loaded at once, see UserSerializer.prepare
+    """
+
+    def to_representation(self, data):
+        users = list(data.all() if hasattr(data, 'all') else data)
+        if 'statistic' in self.child.fields:
+            self.child.prepare(users)
+        return super().to_representation(users)
+
+
 class UserSerializer(serializers.ModelSerializer):
     name = serializers.CharField(required=False, max_length=150)
     desc = serializers.CharField(required=False, max_length=1500)
@@ -53,6 +65,7 @@ class UserSerializer(serializers.ModelSerializer):
         model = User
         fields = ['id', 'address', 'name', 'desc', 'website_url', 'discord_url', 'twitter_url', 'avatar', 'banner',
                   'is_verified', 'avatar_url', 'banner_url', 'statistic', 'is_fans']
+        list_serializer_class = UserListSerializer
 
     def get_absolute_uri(self, f_obj):
         request = self.context.get('request')
@@ -69,40 +82,64 @@ class UserSerializer(serializers.ModelSerializer):
         return self.get_absolute_uri(obj.banner)
 
     def get_statistic(self, obj):
-        try:
-            if obj.is_verified:
-                queryset = Issue.objects.filter(book__author=obj)
-                # t_books = queryset.count()
-                t_books = 0
-                t_volume = 0
-                sales = 0
-                n_destroyed = 0
-                for obj_issue in queryset:
-                    t_books += obj_issue.quantity
-                    n_destroyed += obj_issue.quantity - obj_issue.n_circulations
-                    t_volume += obj_issue.price * obj_issue.n_circulations
-                    sales += obj_issue.price * obj_issue.n_circulations
-                tmp = queryset.aggregate(min_price=Min('price'), max_price=Max('price'))
-                n_owners = Asset.objects.filter(issue__in=queryset).count()
-                return {
-                    'total_volume': round(t_volume, 6),
-                    'min_price': tmp['min_price'] if tmp['min_price'] is not None else 0,
-                    'max_price': tmp['max_price'] if tmp['max_price'] is not None else 0,
-                    'total_books': t_books,
-                    'sales': round(sales, 6),
-                    'n_destroyed': n_destroyed,
-                    'n_owners': n_owners
-                }
-            return {}
-        except AttributeError:
-            return {}
+        statistics = getattr(self, '_statistics', None)
+        if statistics is None or obj.id not in statistics:
+            statistics = self.get_statistics([obj])
+        return statistics.get(obj.id, {})
 
     def get_is_fans(self, obj):
         user = self.context.get('request').user
         if isinstance(user, AnonymousUser):
             return False
+        idols = getattr(self, '_idols', None)
+        if idols is not None:
+            return obj.id in idols
         return Fans.objects.filter(user=user, author=obj).count() > 0
 
+    @staticmethod
+    def get_statistics(users) -> dict:
+        """
+        the statistics of issues of verified authors, by two grouped queries whatever the number of users and issues
+        :return: dict, user id -> statistic
+        """
+        authors = [obj.id for obj in users if getattr(obj, 'is_verified', False)]
+        if not authors:
+            return {}
+        issues = Issue.objects.filter(book__author__in=authors).order_by().values('book__author').annotate(
+            total_books=Sum('quantity'),
+            n_destroyed=Sum(F('quantity') - F('n_circulations')),
+            total_volume=Sum(F('price') * F('n_circulations'), output_field=FloatField()),
+            min_price=Min('price'),
+            max_price=Max('price')
+        )
+        owners = Asset.objects.filter(issue__book__author__in=authors).order_by().values(
+            'issue__book__author').annotate(n_owners=Count('id'))
+        issues = {item['book__author']: item for item in issues}
+        owners = {item['issue__book__author']: item['n_owners'] for item in owners}
+        statistics = {}
+        for author in authors:
+            item = issues.get(author, {})
+            total_volume = round(item.get('total_volume') or 0, 6)
+            statistics[author] = {
+                'total_volume': total_volume,
+                'min_price': item.get('min_price') or 0,
+                'max_price': item.get('max_price') or 0,
+                'total_books': item.get('total_books') or 0,
+                'sales': total_volume,
+                'n_destroyed': item.get('n_destroyed') or 0,
+                'n_owners': owners.get(author, 0)
+            }
+        return statistics
+
+    def prepare(self, users):
+        """
+        load the statistics and the fans of a page of users at once
+        """
+        self._statistics = self.get_statistics(users)
+        user = self.context.get('request').user if self.context.get('request') else None
+        if user is not None and not isinstance(user, AnonymousUser):
+            self._idols = set(Fans.objects.filter(user=user, author__in=users).values_list('author_id', flat=True))
+
     def validate(self, attrs):
         super().validate(attrs)
 
@@ -120,12 +157,12 @@ class UserListingSerializer(UserSerializer):
 
 class UserRelatedField(CustomPKRelatedField):
 
+    def use_pk_only_optimization(self):
+        # serialize the related user itself, it may be loaded by select_related
+        return False
+
     def to_representation(self, value):
-        try:
-            obj = User.objects.get(id=value.pk)
-            return UserListingSerializer(instance=obj, context=self.context).data
-        except User.DoesNotExist:
-            return {}
+        return UserListingSerializer(instance=value, context=self.context).data
 
 
 class FansSerializer(serializers.ModelSerializer):
@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+import secrets
+import time
+from django.conf import settings
+from .redis_accessor import RedisAccessor
+
+
+class BlobCache:
+    """
+    CID keyed cache of book files on the media volume, which is shared by the server and the file service.
+    The index is kept in redis, so all server processes see the same entries:
+        - {prefix}:entries, hash, cid -> json {path, size, mtime, sha256}
+        - {prefix}:lru, sorted set, cid -> last access time
+        - {prefix}:stats, hash, the number of hits, misses and evictions
+    The least recently used entries are evicted when the total size is over `max_size` bytes.
+    The cache is under the public media, the file names are random tokens, so that a decrypted book cannot be
+    fetched by its cid.
+    """
+    prefix = 'blob-cache'
+
+    def __init__(self, root: str = None, max_size: int = None):
+        self.root = root or settings.BLOB_CACHE_ROOT
+        self.max_size = settings.BLOB_CACHE_SIZE if max_size is None else max_size
+        self.conn = RedisAccessor().conn
+        self.entries_key = f'{self.prefix}:entries'
+        self.lru_key = f'{self.prefix}:lru'
+        self.stats_key = f'{self.prefix}:stats'
+        self.logger = logging.getLogger(__name__)
+
+    def _get_entry(self, cid: str) -> [dict, None]:
+        value = self.conn.hget(self.entries_key, cid)
+        return None if value is None else json.loads(value)
+
+    def _check(self, cid: str, entry: dict) -> bool:
+        """
+        the file must exist with its size and mtime, it is not hashed in the request.
+        The entries named by the cid are dropped, their files could be guessed.
+        """
+        try:
+            stat = os.stat(entry['path'])
+        except FileNotFoundError:
+            return False
+        if os.path.basename(entry['path']).startswith(f'{cid}.'):
+            return False
+        return stat.st_size == entry['size'] and stat.st_mtime_ns == entry.get('mtime')
+
+    def get(self, cid: str) -> [str, None]:
+        """
+        :param cid: str
+        :return: str, the path of cached file, None if not cached or the file is broken
+        """
+        entry = self._get_entry(cid)
+        if entry is not None and not self._check(cid, entry):
+            self.logger.warning(f'Broken cache entry of {cid}, path: {entry["path"]}')
+            self.remove(cid)
+            entry = None
+        if entry is None:
+            self.conn.hincrby(self.stats_key, 'misses', 1)
+            return None
+        self.conn.zadd(self.lru_key, {cid: time.time()})
+        self.conn.hincrby(self.stats_key, 'hits', 1)
+        return entry['path']
+
+    def put(self, cid: str, file: str, file_type: str, sha256: str = None) -> str:
+        """
+        Move a file into the cache, then evict the least recently used entries if the cache is over budget
+        :param cid: str
+        :param file: str, the file to be cached, it must be on the same volume
+        :param file_type: str, the extension of cached file
+        :param sha256: str, the hash of file computed by the file service
+        :return: str, the path of cached file
+        """
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, f'{secrets.token_urlsafe(32)}.{file_type}')
+        old_entry = self._get_entry(cid)
+        os.replace(file, path)
+        stat = os.stat(path)
+        entry = {'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha256': sha256}
+
+        pipe = self.conn.pipeline()
+        pipe.hset(self.entries_key, cid, json.dumps(entry))
+        pipe.zadd(self.lru_key, {cid: time.time()})
+        pipe.execute()
+        if old_entry is not None and old_entry['path'] != path and os.path.exists(old_entry['path']):
+            os.remove(old_entry['path'])
+        self.evict(keep=cid)
+        return path
+
+    def remove(self, cid: str):
+        entry = self._get_entry(cid)
+        pipe = self.conn.pipeline()
+        pipe.hdel(self.entries_key, cid)
+        pipe.zrem(self.lru_key, cid)
+        pipe.execute()
+        if entry is not None and os.path.exists(entry['path']):
+            os.remove(entry['path'])
+
+    def get_size(self) -> int:
+        return sum(json.loads(value)['size'] for value in self.conn.hvals(self.entries_key))
+
+    def evict(self, keep: str = None):
+        """
+        :param keep: str, the cid which must not be evicted, e.g. the one just put
+        """
+        size = self.get_size()
+        while size > self.max_size:
+            # zpopmin is atomic, so an entry is evicted by only one process
+            popped = self.conn.zpopmin(self.lru_key)
+            if not popped:
+                break
+            cid, score = popped[0]
+            cid = cid.decode() if isinstance(cid, bytes) else cid
+            if cid == keep:
+                self.conn.zadd(self.lru_key, {cid: score})
+                break
+            entry = self._get_entry(cid)
+            self.remove(cid)
+            if entry is not None:
+                size -= entry['size']
+                self.conn.hincrby(self.stats_key, 'evictions', 1)
+                self.logger.info(f'Evict cache entry of {cid}, size: {entry["size"]}')
+
+    def get_stats(self) -> dict:
+        stats = {k.decode(): int(v) for k, v in self.conn.hgetall(self.stats_key).items()}
+        return {
+            'hits': stats.get('hits', 0),
+            'misses': stats.get('misses', 0),
+            'evictions': stats.get('evictions', 0),
+            'entries': self.conn.hlen(self.entries_key),
+            'size': self.get_size(),
+            'max_size': self.max_size
+        }
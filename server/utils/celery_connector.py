@@ -1,5 +1,6 @@
 from celery import Celery
 import logging
+from utils import metrics
 
 
 class CeleryConnector:
@@ -14,6 +15,7 @@ class CeleryConnector:
         :param args: tuple, parameters of task
         :return: AsyncResult or None
         """
+        metrics.incr('celery_calls')
         try:
             return self.celery.send_task(task, *args)
         except Exception as e:
@@ -22,7 +24,10 @@ class CeleryConnector:
 
     def send_task(self, task: str, *args):
         try:
-            return self.send_async_task(task, *args).get()
+            result = self.send_async_task(task, *args)
+            # waiting for the result
+            metrics.incr('celery_calls')
+            return result.get()
         except Exception as e:
             self.logger.error(e)
             return None
@@ -38,6 +43,7 @@ class CeleryConnector:
         try:
             result = self.get_async_result(task_id)
             if result is not None:
+                metrics.incr('celery_calls')
                 result.revoke()
         except Exception as e:
             self.logger.error(f"Fail to revoke task({task_id}), error: {e}")
@@ -35,6 +35,19 @@ class CeleryTaskStatus(BaseEnum):
     SUCCESS = 'success'
 
 
+class BookStatus(BaseEnum):
+    STORED = 'stored'
+    CONVERTED = 'converted'
+    PREVIEWED = 'previewed'
+    UPLOADING = 'uploading'
+    UPLOADED = 'uploaded'
+
+
+class StorageMode(BaseEnum):
+    FILE = 'file'
+    PAGED = 'paged'
+
+
 class IssueStatus(BaseEnum):
     PRE_SALE = 'pre_sale'
     ON_SALE = 'on_sale'
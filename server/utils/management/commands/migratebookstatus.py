@@ -0,0 +1,32 @@
+import logging
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from books.models import Book
+from utils.enums import BookStatus, CeleryTaskStatus
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Map the legacy celery states of Book.status to the stages of books.ingest.BookIngest.'
+
+    def handle(self, *args, **options):
+        if Book._meta.db_table not in connection.introspection.table_names():
+            return
+        legacy = Book.objects.filter(status__in=[item.value for item in CeleryTaskStatus])
+        with transaction.atomic():
+            counts = {
+                BookStatus.UPLOADED.value: legacy.filter(status=CeleryTaskStatus.SUCCESS.value).update(
+                    status=BookStatus.UPLOADED.value),
+                # the upload task was never sent, the pipeline starts again
+                BookStatus.STORED.value: legacy.filter(task_id='').update(
+                    status=BookStatus.STORED.value, ingest_attempts=0),
+                # the upload is sent again
+                BookStatus.PREVIEWED.value: legacy.filter(status=CeleryTaskStatus.FAILURE.value).update(
+                    status=BookStatus.PREVIEWED.value, ingest_attempts=0),
+                # the upload task is checked by BookIngest.reconcile
+                BookStatus.UPLOADING.value: legacy.update(status=BookStatus.UPLOADING.value)
+            }
+        for status, count in counts.items():
+            if count:
+                logger.info(f'{count} books with legacy status are moved to {status}')
@@ -0,0 +1,28 @@
+import logging
+from django.core.management.base import BaseCommand
+from books.models import Book
+from books.search import BookSearch
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Create the full-text index of books and index all of them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        search = BookSearch()
+        search.setup()
+        batch = []
+        n_books = 0
+        for book in Book.objects.select_related('author').order_by('id').iterator(chunk_size=options['batch_size']):
+            batch.append(book)
+            if len(batch) >= options['batch_size']:
+                search.index_many(batch)
+                n_books += len(batch)
+                batch = []
+        search.index_many(batch)
+        n_books += len(batch)
+        logger.info(f'{n_books} books are indexed')
@@ -0,0 +1,39 @@
+import logging
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from books.models import Asset, Bookmark, Wishlist
+from users.models import Fans
+
+logger = logging.getLogger(__name__)
+
+# the unique constraints of the models, the latest row of duplicates is kept
+UNIQUE_FIELDS = [
+    (Asset, ['user', 'issue']),
+    (Bookmark, ['user', 'issue']),
+    (Wishlist, ['user', 'issue']),
+    (Fans, ['user', 'author']),
+]
+
+
+class Command(BaseCommand):
+    help = 'Remove the duplicated rows before migrating the unique constraints, the quantities of assets are merged.'
+
+    def handle(self, *args, **options):
+        tables = connection.introspection.table_names()
+        for model, fields in UNIQUE_FIELDS:
+            if model._meta.db_table not in tables:
+                continue
+            groups = model.objects.order_by().values(*fields).annotate(n=Count('id')).filter(n__gt=1)
+            n_removed = 0
+            for group in groups:
+                group.pop('n')
+                with transaction.atomic():
+                    rows = model.objects.filter(**group).order_by('-updated_at', '-id')
+                    ids = list(rows.values_list('id', flat=True))
+                    if model is Asset:
+                        quantity = rows.aggregate(q=Sum('quantity'))['q']
+                        model.objects.filter(id=ids[0]).update(quantity=quantity)
+                    n_removed += model.objects.filter(id__in=ids[1:]).delete()[0]
+            if n_removed:
+                logger.info(f'{n_removed} duplicates of {model.__name__} are removed')
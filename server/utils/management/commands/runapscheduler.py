@@ -6,7 +6,7 @@ from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.triggers.cron import CronTrigger
 from django.core.management.base import BaseCommand
 from django_apscheduler.jobstores import DjangoJobStore
-from django_apscheduler.models import DjangoJobExecution
+from django_apscheduler.models import DjangoJob, DjangoJobExecution
 from django_apscheduler import util
 
 import utils.scheduled_jobs as jobs
@@ -39,7 +39,7 @@ class Command(BaseCommand):
 
         scheduler.add_job(
             jobs.watch_celery_task,
-            trigger=CronTrigger(minute="*/2"),  # Every 2 minutes
+            trigger=CronTrigger(minute="*/2"),  # Every 2 minutes, only a fallback of the task events
             id="issue_task_watcher",  # The `id` assigned to each job MUST be unique
             max_instances=1,
             replace_existing=True,
@@ -47,13 +47,25 @@ class Command(BaseCommand):
         logger.info("Added job 'watch_celery_task'.")
 
         scheduler.add_job(
-            jobs.issue_timer,
-            trigger=CronTrigger(second='*/1'),  # Every 1 second
-            id='issue_timer',
-            max_instances=3,
+            jobs.ingest_books,
+            trigger=CronTrigger(second='*/2'),  # Every 2 seconds
+            id='book_ingest',
+            max_instances=1,
             replace_existing=True,
         )
-        logger.info('Added job "issue_timer"')
+        logger.info('Added job "ingest_books"')
+
+        scheduler.add_job(
+            jobs.watch_read_job,
+            trigger=CronTrigger(second='*/5'),  # Every 5 seconds
+            id='read_job_watcher',
+            max_instances=1,
+            replace_existing=True,
+        )
+        logger.info('Added job "watch_read_job"')
+
+        # issue_timer is run by runissuescheduler when issues are due, remove the stored cron job
+        DjangoJob.objects.filter(id='issue_timer').delete()
 
         # scheduler.add_job(
         #     jobs.pay_back,
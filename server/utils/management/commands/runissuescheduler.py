@@ -0,0 +1,24 @@
+import logging
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from utils.redis_handler import IssueScheduler
+import utils.scheduled_jobs as jobs
+
+logger = logging.getLogger(__name__)
+
+
+def issue_timer(issues: list):
+    try:
+        jobs.issue_timer(issues)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Start or end the sale of issues when they are due.'
+
+    def handle(self, *args, **options):
+        try:
+            IssueScheduler(issue_timer).run()
+        except KeyboardInterrupt:
+            logger.info('Stopping issue scheduler...')
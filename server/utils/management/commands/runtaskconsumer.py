@@ -0,0 +1,15 @@
+import logging
+from django.core.management.base import BaseCommand
+from books.task_events import TaskEventConsumer
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Consume the events of tasks pushed by the file service.'
+
+    def handle(self, *args, **options):
+        try:
+            TaskEventConsumer().run()
+        except KeyboardInterrupt:
+            logger.info('Stopping task consumer...')
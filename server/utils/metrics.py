@@ -0,0 +1,97 @@
+import contextvars
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    The cost of a request: the number and time of sql queries, redis round trips (connections taken from the pool),
+    celery round trips and the response time. It is the execute wrapper of the database connections.
+    """
+    # the max number of sql kept for the log of a request over the thresholds
+    max_sql = 100
+
+    def __init__(self):
+        self.view = ''
+        self.action = ''
+        self.queries = 0
+        self.db_time = 0.0
+        self.redis_calls = 0
+        self.celery_calls = 0
+        self.duration = 0.0
+        self.sql = []
+        self.start = time.monotonic()
+
+    @property
+    def label(self) -> str:
+        return f'{self.view}.{self.action}' if self.action else self.view
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.monotonic() - start
+            self.queries += 1
+            self.db_time += duration
+            if len(self.sql) < self.max_sql:
+                self.sql.append((duration, sql))
+            if duration * 1000 >= settings.METRICS_SLOW_QUERY_MS:
+                logger.warning(f'Slow query of {self.label} took {duration * 1000:.1f}ms: {sql} {params}')
+
+    def finish(self):
+        self.duration = time.monotonic() - self.start
+        if self.queries > settings.METRICS_MAX_QUERIES or self.duration * 1000 >= settings.METRICS_SLOW_REQUEST_MS:
+            sql = '\n'.join(f'{duration * 1000:.1f}ms {sql}' for duration, sql in self.sql)
+            logger.warning(f'{self.label} took {self.duration * 1000:.1f}ms with {self.queries} queries '
+                           f'({self.db_time * 1000:.1f}ms):\n{sql}')
+
+    def get_headers(self) -> dict:
+        return {
+            'X-DB-Queries': str(self.queries),
+            'X-DB-Time-Ms': f'{self.db_time * 1000:.1f}',
+            'X-Redis-Calls': str(self.redis_calls),
+            'X-Celery-Calls': str(self.celery_calls),
+            'X-Response-Time-Ms': f'{self.duration * 1000:.1f}'
+        }
+
+
+def get_current():
+    return _current.get()
+
+
+def incr(name: str, n: int = 1):
+    """
+    count a call of current request, e.g. incr('redis_calls'), no-op out of requests
+    """
+    metrics = _current.get()
+    if metrics is not None:
+        setattr(metrics, name, getattr(metrics, name) + n)
+
+
+def set_view(view: str, action: str = ''):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.view = view
+        metrics.action = action
+
+
+@contextmanager
+def track():
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(metrics))
+            yield metrics
+    finally:
+        _current.reset(token)
+        metrics.finish()
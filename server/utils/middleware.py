@@ -0,0 +1,42 @@
+import logging
+from django.conf import settings
+from utils import metrics
+from utils.redis_handler import RequestMetricsStore
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsMiddleware:
+    """
+    Track the queries, redis and celery calls and response time of every request, see utils.metrics.
+    The totals are recorded per view and action, e.g. books.IssueViewSet.list, and exposed by utils.views.metrics.
+    The metrics of a request are added to the response headers if METRICS_HEADERS, e.g. in debug mode.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with metrics.track() as request_metrics:
+            response = self.get_response(request)
+        if not request_metrics.view:
+            request_metrics.view = 'unmatched'
+        if settings.METRICS_HEADERS:
+            for header, value in request_metrics.get_headers().items():
+                response[header] = value
+        try:
+            RequestMetricsStore().record(request_metrics, response.status_code)
+        except Exception as e:
+            logger.error(f'Exception when recording the metrics of {request_metrics.label}: {e}')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # DRF views: cls and the actions of viewsets, {method: action}; django views: view_class
+        cls = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+        if cls is None:
+            metrics.set_view(f'{view_func.__module__}.{view_func.__name__}')
+            return None
+        actions = getattr(view_func, 'actions', None) or {}
+        method = request.method.lower()
+        metrics.set_view(f'{cls.__module__.split(".")[0]}.{cls.__name__}', actions.get(method, method))
+        return None
@@ -1,11 +1,146 @@
+import base64
+import json
 import math
 
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def estimate_count(queryset) -> int:
+    """
+    the number of rows estimated by the query plan on mysql, there is no COUNT(*) scan. Only a single table is
+    estimated, the querysets with joins or subqueries are counted, so do other databases.
+    """
+    connection = connections[queryset.db]
+    queryset = queryset.order_by().select_related(None)
+    if connection.vendor != 'mysql' or len(queryset.query.alias_map) > 1:
+        return queryset.count()
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN {sql}', params)
+        columns = [col[0] for col in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    if len(rows) != 1:
+        # a subquery in the conditions
+        return queryset.count()
+    return int((rows[0].get('rows') or 0) * (rows[0].get('filtered') or 100) / 100)
+
+
+class KeysetPagination:
+    """
+    Cursor pagination on a key of (ordering field, id), e.g. (updated_at, id). A page is read by
+    WHERE key < cursor ORDER BY key LIMIT n through the index of key, so a deep page costs the same as the first one,
+    there is no COUNT(*) and no OFFSET. The count is estimated if count=true is requested.
+    The cursor is the key of the last (next) or the first (previous) row of current page.
+    """
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def __init__(self, ordering, page_size):
+        """
+        :param ordering: tuple, (field, 'id') or ('-field', '-id')
+        """
+        self.ordering = ordering
+        self.field = ordering[0].lstrip('-')
+        self.descending = ordering[0].startswith('-')
+        self.page_size = page_size
+
+    def get_page_size(self, request) -> int:
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+            if size > 0:
+                return min(size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    @staticmethod
+    def encode_cursor(position: dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> dict:
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            value = parse_datetime(position['v']) or position['v']
+            return {'v': value, 'id': position['id'], 'r': bool(position.get('r'))}
+        except (ValueError, KeyError, TypeError):
+            raise NotFound('Invalid cursor')
+
+    def get_position(self, obj, reverse: bool) -> str:
+        value = getattr(obj, self.field)
+        value = value.isoformat() if hasattr(value, 'isoformat') else value
+        return self.encode_cursor({'v': value, 'id': str(obj.pk), 'r': reverse})
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        position = self.decode_cursor(cursor) if cursor else None
+        reverse = bool(position and position['r'])
+
+        # rows after the cursor in the direction of reading
+        forward = self.descending != reverse
+        op = 'lt' if forward else 'gt'
+        if position:
+            queryset = queryset.filter(Q(**{f'{self.field}__{op}': position['v']}) |
+                                       Q(**{self.field: position['v'], f'pk__{op}': position['id']}))
+        direction = '-' if forward else ''
+        rows = list(queryset.order_by(f'{direction}{self.field}', f'{direction}pk')[:size + 1])
+        has_more = len(rows) > size
+        rows = rows[:size]
+        if reverse:
+            rows.reverse()
+
+        self.count = estimate_count(queryset) \
+            if request.query_params.get(self.count_query_param) in ('1', 'true') and not position else None
+        self.page_size = size
+        self.next = self.get_position(rows[-1], False) if rows and (has_more if not reverse else True) else None
+        self.previous = self.get_position(rows[0], True) if rows and position and (has_more or not reverse) else None
+        return rows
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(remove_query_param(url, self.count_query_param), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        body = {
+            'page_size': self.page_size,
+            'next': self.get_link(self.next),
+            'previous': self.get_link(self.previous),
+            'results': data
+        }
+        if self.count is not None:
+            body['count'] = self.count
+        return Response(body)
 
 
 class CustomPagination(PageNumberPagination):
+    """
+    Page number pagination. A view with cursor_ordering, e.g. ('-updated_at', '-id'), opts in keyset pagination
+    for the requests with the cursor param, see KeysetPagination.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = getattr(view, 'cursor_ordering', None)
+        if ordering and KeysetPagination.cursor_query_param in request.query_params:
+            self.keyset = KeysetPagination(ordering, self.page_size)
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.keyset = None
+        return super().paginate_queryset(queryset, request, view)
+
     def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
         return Response({
             'count': self.page.paginator.count,
             'page_size': self.page_size,
@@ -1,11 +1,89 @@
+import logging
 import os
+import random
 import redis
+import threading
 import time
+import uuid
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# the max number of connections per process, a caller waits up to REDIS_POOL_TIMEOUT seconds for a free one
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 50))
+REDIS_POOL_TIMEOUT = float(os.getenv('REDIS_POOL_TIMEOUT', 5))
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_stats = {'created': 0}
+
+
+class MeteredConnectionPool(redis.BlockingConnectionPool):
+    """
+    count the callers which can not get a connection in time, the pool is too small.
+    A command or pipeline takes a connection once, it is counted as a redis call of current request.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.timeouts = 0
+
+    def get_connection(self, *args, **kwargs):
+        metrics.incr('redis_calls')
+        try:
+            return super().get_connection(*args, **kwargs)
+        except redis.ConnectionError as e:
+            if 'No connection available' in str(e):
+                self.timeouts += 1
+            raise
+
+
+def _get_pool_kwargs() -> dict:
+    return {'host': os.getenv('REDIS_HOST'), 'port': os.getenv('REDIS_PORT'), 'db': os.getenv('REDIS_DB'),
+            'max_connections': REDIS_MAX_CONNECTIONS, 'timeout': REDIS_POOL_TIMEOUT}
+
+
+def get_connection_pool() -> MeteredConnectionPool:
+    """
+    the connection pool shared by the redis clients of a process. The pool is created again in a forked child,
+    e.g. a worker of gunicorn, the connections of parent are not used. Under gevent the waiting for a free
+    connection is cooperative as the queue is patched.
+    """
+    global _pool
+    if _pool is None or _pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                _pool = MeteredConnectionPool(**_get_pool_kwargs())
+                _pool_stats['created'] += 1
+    return _pool
+
+
+def get_redis() -> redis.Redis:
+    return redis.Redis(connection_pool=get_connection_pool())
+
+
+def get_pool_stats() -> dict:
+    """
+    the usage of the connection pool of this process
+    """
+    pool = get_connection_pool()
+    # the queue holds the idle connections and None for the connections not created yet
+    idle = sum(1 for conn in list(pool.pool.queue) if conn is not None)
+    created = len(pool._connections)
+    return {
+        'max_connections': pool.max_connections,
+        'connections': created,
+        'in_use': created - idle,
+        'idle': idle,
+        'timeouts': pool.timeouts,
+        'pools_created': _pool_stats['created'],
+        'pid': pool.pid
+    }
 
 
 class RedisAccessor:
     def __init__(self):
-        self.conn = redis.Redis(host=os.getenv('REDIS_HOST'), port=os.getenv('REDIS_PORT'), db=os.getenv('REDIS_DB'))
+        self.conn = get_redis()
 
     def get_value(self, key):
         value = self.conn.get(key)
@@ -19,48 +97,102 @@ class RedisAccessor:
             self.conn.expire(key, expire_time)
 
 
+class LockTimeout(Exception):
+    pass
+
+
 class RedisLock:
     """
-    todo need to optimize
+    A distributed lock, the key is set with a random token of the owner and expires after the lease, only the owner
+    can release or extend it. A waiter retries with a short backoff until the acquire timeout.
+    Long holders can renew the lease in the background by auto_renew.
     """
+    # delete / extend the key only if it is still owned by the token
+    RELEASE_SCRIPT = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+    EXTEND_SCRIPT = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    end
+    return 0
+    """
+    # seconds, the backoff of waiters
+    min_backoff = 0.001
+    max_backoff = 0.05
 
-    def __init__(self, key):
-        self.redis_accessor = RedisAccessor()
-        self._lock = 0
+    def __init__(self, key, lease: float = 10, timeout: float = 10, auto_renew: bool = False):
+        """
+        :param key: str, the lock key
+        :param lease: float, seconds, the key expires if the owner does not release or extend it in time
+        :param timeout: float, seconds to wait for the lock
+        :param auto_renew: bool, extend the lease every lease / 3 seconds until the lock is released
+        """
+        self.conn = RedisAccessor().conn
         self.lock_key = key
+        self.lease = lease
+        self.timeout = timeout
+        self.auto_renew = auto_renew
+        self.token = None
+        self._stop_renew = threading.Event()
+        self._renewer = None
+
+    def acquire(self, blocking: bool = True, timeout: float = None) -> bool:
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        backoff = self.min_backoff
+        while not self.conn.set(self.lock_key, token, nx=True, px=int(self.lease * 1000)):
+            remaining = deadline - time.monotonic()
+            if not blocking or remaining <= 0:
+                return False
+            time.sleep(min(backoff * random.uniform(0.5, 1.5), remaining))
+            backoff = min(backoff * 2, self.max_backoff)
+        self.token = token
+        if self.auto_renew:
+            self._stop_renew.clear()
+            self._renewer = threading.Thread(target=self._renew, daemon=True)
+            self._renewer.start()
+        return True
+
+    def extend(self, lease: float = None) -> bool:
+        """
+        reset the lease of an owned lock
+        """
+        if self.token is None:
+            return False
+        lease = self.lease if lease is None else lease
+        return self.conn.eval(self.EXTEND_SCRIPT, 1, self.lock_key, self.token, int(lease * 1000)) == 1
 
-    def __enter__(self, timeout=10):
-        while self._lock != 1:
-            timestamp = time.time() + timeout
-            # 设置锁超时时间 setnx -> set if the key does not exist
-            # returns:
-            #   1 if the key was set
-            #   0 if the key was not set
-            self._lock = self.redis_accessor.conn.setnx(self.lock_key, timestamp)
-            # 1, get the lock successfully
-            if self._lock == 1:
-                break
-            else:
-                # 2, 合法时间内锁不被释放，且额外增加时限后仍不会被释放，则表明线程异常无法正常释放锁
-                # get the old value stored at key and set a new time
-                locker_time = self.redis_accessor.conn.set(self.lock_key, timestamp, get=True)
-                try:
-                    locker_time = float(locker_time)
-                except ValueError as e:
-                    print(f'Exception when calling RedisLock.__enter__ -> {e}')
-                    break
-                if time.time() > locker_time:
-                    break
-                else:
-                    time.sleep(timeout + 1)
+    def _renew(self):
+        while not self._stop_renew.wait(self.lease / 3):
+            try:
+                if not self.extend():
+                    logger.error(f'Lock {self.lock_key} is lost')
+                    return
+            except redis.RedisError as e:
+                logger.error(f'Exception when extending lock {self.lock_key} -> {e}')
+
+    def release(self) -> bool:
+        """
+        :return: bool, False if the lock is not owned anymore, e.g. it expired and is acquired by others
+        """
+        if self.token is None:
+            return False
+        self._stop_renew.set()
+        if self._renewer is not None:
+            self._renewer.join()
+            self._renewer = None
+        token, self.token = self.token, None
+        return self.conn.eval(self.RELEASE_SCRIPT, 1, self.lock_key, token) == 1
+
+    def __enter__(self):
+        if not self.acquire():
+            raise LockTimeout(f'Fail to acquire lock {self.lock_key} in {self.timeout} seconds')
+        return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        # 合法时限内正常释放锁
-        _value = self.redis_accessor.conn.get(self.lock_key)
-        try:
-            _value = float(_value)
-            if time.time() > _value:
-                self.redis_accessor.conn.delete(self.lock_key)
-        except ValueError as e:
-            print(f'Exception when calling RedisLock.__enter__ -> {e}')
-            self.redis_accessor.conn.delete(self.lock_key)
+        if not self.release():
+            logger.warning(f'Lock {self.lock_key} expired before it is released')
@@ -1,20 +1,48 @@
 import redis
-import os
-from django.utils import timezone
-import numpy as np
+import time
+import logging
+from utils.redis_accessor import get_redis
+
+logger = logging.getLogger(__name__)
 
 
 class RedisHandler:
 
     def __init__(self):
-        self.redis = redis.Redis(host=os.getenv('REDIS_HOST'), port=os.getenv('REDIS_PORT'), db=os.getenv('REDIS_DB'))
+        self.redis = get_redis()
 
 
 class IssueQueue(RedisHandler):
+    """
+    A delayed queue of issues, the score of an issue is the timestamp when its sale starts or ends.
+    Due issues are claimed atomically, a claimed issue is kept in the processing set until it is acked. If the
+    claimer dies, the issue is due again after the lease.
+    """
+    name = 'issuing_list'
+    # seconds, the lease of a claimed issue
+    lease = 60
+    # move the expired claims back, then pop the due issues into the processing set
+    # KEYS: queue, processing; ARGV: now, count, lease
+    CLAIM_SCRIPT = """
+    local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+    for _, key in ipairs(expired) do
+        redis.call('ZREM', KEYS[2], key)
+        redis.call('ZADD', KEYS[1], 'NX', ARGV[1], key)
+    end
+    local keys = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+    for _, key in ipairs(keys) do
+        redis.call('ZREM', KEYS[1], key)
+        redis.call('ZADD', KEYS[2], ARGV[1] + ARGV[3], key)
+    end
+    return keys
+    """
 
     def __init__(self):
         super().__init__()
-        self.name = 'issuing_list'
+        self.processing = f'{self.name}:processing'
+        # new issues are published to wake the scheduler up
+        self.channel = f'{self.name}:wakeup'
+        self._claim = self.redis.register_script(self.CLAIM_SCRIPT)
 
     def check_in(self, key, score):
         """
@@ -26,33 +54,116 @@ class IssueQueue(RedisHandler):
 
             score: a score for the key
         """
-        print(f'Put {key}-{score} into {self.name}')
+        logger.info(f'Put {key}-{score} into {self.name}')
         try:
             self.redis.zadd(self.name, {key: score})
+            self.redis.publish(self.channel, score)
         except Exception as e:
-            print(f'Exception when adding a new item: {e}')
+            logger.error(f'Exception when adding a new item: {e}')
             raise
 
-    def check_out(self):
+    def check_out(self, key):
         """
-        pop a key
+        remove a key from the queue and the processing set, e.g. the sale is ended in advance or the issue is removed
         """
-        print(f'Remove min value from queue {self.name}')
+        logger.info(f'Remove {key} from queue {self.name}')
         try:
-            # self.redis.zmpop(1, [key])
-            self.redis.zpopmin(self.name, 1)
+            self.redis.zrem(self.name, key)
+            self.redis.zrem(self.processing, key)
         except Exception as e:
-            print(f'Exception when removing an item: {e}')
-            pass
+            logger.error(f'Exception when removing an item: {e}')
 
-    def get_top(self):
+    def claim(self, count: int = 10) -> list:
         """
-        return the items whose score is less than or equal to the current timestamp
+        pop the due items, the items are leased to the caller until they are acked
         """
-        current_time = timezone.now().timestamp()
-        try:
-            top_list = self.redis.zrangebyscore(self.name, -np.inf, current_time)
-            return list(map(lambda x: x.decode(), top_list))
-        except Exception as e:
-            print(f'Exception when getting top items: {e}')
-            return []
+        keys = self._claim(keys=[self.name, self.processing], args=[time.time(), count, self.lease])
+        return [key.decode() for key in keys]
+
+    def ack(self, key):
+        self.redis.zrem(self.processing, key)
+
+    def get_next_time(self):
+        """
+        return the timestamp of the next due item or None
+        """
+        items = self.redis.zrange(self.name, 0, 0, withscores=True)
+        leases = self.redis.zrange(self.processing, 0, 0, withscores=True)
+        scores = [score for _, score in items + leases]
+        return min(scores) if scores else None
+
+
+class IssueScheduler:
+    """
+    Run the handler when issues are due. The scheduler sleeps until the next due time, and is woken up when a new
+    issue is checked in. Several schedulers can run at once, an issue is claimed by only one of them.
+    """
+    # seconds, the max sleep in case a wakeup is missed
+    max_sleep = 60
+
+    def __init__(self, handler, queue: IssueQueue = None):
+        """
+        :param handler: callable, handler(keys), it acks the keys which are handled
+        """
+        self.handler = handler
+        self.queue = queue or IssueQueue()
+        self.pubsub = self.queue.redis.pubsub(ignore_subscribe_messages=True)
+
+    def get_timeout(self) -> float:
+        next_time = self.queue.get_next_time()
+        if next_time is None:
+            return self.max_sleep
+        return min(max(next_time - time.time(), 0), self.max_sleep)
+
+    def run_once(self) -> list:
+        keys = self.queue.claim()
+        if keys:
+            self.handler(keys)
+        return keys
+
+    def run(self):
+        self.pubsub.subscribe(self.queue.channel)
+        logger.info(f'Scheduling {self.queue.name}...')
+        while True:
+            try:
+                # handle all due issues before sleeping
+                while self.run_once():
+                    pass
+                self.pubsub.get_message(timeout=self.get_timeout())
+            except redis.ConnectionError as e:
+                logger.error(f'Redis connection error when scheduling issues: {e}')
+                time.sleep(1)
+            except Exception as e:
+                logger.error(f'Exception when scheduling issues: {e}')
+                time.sleep(1)
+
+
+class RequestMetricsStore(RedisHandler):
+    """
+    The totals of request metrics of all processes, a hash of counters keyed by view, action, status and metric,
+    e.g. 'books.IssueViewSet|list|200|queries'. A request is recorded by one pipeline.
+    """
+    name = 'metrics:requests'
+    # metric -> the attribute of utils.metrics.RequestMetrics
+    COUNTERS = {'queries': 'queries', 'redis_calls': 'redis_calls', 'celery_calls': 'celery_calls'}
+    TIMERS = {'db_seconds': 'db_time', 'duration_seconds': 'duration'}
+
+    def record(self, metrics, status: int):
+        prefix = f'{metrics.view}|{metrics.action}|{status}'
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hincrby(self.name, f'{prefix}|requests', 1)
+        for metric, attr in self.COUNTERS.items():
+            pipe.hincrby(self.name, f'{prefix}|{metric}', getattr(metrics, attr))
+        for metric, attr in self.TIMERS.items():
+            pipe.hincrbyfloat(self.name, f'{prefix}|{metric}', getattr(metrics, attr))
+        pipe.execute()
+
+    def get_totals(self) -> dict:
+        """
+        :return: {metric: {(view, action, status): value}}
+        """
+        totals = {}
+        for field, value in self.redis.hgetall(self.name).items():
+            view, action, status, metric = field.decode().rsplit('|', 3)
+            totals.setdefault(metric, {})[(view, action, status)] = float(value)
+        return totals
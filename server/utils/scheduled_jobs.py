@@ -1,99 +1,111 @@
-from books.models import Book, EncryptionKey, Issue, Token
+from books.models import Issue, Token
 from django.db.transaction import atomic
-from utils.enums import CeleryTaskStatus, IssueStatus
-from books.file_service_connector import FileServiceConnector
+from django.utils import timezone
+from utils.enums import IssueStatus
 from utils.redis_handler import IssueQueue
 from utils.smart_contract_handler import ContractFactory
 from books.issue_handler import IssueHandler
+from books.read_job import ReadJob
+from books.ingest import BookIngest
 import logging
 
 logger = logging.getLogger(__name__)
 
 
 def watch_celery_task():
-    # todo how to update book info
-    #   how to upload a book with one cid
+    """
+    reconcile the uploading books whose task events are missed, the events are consumed by books.task_events
+    """
     logger.info('Dealing with celery tasks...')
     try:
-        file_task_connector = FileServiceConnector()
-        books = Book.objects.exclude(task_id='').exclude(status=CeleryTaskStatus.SUCCESS.value)
-        for book in books:
-            res = file_task_connector.get_async_result(book.task_id)
-            current_status = res.status.lower()
-            if current_status == CeleryTaskStatus.SUCCESS.value:
-                data = res.get()
-                with atomic():
-                    # update book
-                    book.status = current_status
-                    book.cid = data['cid']
-                    # book.n_pages = data['n_pages']
-                    book.save()
-                    # add key
-                    EncryptionKey.objects.update_or_create(
-                        defaults={'key': data['key']},
-                        book=book,
-                        user=book.author
-                    )
-                    # remove original file
-                    if book.file:
-                        book.file.delete()
-            else:
-                if book.status != current_status:
-                    book.status = current_status
-                    book.save()
-
+        BookIngest.reconcile()
     except Exception as e:
         logger.error(f'Exception when calling watch_celery_task: {e}')
 
 
-def issue_timer():
-    logger.info('Check issue queue...')
-    que = IssueQueue()
-    issues = que.get_top()
+def ingest_books():
+    try:
+        BookIngest.watch()
+    except Exception as e:
+        logger.error(f'Exception when calling ingest_books: {e}')
+
+
+def watch_read_job():
+    try:
+        ReadJob.watch()
+    except Exception as e:
+        logger.error(f'Exception when calling watch_read_job: {e}')
+
+
+def update_issue(issue: Issue):
+    """
+    start or end the sale of an issue
+    """
+    if issue.status == IssueStatus.PRE_SALE.value:
+        # check if has block chain information
+        # When a new issue is added, the token has not been created after issue saving.
+        try:
+            Token.objects.get(issue=issue)
+            # update status
+            issue.status = IssueStatus.ON_SALE.value
+        except Token.DoesNotExist:
+            logger.error(f'token not found for issue {issue.id}')
+            issue.status = IssueStatus.UNSOLD.value
+        issue.save()
+        # prepare for sale
+        # IssueHandler(issue).handle()
+        # # set timer for ending the sale
+        # end_time = issue.published_at + timedelta(minutes=issue.duration)
+        # utc_time = end_time.astimezone(pytz.UTC)
+        # que.check_in(str(issue.id), utc_time.timestamp())
+    elif issue.status == IssueStatus.ON_SALE.value:
+        # update status
+        if issue.n_circulations > 0:
+            issue.status = IssueStatus.OFF_SALE.value
+            # destroy unsold books by calling smart contract
+            contract = ContractFactory(issue.token.block_chain)
+            txn_hash, is_destroyed = contract.burn(issue.book.author.address, issue.token.id,
+                                                   issue.quantity - issue.n_circulations)
+            # todo if not destroyed
+            logger.info(f'Destroy NFT {issue.id} -> log: {txn_hash}')
+            issue.destroy_log = txn_hash
+        else:
+            issue.status = IssueStatus.UNSOLD.value
+        issue.save()
+        # make it clean after sale
+        # IssueHandler(issue).handle()
+        # quit queue
+        # que.check_out()
+    IssueHandler(issue).handle()
+
+
+def issue_timer(issues: list):
+    """
+    update the issues which are due, the issues are claimed by utils.redis_handler.IssueScheduler
+    :param issues: list, issue ids
+    """
     logger.info(f'Current issues...{issues}')
-    if issues:
-        queryset = Issue.objects.filter(id__in=issues)
-        for issue in queryset:
+    que = IssueQueue()
+    for issue_id in issues:
+        try:
             with atomic():
-                if issue.status == IssueStatus.PRE_SALE.value:
-                    # check if has block chain information
-                    # When a new issue is added, the token has not been created after issue saving.
-                    try:
-                        Token.objects.get(issue=issue)
-                        # update status
-                        issue.status = IssueStatus.ON_SALE.value
-                    except Token.DoesNotExist:
-                        logger.error(f'token not found for issue {issue.id}')
-                        issue.status = IssueStatus.UNSOLD.value
-                    issue.save()
-                    # prepare for sale
-                    # IssueHandler(issue).handle()
-                    # # set timer for ending the sale
-                    # end_time = issue.published_at + timedelta(minutes=issue.duration)
-                    # utc_time = end_time.astimezone(pytz.UTC)
-                    # que.check_in(str(issue.id), utc_time.timestamp())
-                elif issue.status == IssueStatus.ON_SALE.value:
-                    # update status
-                    if issue.n_circulations > 0:
-                        issue.status = IssueStatus.OFF_SALE.value
-                        # destroy unsold books by calling smart contract
-                        contract = ContractFactory(issue.token.block_chain)
-                        txn_hash, is_destroyed = contract.burn(issue.book.author.address, issue.token.id,
-                                                               issue.quantity - issue.n_circulations)
-                        # todo if not destroyed
-                        logger.info(f'Destroy NFT {issue.id} -> log: {txn_hash}')
-                        issue.destroy_log = txn_hash
+                issue = Issue.objects.select_for_update().filter(id=issue_id).first()
+                if issue is None:
+                    # not committed yet, a removed issue is checked out by books.receivers
+                    logger.warning(f'Issue {issue_id} is not found, it is claimed again after the lease')
+                    continue
+                due_time = IssueHandler(issue).get_due_time()
+                if due_time is not None:
+                    if due_time > timezone.now():
+                        # the time is changed after it is checked in
+                        IssueHandler(issue).check_in()
                     else:
-                        issue.status = IssueStatus.UNSOLD.value
-                    issue.save()
-                    # make it clean after sale
-                    # IssueHandler(issue).handle()
-                    # quit queue
-                    # que.check_out()
-                # else:
-                #     IssueHandler(issue).handle()
-                    # que.check_out()
-                IssueHandler(issue).handle()
+                        update_issue(issue)
+        except Exception as e:
+            # not acked, the issue is claimed again after the lease
+            logger.error(f'Exception when updating issue {issue_id}: {e}')
+            continue
+        que.ack(issue_id)
 
 
 # def pay_back():
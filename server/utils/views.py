@@ -1,5 +1,9 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
 from rest_framework import viewsets
 from rest_framework.response import Response
+from utils.redis_accessor import get_pool_stats
+from utils.redis_handler import RequestMetricsStore
 
 
 class BaseViewSet(viewsets.ModelViewSet):
@@ -26,3 +30,40 @@ class BaseViewSet(viewsets.ModelViewSet):
 
         serializer = self.get_serializer(queryset, many=True, serializer_class=serializer_class)
         return Response(serializer.data)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format(value: float) -> str:
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def metrics(request):
+    """
+    The request metrics in the prometheus text format, the totals of all processes by view, action and status,
+    and the redis pool of the process serving the scrape.
+    """
+    # public in debug only, otherwise the token is required
+    if settings.METRICS_TOKEN:
+        if request.headers.get('Authorization') != f'Bearer {settings.METRICS_TOKEN}':
+            return HttpResponseForbidden()
+    elif not settings.DEBUG:
+        return HttpResponseForbidden()
+
+    lines = []
+    totals = RequestMetricsStore().get_totals()
+    for metric in ['requests'] + list(RequestMetricsStore.COUNTERS) + list(RequestMetricsStore.TIMERS):
+        name = f'dbook_http_{metric}_total'
+        lines.append(f'# TYPE {name} counter')
+        for (view, action, status), value in sorted(totals.get(metric, {}).items()):
+            lines.append(f'{name}{{view="{_escape(view)}",action="{_escape(action)}",status="{status}"}} {_format(value)}')
+
+    stats = get_pool_stats()
+    pid = stats.pop('pid')
+    for key, value in stats.items():
+        name = f'dbook_redis_pool_{key}'
+        lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name}{{pid="{pid}"}} {value}')
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')